@@ -0,0 +1,352 @@
+# analytics.py — производные метрики силовых: оценка 1ПМ, лучшие подходы, объём по периодам, рекорды
+#
+# История пользователя (только подходы с весом и повторами) грузится одним запросом сразу в колонки
+# (array), дальше каждая метрика — один проход по массивам без ORM-объектов: годы ежедневных
+# тренировок (десятки тысяч подходов) считаются за миллисекунды.
+# Для окна (since) тем же запросом приходит лучший e1RM по каждому упражнению ДО окна —
+# чтобы отличать новые рекорды, не таская всю историю.
+#
+# Горячий путь бота историю не грузит: отчёты берут лучший e1RM за день из DailyStats (rollups.py)
+# и за всё время из PersonalRecord (records.py), карточка упражнения — e1rm() по подходу.
+# Полный разбор истории пользователя:
+#   python analytics.py TG_ID [--exercise SLUG] [--since 2026-01-01] [--formula brzycki]
+from __future__ import annotations
+
+import argparse
+import asyncio
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import Float, case, cast, literal, null, union_all
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import Workout, WorkoutItem
+
+# выше — формулы сильно завышают/занижают; такие подходы идут в объём, но не в оценку 1ПМ
+E1RM_MAX_REPS = 12
+
+
+# ===================== формулы =====================
+def epley(weight: float, reps: int) -> float:
+    return float(weight) if reps <= 1 else weight * (1 + reps / 30.0)
+
+
+def brzycki(weight: float, reps: int) -> float:
+    return float(weight) if reps <= 1 else weight * 36.0 / (37 - min(reps, 36))
+
+
+FORMULAS = {"epley": epley, "brzycki": brzycki}
+
+
+def e1rm(weight: float, reps: int, formula: str = "epley") -> Optional[float]:
+    """Оценка 1ПМ по подходу; None — подход не годится для оценки."""
+    if not weight or not reps or reps > E1RM_MAX_REPS:
+        return None
+    return FORMULAS[formula](weight, reps)
+
+
+def e1rm_sql(weight=WorkoutItem.weight, reps=WorkoutItem.reps):
+    """Epley в SQL (для агрегатов и пересборок в базе); NULL там же, где e1rm() возвращает None."""
+    return case(
+        (weight <= 0, null()),
+        (reps == 1, weight),
+        (reps.between(2, E1RM_MAX_REPS), weight * (1 + reps / 30.0)),
+        else_=null(),
+    )
+
+
+# ===================== история в колонках =====================
+@dataclass
+class StrengthHistory:
+    """Подходы в хронологическом порядке; i-й элемент каждой колонки — один подход."""
+    exercise_id: array = field(default_factory=lambda: array("q"))
+    workout_id: array = field(default_factory=lambda: array("q"))
+    day: array = field(default_factory=lambda: array("l"))        # date.toordinal()
+    weight: array = field(default_factory=lambda: array("d"))
+    reps: array = field(default_factory=lambda: array("l"))
+    created_at: list[datetime] = field(default_factory=list)
+    # лучший e1RM (Epley) по упражнению до начала окна; пусто, если грузили всю историю
+    prior_best: dict[int, float] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.weight)
+
+    def tonnage(self) -> array:
+        return array("d", (w * r for w, r in zip(self.weight, self.reps)))
+
+    def e1rm(self, formula: str = "epley") -> list[Optional[float]]:
+        return [e1rm(w, r, formula) for w, r in zip(self.weight, self.reps)]
+
+
+def _history_query(user_id: int, since: Optional[datetime], exercise_id: Optional[int]):
+    """
+    Колонки: prior, exercise_id, workout_id, created_at, weight, reps.
+      prior = 0 — подходы (в окне, если since задан), по времени;
+      prior = 1 — по строке на упражнение: лучший e1RM до окна (в weight).
+    """
+    conds = [
+        Workout.user_id == user_id,
+        WorkoutItem.weight.is_not(None),
+        WorkoutItem.reps.is_not(None),
+    ]
+    if exercise_id is not None:
+        conds.append(WorkoutItem.exercise_id == exercise_id)
+
+    def from_items(*columns):
+        return select(*columns).join(Workout, Workout.id == WorkoutItem.workout_id).where(*conds)
+
+    q_sets = from_items(
+        literal(0).label("prior"),
+        WorkoutItem.exercise_id,
+        WorkoutItem.workout_id,
+        WorkoutItem.created_at,
+        WorkoutItem.weight,
+        WorkoutItem.reps,
+    )
+    if since is None:
+        return q_sets.order_by(WorkoutItem.created_at, WorkoutItem.id)
+
+    q_sets = q_sets.where(WorkoutItem.created_at >= since)
+    q_prior = (
+        from_items(
+            literal(1),
+            WorkoutItem.exercise_id,
+            cast(null(), WorkoutItem.workout_id.type),
+            func.max(WorkoutItem.created_at),
+            cast(func.max(e1rm_sql()), Float),
+            cast(null(), WorkoutItem.reps.type),
+        )
+        .where(WorkoutItem.created_at < since)
+        .group_by(WorkoutItem.exercise_id)
+    )
+    u = union_all(q_sets, q_prior).subquery()
+    return select(*u.c).order_by(u.c.prior, u.c.created_at)
+
+
+async def load_strength_history(
+    session: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None,
+    exercise_id: Optional[int] = None,
+) -> StrengthHistory:
+    """Один запрос: силовые подходы пользователя (с since — только окно + prior_best)."""
+    h = StrengthHistory()
+    rows = await session.exec(_history_query(user_id, since, exercise_id))
+    for prior, ex_id, w_id, ts, weight, reps in rows:
+        if prior:
+            if weight is not None:
+                h.prior_best[ex_id] = float(weight)
+            continue
+        h.exercise_id.append(ex_id)
+        h.workout_id.append(w_id)
+        h.day.append(ts.toordinal())
+        h.weight.append(float(weight))
+        h.reps.append(int(reps))
+        h.created_at.append(ts)
+    return h
+
+
+# ===================== метрики =====================
+@dataclass
+class BestSet:
+    weight: float
+    reps: int
+    e1rm: float
+    created_at: datetime
+
+
+@dataclass
+class ExerciseProgress:
+    exercise_id: int
+    sets: int = 0
+    reps: int = 0
+    tonnage: float = 0.0
+    max_weight: float = 0.0
+    best: Optional[BestSet] = None          # лучший подход по e1RM
+    best_session_tonnage: float = 0.0       # за одну тренировку
+    last_at: Optional[datetime] = None
+
+    def is_record(self, prior_best: dict[int, float]) -> bool:
+        """Лучший e1RM в окне выше всего, что было до окна (первое знакомство — не рекорд)."""
+        before = prior_best.get(self.exercise_id)
+        return self.best is not None and before is not None and self.best.e1rm > before + 1e-9
+
+
+def exercise_progress(h: StrengthHistory, formula: str = "epley") -> dict[int, ExerciseProgress]:
+    """По упражнениям: подходы, повторы, тоннаж, максимум веса, лучший подход и лучшая тренировка."""
+    out: dict[int, ExerciseProgress] = {}
+    session_tonnage: dict[tuple[int, int], float] = {}
+    fn = FORMULAS[formula]
+    for ex_id, w_id, weight, reps, ts in zip(h.exercise_id, h.workout_id, h.weight, h.reps, h.created_at):
+        p = out.get(ex_id)
+        if p is None:
+            p = out[ex_id] = ExerciseProgress(ex_id)
+        ton = weight * reps
+        p.sets += 1
+        p.reps += reps
+        p.tonnage += ton
+        p.last_at = ts
+        if weight > p.max_weight:
+            p.max_weight = weight
+        if weight and 0 < reps <= E1RM_MAX_REPS:
+            value = fn(weight, reps)
+            if p.best is None or value > p.best.e1rm:
+                p.best = BestSet(weight, reps, value, ts)
+        key = (ex_id, w_id)
+        session_tonnage[key] = session_tonnage.get(key, 0.0) + ton
+    for (ex_id, _), ton in session_tonnage.items():
+        p = out[ex_id]
+        if ton > p.best_session_tonnage:
+            p.best_session_tonnage = ton
+    return out
+
+
+def _period_start(ordinal: int, period: str) -> date:
+    if period == "week":
+        # 0001-01-01 — понедельник, так что неделя — (ordinal - 1) // 7
+        return date.fromordinal(ordinal - (ordinal - 1) % 7)
+    d = date.fromordinal(ordinal)
+    if period == "month":
+        return d.replace(day=1)
+    if period == "year":
+        return d.replace(month=1, day=1)
+    raise ValueError(f"period: week | month | year, не {period!r}")
+
+
+def tonnage_by_period(
+    h: StrengthHistory, period: str = "week", exercise_id: Optional[int] = None
+) -> list[tuple[date, float]]:
+    """Тоннаж по неделям / месяцам / годам: [(начало периода, тоннаж)], по возрастанию."""
+    buckets: dict[date, float] = {}
+    starts: dict[int, date] = {}           # день -> начало периода; дней намного меньше, чем подходов
+    for ex_id, day, weight, reps in zip(h.exercise_id, h.day, h.weight, h.reps):
+        if exercise_id is not None and ex_id != exercise_id:
+            continue
+        start = starts.get(day)
+        if start is None:
+            start = starts[day] = _period_start(day, period)
+        buckets[start] = buckets.get(start, 0.0) + weight * reps
+    return sorted(buckets.items())
+
+
+def _daily_tonnage(h: StrengthHistory, exercise_id: Optional[int]) -> list[tuple[int, float]]:
+    days: list[tuple[int, float]] = []
+    for ex_id, day, weight, reps in zip(h.exercise_id, h.day, h.weight, h.reps):
+        if exercise_id is not None and ex_id != exercise_id:
+            continue
+        if days and days[-1][0] == day:
+            days[-1] = (day, days[-1][1] + weight * reps)
+        else:
+            days.append((day, weight * reps))
+    return days
+
+
+def rolling_volume(
+    h: StrengthHistory, window_days: int = 28, exercise_id: Optional[int] = None
+) -> list[tuple[date, float]]:
+    """Скользящий тоннаж за window_days по дням с тренировками: [(день, тоннаж за окно, включая день)]."""
+    out: list[tuple[date, float]] = []
+    window: deque[tuple[int, float]] = deque()
+    total = 0.0
+    for day, ton in _daily_tonnage(h, exercise_id):
+        window.append((day, ton))
+        total += ton
+        while window[0][0] <= day - window_days:
+            total -= window.popleft()[1]
+        out.append((date.fromordinal(day), total))
+    return out
+
+
+@dataclass
+class PrEvent:
+    index: int                  # номер подхода в истории
+    exercise_id: int
+    kind: str                   # "e1rm" | "weight"
+    value: float
+    previous: float
+
+
+def pr_events(h: StrengthHistory, formula: str = "epley", kinds: Iterable[str] = ("e1rm", "weight")) -> list[PrEvent]:
+    """
+    Подходы, побившие предыдущий максимум упражнения. Для окна точка отсчёта e1RM — prior_best;
+    без неё первый подход упражнения рекордом не считается.
+    """
+    kinds = set(kinds)
+    fn = FORMULAS[formula]
+    best_e1rm: dict[int, float] = dict(h.prior_best)
+    best_weight: dict[int, float] = {}
+    events: list[PrEvent] = []
+    for i, (ex_id, weight, reps) in enumerate(zip(h.exercise_id, h.weight, h.reps)):
+        if "weight" in kinds:
+            prev = best_weight.get(ex_id)
+            if prev is not None and weight > prev:
+                events.append(PrEvent(i, ex_id, "weight", weight, prev))
+            if prev is None or weight > prev:
+                best_weight[ex_id] = weight
+        if weight and 0 < reps <= E1RM_MAX_REPS:
+            value = fn(weight, reps)
+            prev = best_e1rm.get(ex_id)
+            if "e1rm" in kinds and prev is not None and value > prev + 1e-9:
+                events.append(PrEvent(i, ex_id, "e1rm", value, prev))
+            if prev is None or value > prev:
+                best_e1rm[ex_id] = value
+    return events
+
+
+async def main():
+    from config import settings
+    from db import Exercise, User, dispose_engines, get_session
+
+    parser = argparse.ArgumentParser(description="Разбор силовой истории пользователя")
+    parser.add_argument("tg_id", type=int)
+    parser.add_argument("--exercise", help="slug упражнения (по умолчанию — все)")
+    parser.add_argument("--since", type=date.fromisoformat, help="начало окна, YYYY-MM-DD")
+    parser.add_argument("--formula", choices=sorted(FORMULAS), default="epley")
+    parser.add_argument("--period", choices=("week", "month", "year"), default="month")
+    parser.add_argument("--window", type=int, default=28, help="окно скользящего объёма, дней")
+    args = parser.parse_args()
+
+    async with await get_session(settings.database_url) as session:
+        user_id = (await session.exec(select(User.id).where(User.tg_id == args.tg_id))).first()
+        if user_id is None:
+            raise SystemExit(f"Пользователь tg_id={args.tg_id} не найден")
+        names = dict((await session.exec(select(Exercise.id, Exercise.name))).all())
+        exercise_id = None
+        if args.exercise:
+            exercise_id = (await session.exec(select(Exercise.id).where(Exercise.slug == args.exercise))).first()
+            if exercise_id is None:
+                raise SystemExit(f"Упражнение {args.exercise!r} не найдено")
+        since = datetime.combine(args.since, datetime.min.time()) if args.since else None
+        h = await load_strength_history(session, user_id, since, exercise_id)
+    await dispose_engines()
+
+    print(f"Подходов: {len(h)}")
+    for p in sorted(exercise_progress(h, args.formula).values(), key=lambda p: -p.tonnage):
+        best = f"{p.best.e1rm:.1f} кг ({p.best.weight:g}×{p.best.reps}, {p.best.created_at:%Y-%m-%d})" if p.best else "—"
+        record = " 🆕" if p.is_record(h.prior_best) else ""
+        print(
+            f"  {names.get(p.exercise_id, p.exercise_id)}: {p.sets} подх., тоннаж {p.tonnage:,.0f} кг, "
+            f"макс. {p.max_weight:g} кг, 1ПМ {best}{record}, лучшая тренировка {p.best_session_tonnage:,.0f} кг"
+        )
+    print(f"Тоннаж по периодам ({args.period}):")
+    for start, ton in tonnage_by_period(h, args.period, exercise_id):
+        print(f"  {start}  {ton:,.0f}")
+    volume = rolling_volume(h, args.window, exercise_id)
+    if volume:
+        peak_day, peak = max(volume, key=lambda v: v[1])
+        print(f"Объём за {args.window} дн.: сейчас {volume[-1][1]:,.0f}, пик {peak:,.0f} ({peak_day})")
+    events = pr_events(h, args.formula)
+    print(f"Рекордов: {len(events)}")
+    for ev in events[-10:]:
+        print(
+            f"  {h.created_at[ev.index]:%Y-%m-%d} {names.get(ev.exercise_id, ev.exercise_id)}: "
+            f"{ev.kind} {ev.previous:.1f} → {ev.value:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
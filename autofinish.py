@@ -0,0 +1,61 @@
+# autofinish.py — фоновое закрытие брошенных тренировок (вместо проверки на каждое нажатие)
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import Workout, WorkoutItem, get_session
+from user_context import forget_workouts
+
+log = logging.getLogger(__name__)
+
+
+async def sweep_stale_workouts(session: AsyncSession, now: Optional[datetime] = None) -> list[int]:
+    """
+    Один UPDATE на все открытые тренировки без активности дольше AUTOFINISH_IDLE_MIN.
+    finished_at = момент последней активности (последний подход, иначе создание).
+    Возвращает id закрытых тренировок.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(minutes=settings.autofinish_idle_min)
+
+    last_activity = func.coalesce(
+        select(func.max(WorkoutItem.created_at))
+        .where(WorkoutItem.workout_id == Workout.id)
+        .scalar_subquery(),
+        Workout.created_at,
+    )
+    stmt = (
+        update(Workout)
+        .where(Workout.finished_at.is_(None), last_activity < cutoff)
+        .values(finished_at=last_activity)
+        .returning(Workout.id)
+        .execution_options(synchronize_session=False)
+    )
+    res = await session.exec(stmt)
+    return [row[0] for row in res.all()]
+
+
+async def run_autofinish_sweeper(db_url: str, interval: Optional[float] = None) -> None:
+    """Бесконечный цикл; запускается задачей из startup и отменяется на shutdown."""
+    interval = interval or settings.autofinish_sweep_sec
+    while True:
+        try:
+            async with await get_session(db_url) as session:
+                closed = await sweep_stale_workouts(session)
+                await session.commit()
+            if closed:
+                forget_workouts(closed)
+                log.info("autofinish: closed %d stale workouts", len(closed))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("autofinish sweep failed")
+        await asyncio.sleep(interval)
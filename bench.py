@@ -0,0 +1,287 @@
+# bench.py — нагрузочный прогон: синтетические апдейты через dp.feed_update, Bot API заглушён
+#
+#   python bench.py                          # 20 пользователей, SQLite во временной папке
+#   python bench.py --users 100 --sets 8 --concurrency 10 --db postgresql://…
+#   python bench.py --save-baseline          # записать bench_baseline.json
+#
+# Каждый пользователь проходит: /start + профиль, «🏋️ Тренировка» → grp: → ex: → N подходов →
+# workout:finish, кардио, отчёты rp:. Пользователи идут параллельно (--concurrency), апдейты
+# одного пользователя — по очереди, как в update_queue. По каждому хэндлеру — p50/p95/p99 времени
+# апдейта, SQL и вызовов Bot API на апдейт; в конце — апдейтов в секунду.
+# Если есть bench_baseline.json, результат сравнивается с ним: лишний SQL / вызов Bot API на апдейт
+# или p95 / пропускная способность хуже на --tolerance — код выхода 1.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+BASELINE = Path(__file__).with_name("bench_baseline.json")
+BOT_TOKEN = "123456:BENCHBENCHBENCHBENCHBENCHBENCHBENCH"
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Бенчмарк хэндлеров бота на синтетических апдейтах")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--sets", type=int, default=5, help="подходов в силовой тренировке")
+    p.add_argument("--concurrency", type=int, default=1, help="пользователей одновременно")
+    p.add_argument("--db", default="", help="DATABASE_URL (по умолчанию — новый SQLite во временной папке)")
+    p.add_argument("--baseline", type=Path, default=BASELINE)
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("--tolerance", type=float, default=0.5, help="допуск по p95 и updates/s (0.5 = 50%%)")
+    p.add_argument("--json", action="store_true", help="результат в JSON")
+    return p.parse_args()
+
+
+def _configure_env(args: argparse.Namespace) -> None:
+    # до импорта config: бот, база и предсказуемые фоновые задачи
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    if args.db:
+        os.environ["DATABASE_URL"] = args.db
+    else:
+        tmp = Path(tempfile.mkdtemp(prefix="bench-")) / "bench.sqlite3"
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}"
+    # правки карточки — сразу, удаления — в конце прогона: вызовы Bot API остаются в своём апдейте
+    os.environ.setdefault("CARD_DEBOUNCE_SEC", "0")
+    os.environ.setdefault("CLEANUP_DELAY_SEC", "3600")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from aiogram import BaseMiddleware, Bot, Dispatcher
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import CallbackQuery, Chat, Message, Update, User as TgUser
+
+    from catalog import load_catalog
+    from cleanup import cleanup_queue
+    from config import settings
+    from db import dispose_engines, get_session
+    from fsm_storage import create_storage
+    from middlewares import setup_middlewares
+    from routers import basic_router, cardio_router, feedback_router, profile_router, reports_router, training_router
+    import sql_trace
+    from startup import prepare_db
+
+    # --- заглушка Bot API: считаем вызовы апдейта, на send* отдаём сообщение с новым id
+    tg_calls: ContextVar[Optional[list]] = ContextVar("bench_tg_calls", default=None)
+    message_ids = itertools.count(10_000)
+
+    class StubSession(BaseSession):
+        async def close(self) -> None:
+            pass
+
+        async def stream_content(self, *a, **kw):
+            if False:
+                yield b""
+
+        async def make_request(self, bot, method, timeout=None):
+            calls = tg_calls.get()
+            if calls is not None:
+                calls.append(method.__api_method__)
+            if method.__api_method__.startswith("send"):
+                chat = Chat(id=method.chat_id, type="private")
+                return Message(message_id=next(message_ids), date=datetime.now(), chat=chat, text="")
+            return True
+
+    # --- какой хэндлер обработал апдейт (внутренние middleware dp наследуют все роутеры)
+    handled_by: ContextVar[Optional[list]] = ContextVar("bench_handler", default=None)
+
+    class HandlerName(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            box = handled_by.get()
+            if box is not None:
+                box.append(getattr(data["handler"].callback, "__name__", "?"))
+            return await handler(event, data)
+
+    bot = Bot(BOT_TOKEN, session=StubSession())
+    dp = Dispatcher(storage=create_storage())
+    setup_middlewares(dp)
+    for router in (profile_router, cardio_router, training_router, basic_router, reports_router, feedback_router):
+        dp.include_router(router)
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerName())
+
+    # предупреждения трассировки по каждому апдейту тут не нужны — итог в таблице
+    logging.getLogger("sql_trace").setLevel(logging.ERROR)
+
+    await prepare_db(settings.database_url)
+    async with await get_session(settings.database_url) as session:
+        cat = await load_catalog(session)
+    group = cat.groups_by_slug["chest"]
+    exercise = cat.exercises_by_slug["bench_press"]
+    machine = cat.exercises_by_slug["treadmill"]
+
+    update_ids = itertools.count(1)
+    bot_user = TgUser(id=int(BOT_TOKEN.split(":")[0]), is_bot=True, first_name="bench")
+
+    def msg(uid: int, text: str) -> Update:
+        user, chat = TgUser(id=uid, is_bot=False, first_name="U"), Chat(id=uid, type="private")
+        m = Message(message_id=next(message_ids), date=datetime.now(), chat=chat, from_user=user, text=text)
+        return Update(update_id=next(update_ids), message=m)
+
+    def cb(uid: int, data: str) -> Update:
+        user, chat = TgUser(id=uid, is_bot=False, first_name="U"), Chat(id=uid, type="private")
+        m = Message(message_id=next(message_ids), date=datetime.now(), chat=chat, from_user=bot_user, text="x")
+        q = CallbackQuery(id=str(next(update_ids)), from_user=user, chat_instance="bench", message=m, data=data)
+        return Update(update_id=next(update_ids), callback_query=q)
+
+    def flow(uid: int) -> list[Update]:
+        onboarding = [
+            msg(uid, "/start"), cb(uid, "settings:profile"),
+            cb(uid, "edit:age"), cb(uid, "a:ok"), cb(uid, "edit:gender"), cb(uid, "gender:male"),
+            cb(uid, "edit:weight"), cb(uid, "w:ok"), cb(uid, "edit:height"), cb(uid, "h:ok"),
+        ]
+        training = [msg(uid, "🏋️ Тренировка"), cb(uid, f"grp:{group.id}"), cb(uid, f"ex:{exercise.id}")]
+        training += [msg(uid, f"{60 + i * 2.5} {10 - i % 4}") for i in range(args.sets)]
+        training += [cb(uid, "ex:finish"), cb(uid, "workout:finish")]
+        cardio = [msg(uid, "🚴 Кардио"), cb(uid, f"cx:{machine.id}"), msg(uid, "30, 5"), cb(uid, "csave"), cb(uid, "cfinish")]
+        reports = [msg(uid, "📈 История"), cb(uid, "rp:weekly"), cb(uid, "rp:monthly"), cb(uid, "rp:alltime")]
+        return onboarding + training + cardio + reports
+
+    samples: dict[str, list[tuple[float, int, int]]] = defaultdict(list)
+    errors = 0
+
+    async def feed(update: Update) -> None:
+        nonlocal errors
+        calls: list = []
+        handler: list = []
+        tg_token, h_token = tg_calls.set(calls), handled_by.set(handler)
+        try:
+            with sql_trace.capture(f"update {update.update_id}") as trace:
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception:
+                    errors += 1
+                elapsed = time.perf_counter() - started
+        finally:
+            tg_calls.reset(tg_token)
+            handled_by.reset(h_token)
+        name = handler[0] if handler else "unhandled"
+        samples[name].append((elapsed, len(trace.statements), len(calls)))
+
+    users = [10_000_000 + i for i in range(args.users)]
+    # сборка апдейтов (pydantic) — вне замера
+    flows = {uid: flow(uid) for uid in users}
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def run_user(uid: int) -> None:
+        async with sem:
+            for update in flows[uid]:
+                await feed(update)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(uid) for uid in users))
+    wall = time.perf_counter() - started
+
+    await cleanup_queue.close()
+    await dp.storage.close()
+    await dispose_engines()
+
+    total = sum(len(v) for v in samples.values())
+    handlers = {}
+    for name, rows in sorted(samples.items()):
+        lat = [r[0] for r in rows]
+        handlers[name] = {
+            "n": len(rows),
+            "p50_ms": round(_percentile(lat, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(lat, 0.99) * 1000, 3),
+            "sql_per_update": round(sum(r[1] for r in rows) / len(rows), 3),
+            "tg_per_update": round(sum(r[2] for r in rows) / len(rows), 3),
+        }
+    return {
+        "db": settings.database_url.split(":", 1)[0],
+        "users": args.users,
+        "sets": args.sets,
+        "concurrency": args.concurrency,
+        "updates": total,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "updates_per_sec": round(total / wall, 1) if wall else 0.0,
+        "handlers": handlers,
+    }
+
+
+def _print_report(result: dict) -> None:
+    print(
+        f"{result['updates']} updates in {result['seconds']} s — {result['updates_per_sec']} upd/s "
+        f"({result['users']} users × {result['concurrency']} concurrent, db={result['db']}, errors={result['errors']})"
+    )
+    print(f"{'handler':32} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/upd':>8} {'tg/upd':>7}")
+    for name, h in result["handlers"].items():
+        print(
+            f"{name:32} {h['n']:>5} {h['p50_ms']:>8.2f} {h['p95_ms']:>8.2f} {h['p99_ms']:>8.2f} "
+            f"{h['sql_per_update']:>8.2f} {h['tg_per_update']:>7.2f}"
+        )
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Регрессии относительно baseline: SQL и Bot API — строго, время — с допуском."""
+    problems = []
+    for name, base in baseline.get("handlers", {}).items():
+        cur = result["handlers"].get(name)
+        if cur is None:
+            continue
+        for key in ("sql_per_update", "tg_per_update"):
+            if cur[key] > base[key] + 1e-9:
+                problems.append(f"{name}: {key} {base[key]} -> {cur[key]}")
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {base['p95_ms']} ms -> {cur['p95_ms']} ms")
+    base_ups = baseline.get("updates_per_sec", 0)
+    if base_ups and result["updates_per_sec"] < base_ups * (1 - tolerance):
+        problems.append(f"updates/s {base_ups} -> {result['updates_per_sec']}")
+    if result["errors"]:
+        problems.append(f"{result['errors']} updates raised")
+    return problems
+
+
+def main() -> int:
+    args = _parse_args()
+    _configure_env(args)
+    sys.path.insert(0, str(Path(__file__).parent))
+    result = asyncio.run(run(args))
+
+    problems: Optional[list[str]] = None
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    elif args.baseline.exists():
+        problems = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+
+    if args.json:
+        print(json.dumps({**result, "regressions": problems}, ensure_ascii=False, indent=2))
+    else:
+        _print_report(result)
+        if args.save_baseline:
+            print(f"baseline saved to {args.baseline}")
+        elif problems:
+            print("REGRESSION vs baseline:")
+            for p in problems:
+                print("  ", p)
+        elif problems is not None:
+            print("OK vs baseline")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,53 @@
 import asyncio
+import logging
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import settings
-from db import init_db
+from middlewares import setup_middlewares
+from cleanup import cleanup_queue
+from rate_limit import setup_rate_limit
+from fsm_storage import create_storage
+from catalog import load_catalog, run_catalog_refresher
+from db import dispose_engines, get_session
+from startup import prepare_db
+from autofinish import run_autofinish_sweeper
+from metrics import setup_metrics
 from routers import basic_router, profile_router, training_router, cardio_router, reports_router
 
 bot = Bot(
     token=settings.bot_token,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
+setup_rate_limit(bot)
+dp = Dispatcher(storage=create_storage())
+setup_middlewares(dp)
 
 dp.include_router(profile_router)
 dp.include_router(cardio_router)
 dp.include_router(training_router)
 dp.include_router(basic_router)
 dp.include_router(reports_router)
+setup_metrics(dp, bot)
 
 async def main():
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     if not settings.bot_token:
         raise RuntimeError("BOT_TOKEN не задан")
-    await init_db(settings.database_url)
-    await dp.start_polling(bot)
+    await prepare_db(settings.database_url)
+    async with await get_session(settings.database_url) as session:
+        await load_catalog(session)
+    sweeper = asyncio.create_task(run_autofinish_sweeper(settings.database_url))
+    catalog_task = asyncio.create_task(run_catalog_refresher(settings.database_url))
+    try:
+        await dp.start_polling(bot)
+    finally:
+        sweeper.cancel()
+        catalog_task.cancel()
+        await cleanup_queue.close()
+        await dp.storage.close()
+        await dispose_engines()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,60 @@
+# cache.py — маленький in-process кэш: LRU с ограничением размера и TTL на запись
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Ограниченный LRU-кэш с TTL. Не потокобезопасен — рассчитан на один event loop.
+    При переполнении вытесняется самая давно использованная запись.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300.0) -> None:
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data: "OrderedDict[K, tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self):
+        """Снимок (ключ, значение) без учёта TTL и без влияния на порядок LRU."""
+        return [(k, v) for k, (_, v) in self._data.items()]
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,169 @@
+# card_debounce.py — склейка правок карточки упражнения (s_last_msg) по чату
+#
+# Быстрые подходы и «🔁 Ещё такой же» раньше давали по edit_message_text на каждый подход.
+# Теперь первая правка в «тихом» чате уходит сразу и открывает окно CARD_DEBOUNCE_SEC;
+# правки, пришедшие в это окно или пока предыдущая ещё отправляется, склеиваются — в конце окна
+# уходит только последнее состояние карточки (и открывается следующее окно).
+# Правка, совпадающая с уже показанным текстом и кнопками, не отправляется.
+# flush() отправляет отложенное сразу (например, перед «✅ Завершить упражнение»).
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardMarkup
+
+from cache import TTLCache
+from config import settings
+from db import current_session
+
+log = logging.getLogger(__name__)
+
+
+def _fingerprint(text: str, markup: Optional[InlineKeyboardMarkup]) -> tuple[str, Optional[str]]:
+    return text, markup.model_dump_json(exclude_none=True) if markup is not None else None
+
+
+@dataclass
+class _PendingEdit:
+    bot: Bot
+    chat_id: int
+    msg_id: int
+    text: str
+    markup: Optional[InlineKeyboardMarkup]
+    state: FSMContext
+
+
+class CardDebouncer:
+    def __init__(self, window: float, maxsize: int = 10000) -> None:
+        self.window = window
+        self._pending: dict[int, _PendingEdit] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+        self._inflight: dict[int, asyncio.Task] = {}
+        # (chat_id, message_id) -> что сейчас показано в карточке
+        self._rendered: TTLCache[tuple[int, int], tuple[str, Optional[str]]] = TTLCache(maxsize=maxsize, ttl=3600)
+        # (chat_id, старый message_id) -> новый, если карточку пришлось отправить заново:
+        # хэндлер мог прочитать s_last_msg из FSM до того, как фоновая правка его обновила
+        self._moved: TTLCache[tuple[int, int], int] = TTLCache(maxsize=maxsize, ttl=3600)
+        self.coalesced = 0
+        self.skipped = 0
+        self.edits = 0
+        self.resent = 0
+
+    def remember(self, chat_id: int, msg_id: int, text: str, markup: Optional[InlineKeyboardMarkup]) -> None:
+        """Карточку показали в обход дебаунсера — запоминаем, чтобы не повторять ту же правку."""
+        self._rendered.set((chat_id, msg_id), _fingerprint(text, markup))
+
+    async def update(
+        self,
+        bot: Bot,
+        chat_id: int,
+        msg_id: int,
+        text: str,
+        markup: Optional[InlineKeyboardMarkup],
+        state: FSMContext,
+    ) -> None:
+        msg_id = self._moved.get((chat_id, msg_id), msg_id)
+        pending = self._pending.get(chat_id)
+        if pending is not None and pending.msg_id != msg_id:
+            # в чате уже другая карточка — старую дописываем сразу
+            await self.flush(chat_id)
+            pending = None
+
+        if pending is None:
+            if self._rendered.get((chat_id, msg_id)) == _fingerprint(text, markup):
+                self.skipped += 1
+                return
+            self._pending[chat_id] = _PendingEdit(bot, chat_id, msg_id, text, markup, state)
+        else:
+            self.coalesced += 1
+            pending.text, pending.markup, pending.state = text, markup, state
+
+        if self.window <= 0:
+            await self._apply(chat_id)
+        elif chat_id not in self._timers and chat_id not in self._inflight:
+            # тихий чат: правим сразу, а следующие правки в течение окна копятся
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+            await self._apply(chat_id)
+
+    async def _flush_later(self, chat_id: int) -> None:
+        # задача унаследовала контекст апдейта — его сессия к моменту правки уже закрыта
+        current_session.set(None)
+        await asyncio.sleep(self.window)
+        me = asyncio.current_task()
+        if self._timers.get(chat_id) is me:
+            del self._timers[chat_id]
+        if chat_id not in self._pending:
+            return
+        # правки во время отправки копятся и уйдут по следующему окну
+        self._inflight[chat_id] = me
+        try:
+            await self._apply(chat_id)
+        except Exception:
+            log.exception("Deferred card update failed in chat %s", chat_id)
+        finally:
+            if self._inflight.get(chat_id) is me:
+                del self._inflight[chat_id]
+            if chat_id not in self._timers:
+                self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+
+    async def flush(self, chat_id: int) -> None:
+        """Отправить отложенную правку чата сейчас и дождаться уже начатой."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        inflight = self._inflight.get(chat_id)
+        if inflight is not None:
+            await asyncio.gather(inflight, return_exceptions=True)
+        await self._apply(chat_id)
+
+    async def _apply(self, chat_id: int) -> None:
+        edit = self._pending.pop(chat_id, None)
+        if edit is None:
+            return
+        fp = _fingerprint(edit.text, edit.markup)
+        if self._rendered.get((chat_id, edit.msg_id)) == fp:
+            self.skipped += 1
+            return
+        try:
+            await edit.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=edit.msg_id,
+                text=edit.text,
+                reply_markup=edit.markup,
+                parse_mode="HTML",
+            )
+            self.edits += 1
+            self._rendered.set((chat_id, edit.msg_id), fp)
+            return
+        except TelegramBadRequest as e:
+            if "not modified" in e.message:
+                self._rendered.set((chat_id, edit.msg_id), fp)
+                return
+        except Exception:
+            log.exception("Card edit failed in chat %s", chat_id)
+
+        # карточку удалили / не найти — шлём новую и запоминаем её id
+        self._rendered.pop((chat_id, edit.msg_id))
+        sent = await edit.bot.send_message(chat_id, edit.text, reply_markup=edit.markup, parse_mode="HTML")
+        self.resent += 1
+        self._moved.set((chat_id, edit.msg_id), sent.message_id)
+        self._rendered.set((chat_id, sent.message_id), fp)
+        await edit.state.update_data(s_last_msg=sent.message_id)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+            "edits": self.edits,
+            "resent": self.resent,
+        }
+
+
+card_debouncer = CardDebouncer(settings.card_debounce_sec)
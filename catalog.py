@@ -0,0 +1,200 @@
+# catalog.py — снимок справочника (MuscleGroup / Exercise) в памяти процесса
+#
+# Справочник почти не меняется, а экраны выбора группы/упражнения/тренажёра читали его
+# из БД на каждое нажатие. Теперь он грузится целиком при старте, экраны берут всё отсюда
+# без запросов. Изменение справочника (сид, импорт) ставит новую версию в Meta["catalog_version"];
+# фоновая задача раз в CATALOG_REFRESH_SEC сверяет версию и перечитывает снимок,
+# поэтому остальные воркеры подхватывают изменения сами.
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import Exercise, Meta, MuscleGroup, get_session, set_meta
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = "catalog_version"
+
+
+@dataclass(frozen=True)
+class GroupInfo:
+    id: int
+    slug: str
+    name: str
+
+
+@dataclass(frozen=True)
+class ExerciseInfo:
+    id: int
+    slug: str
+    name: str
+    type: str
+    primary_muscle_id: Optional[int]
+    tip: Optional[str]
+
+
+@dataclass
+class Catalog:
+    version: Optional[str]
+    groups: list[GroupInfo]                    # в порядке id, без cardio — как на экране групп
+    groups_by_id: dict[int, GroupInfo]
+    groups_by_slug: dict[str, GroupInfo]
+    exercises_by_id: dict[int, ExerciseInfo]
+    exercises_by_slug: dict[str, ExerciseInfo]
+    # (type, group_id | None) -> упражнения, отсортированные по (name, id); None — все группы
+    _lists: dict[tuple[str, Optional[int]], list[ExerciseInfo]] = field(default_factory=dict)
+    # те же списки ключами (name, id) — для bisect в keyset()
+    _keys: dict[tuple[str, Optional[int]], list[tuple[str, int]]] = field(default_factory=dict)
+    # клавиатуры и прочее, посчитанное по этому снимку; новый снимок — новый memo
+    _memo: dict[Any, Any] = field(default_factory=dict)
+
+    def exercises(self, etype: str, group_id: Optional[int] = None) -> list[ExerciseInfo]:
+        return self._lists.get((etype, group_id or None), [])
+
+    def keyset(
+        self,
+        etype: str,
+        group_id: Optional[int],
+        per_page: int,
+        cursor: Optional[str] = None,
+    ) -> tuple[list[ExerciseInfo], Optional[str], Optional[str]]:
+        """
+        Страница по ключу (name, id) вместо OFFSET. cursor: ">id" — после упражнения id,
+        "<id" — перед ним, None/непонятный — первая страница.
+        Возвращает (упражнения, курсор «назад», курсор «вперёд»); None — листать некуда.
+        Место ищется bisect'ом, так что страница N стоит как первая.
+        """
+        items = self.exercises(etype, group_id)
+        keys = self._keys.get((etype, group_id or None), [])
+        start = 0
+        ex = self.exercises_by_id.get(_cursor_id(cursor))
+        if ex is not None:
+            key = (ex.name, ex.id)
+            if cursor[0] == "<":
+                start = max(0, bisect_left(keys, key) - per_page)
+            else:
+                start = bisect_right(keys, key)
+        if start >= len(items):
+            # упражнение-курсор было последним (или справочник сократился) — последняя страница
+            start = max(0, len(items) - per_page)
+        page = items[start:start + per_page]
+        if not page:
+            return [], None, None
+        prev_cursor = f"<{page[0].id}" if start > 0 else None
+        next_cursor = f">{page[-1].id}" if start + per_page < len(items) else None
+        return page, prev_cursor, next_cursor
+
+    def cursor(self, cursor: Optional[str]) -> Optional[str]:
+        """
+        Курсор в каноническом виде (">id" / "<id" упражнения из снимка), иначе None — первая страница.
+        Курсор приходит из callback_data, поэтому в ключах memo — только он: их не больше 2 × упражнений.
+        """
+        ex_id = _cursor_id(cursor)
+        return f"{cursor[0]}{ex_id}" if ex_id in self.exercises_by_id else None
+
+    def memo(self, key: Any, build: Callable[[], Any]) -> Any:
+        """Кэш результата build() на время жизни снимка (клавиатуры страниц и т.п.)."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = build()
+            return value
+
+
+def _cursor_id(cursor: Optional[str]) -> Optional[int]:
+    if not cursor or cursor[0] not in "<>" or not cursor[1:].isdigit():
+        return None
+    return int(cursor[1:])
+
+
+def _build(version: Optional[str], groups: list[MuscleGroup], exercises: list[Exercise]) -> Catalog:
+    infos = [
+        ExerciseInfo(e.id, e.slug, e.name, e.type, e.primary_muscle_id, e.tip)
+        for e in sorted(exercises, key=lambda e: (e.name, e.id))
+    ]
+    lists: dict[tuple[str, Optional[int]], list[ExerciseInfo]] = {}
+    for ex in infos:
+        lists.setdefault((ex.type, None), []).append(ex)
+        if ex.primary_muscle_id is not None:
+            lists.setdefault((ex.type, ex.primary_muscle_id), []).append(ex)
+    group_infos = [GroupInfo(g.id, g.slug, g.name) for g in sorted(groups, key=lambda g: g.id)]
+    return Catalog(
+        version=version,
+        groups=[g for g in group_infos if g.slug != "cardio"],
+        groups_by_id={g.id: g for g in group_infos},
+        groups_by_slug={g.slug: g for g in group_infos},
+        exercises_by_id={e.id: e for e in infos},
+        exercises_by_slug={e.slug: e for e in infos},
+        _lists=lists,
+        _keys={k: [(e.name, e.id) for e in v] for k, v in lists.items()},
+    )
+
+
+_catalog: Optional[Catalog] = None
+
+
+async def _read_version(session: AsyncSession) -> Optional[str]:
+    return (await session.exec(select(Meta.value).where(Meta.key == VERSION_KEY))).first()
+
+
+async def load_catalog(session: AsyncSession) -> Catalog:
+    """Перечитать снимок целиком (три запроса) и сделать его текущим."""
+    global _catalog
+    version = await _read_version(session)
+    groups = (await session.exec(select(MuscleGroup))).all()
+    exercises = (await session.exec(select(Exercise))).all()
+    _catalog = _build(version, list(groups), list(exercises))
+    return _catalog
+
+
+async def get_catalog(session: AsyncSession) -> Catalog:
+    """Текущий снимок; сессия нужна только если снимок ещё не загружен (первый апдейт до startup)."""
+    return _catalog if _catalog is not None else await load_catalog(session)
+
+
+async def get_exercise(session: AsyncSession, ex_id: int) -> Optional[ExerciseInfo]:
+    """
+    По id из снимка. Промах — упражнение могли добавить после загрузки (снимок догонит
+    run_catalog_refresher) или id подделан в ex:/cx: колбэке: читаем одну строку, снимок не трогаем.
+    """
+    ex = (await get_catalog(session)).exercises_by_id.get(ex_id)
+    if ex is None:
+        row = await session.get(Exercise, ex_id)
+        if row is not None:
+            ex = ExerciseInfo(row.id, row.slug, row.name, row.type, row.primary_muscle_id, row.tip)
+    return ex
+
+
+async def bump_catalog_version(session: AsyncSession) -> str:
+    """Справочник изменился: новая версия в Meta (в транзакции вызывающего) и сброс снимка процесса."""
+    global _catalog
+    version = uuid.uuid4().hex
+    await set_meta(session, VERSION_KEY, version)
+    _catalog = None
+    return version
+
+
+async def run_catalog_refresher(db_url: str, interval: Optional[float] = None) -> None:
+    """Фоновая сверка версии: один маленький SELECT раз в interval секунд."""
+    interval = interval or settings.catalog_refresh_sec
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with await get_session(db_url) as session:
+                version = await _read_version(session)
+                if _catalog is None or version != _catalog.version:
+                    await load_catalog(session)
+                    log.info("catalog reloaded (version %s)", version)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("catalog refresh failed")
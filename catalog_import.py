@@ -0,0 +1,295 @@
+# catalog_import.py — импорт справочника упражнений из CSV / JSON / JSON Lines
+#
+#   python catalog_import.py exercises.csv [--chunk 500] [--dry-run]
+#
+# Файл читается потоково, строки проверяются и пачками по --chunk уходят в один
+# INSERT … ON CONFLICT (slug) DO UPDATE (SQLite и Postgres), так что память не растёт с размером файла.
+# Поля: slug, name, type (strength | cardio | mobility, по умолчанию strength), group (slug группы), tip.
+# CSV — с заголовком; JSON — массив объектов; .jsonl — по объекту в строке.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from catalog import bump_catalog_version
+from db import Exercise, MuscleGroup
+
+EXERCISE_TYPES = ("strength", "cardio", "mobility")
+SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9_\-]{0,63}$")
+MAX_NAME = 100
+MAX_ERRORS = 20  # сколько ошибок строк показать в отчёте
+
+_FIELDS = ("slug", "name", "type", "primary_muscle_id", "tip")
+
+
+@dataclass
+class ImportStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0                                  # невалидные и нечитаемые строки
+    errors: list[str] = field(default_factory=list)   # первые MAX_ERRORS причин пропуска
+
+    def skip(self, line: int, reason: str) -> None:
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f"строка {line}: {reason}")
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated)
+
+
+# ===================== Чтение =====================
+@dataclass(frozen=True)
+class Malformed:
+    """Запись, которую не удалось разобрать (битый JSON): validate_row её отклоняет, импорт идёт дальше."""
+    reason: str
+
+
+def _iter_csv(f: TextIO) -> Iterator[tuple[int, dict]]:
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _iter_jsonl(f: TextIO) -> Iterator[tuple[int, Any]]:
+    for n, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield n, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield n, Malformed(f"некорректный JSON: {e.msg}")
+
+
+def _element_end(buf: str, pos: int) -> Optional[int]:
+    """Где кончается элемент массива с pos: ',' или ']' вне вложенных скобок и строк; None — надо дочитать."""
+    depth, in_str, escaped = 0, False, False
+    for i in range(pos, len(buf)):
+        ch = buf[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            if depth == 0:
+                return i
+            depth -= 1
+        elif ch == "," and depth == 0:
+            return i
+    return None
+
+
+def _iter_json_array(f: TextIO, bufsize: int = 1 << 16) -> Iterator[tuple[int, Any]]:
+    """Элементы JSON-массива по одному, без чтения файла целиком; «строка» — номер элемента."""
+    decoder = json.JSONDecoder()
+    buf, pos, n = "", 0, 0
+    started = False
+    while True:
+        # пропускаем пробелы, '[' и запятые между элементами
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) or not (chunk := f.read(bufsize)):
+                break
+            buf, pos = buf[pos:] + chunk, 0
+        if pos >= len(buf):
+            raise ValueError("JSON: массив не закрыт")
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("JSON: ожидался массив объектов")
+            started, pos = True, pos + 1
+            continue
+        if buf[pos] == "]":
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError as e:
+                # элемент целиком в буфере, но битый — пропускаем его, а не весь файл
+                end = _element_end(buf, pos)
+                if end is not None:
+                    item = Malformed(f"некорректный JSON: {e.msg}")
+                    break
+                chunk = f.read(bufsize)
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+        n += 1
+        yield n, item
+        pos = end
+
+
+def read_rows(path: Path) -> Iterator[tuple[int, Any]]:
+    """(номер строки, сырая запись) из файла; формат — по расширению."""
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        if suffix == ".csv":
+            yield from _iter_csv(f)
+        elif suffix in (".jsonl", ".ndjson"):
+            yield from _iter_jsonl(f)
+        elif suffix == ".json":
+            yield from _iter_json_array(f)
+        else:
+            raise ValueError(f"Неизвестный формат: {path.name} (нужен .csv, .json или .jsonl)")
+
+
+# ===================== Проверка =====================
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_row(raw: Any, groups: dict[str, int]) -> dict:
+    """Сырая запись -> значения колонок Exercise; ValueError с причиной, если строка негодная."""
+    if isinstance(raw, Malformed):
+        raise ValueError(raw.reason)
+    if not isinstance(raw, dict):
+        raise ValueError("ожидался объект")
+    slug = (_clean(raw.get("slug")) or "").lower()
+    if not SLUG_RE.match(slug):
+        raise ValueError(f"некорректный slug {slug!r}")
+    name = _clean(raw.get("name"))
+    if not name:
+        raise ValueError("пустое name")
+    if len(name) > MAX_NAME:
+        raise ValueError(f"name длиннее {MAX_NAME} символов")
+    etype = (_clean(raw.get("type")) or "strength").lower()
+    if etype not in EXERCISE_TYPES:
+        raise ValueError(f"неизвестный type {etype!r}")
+    group = (_clean(raw.get("group")) or "").lower()
+    if group and group not in groups:
+        raise ValueError(f"неизвестная группа {group!r}")
+    return {
+        "slug": slug,
+        "name": name,
+        "type": etype,
+        "primary_muscle_id": groups.get(group) if group else None,
+        "tip": _clean(raw.get("tip")),
+    }
+
+
+# ===================== Запись =====================
+async def upsert_exercises(
+    session: AsyncSession, rows: list[dict], stats: ImportStats, overwrite: bool = True
+) -> None:
+    """
+    Пачка строк одним INSERT … ON CONFLICT (slug). overwrite=False — существующие не трогаем (сид).
+    Совпадающие строки не переписываются: UPDATE только если что-то отличается.
+    """
+    # в одном INSERT ключ не может встретиться дважды — последняя строка файла побеждает
+    rows = list({r["slug"]: r for r in rows}.values())
+    if not rows:
+        return
+    slugs = [r["slug"] for r in rows]
+    existing = set((await session.exec(select(Exercise.slug).where(Exercise.slug.in_(slugs)))).all())
+
+    insert_fn = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_fn(Exercise).values(rows)
+    if overwrite:
+        cols = [c for c in _FIELDS if c != "slug"]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["slug"],
+            set_={c: stmt.excluded[c] for c in cols},
+            where=or_(*(getattr(Exercise, c).is_distinct_from(stmt.excluded[c]) for c in cols)),
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["slug"])
+    # rowcount = вставленные + реально обновлённые
+    written = (await session.exec(stmt)).rowcount
+    inserted = len(rows) - len(existing)
+    stats.inserted += inserted
+    stats.updated += max(0, written - inserted)
+    stats.unchanged += len(existing) - max(0, written - inserted)
+
+
+async def import_rows(
+    session: AsyncSession, records: Iterable[tuple[int, Any]], chunk: int = 500
+) -> ImportStats:
+    """Проверить и записать записи пачками; каждая пачка — своя транзакция."""
+    groups = {slug: gid for gid, slug in (await session.exec(select(MuscleGroup.id, MuscleGroup.slug))).all()}
+    stats = ImportStats()
+    batch: list[dict] = []
+
+    async def flush() -> None:
+        await upsert_exercises(session, batch, stats)
+        await session.commit()
+        batch.clear()
+
+    for line, raw in records:
+        try:
+            batch.append(validate_row(raw, groups))
+        except ValueError as e:
+            stats.skip(line, str(e))
+            continue
+        if len(batch) >= chunk:
+            await flush()
+    await flush()
+
+    if stats.changed:
+        await bump_catalog_version(session)
+        await session.commit()
+    return stats
+
+
+async def main():
+    from config import settings
+    from db import dispose_engines, get_session, init_db
+    from seed_data import ensure_seed_data
+
+    parser = argparse.ArgumentParser(description="Импорт справочника упражнений (CSV / JSON / JSONL)")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk", type=int, default=500, help="строк в одном INSERT (по умолчанию 500)")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить файл")
+    args = parser.parse_args()
+
+    await init_db(settings.database_url)
+    await ensure_seed_data()  # базовые группы, на которые ссылается колонка group
+    started = time.perf_counter()
+    async with await get_session(settings.database_url) as session:
+        if args.dry_run:
+            groups = {slug: gid for gid, slug in (await session.exec(select(MuscleGroup.id, MuscleGroup.slug))).all()}
+            stats = ImportStats()
+            for line, raw in read_rows(args.path):
+                try:
+                    validate_row(raw, groups)
+                    stats.unchanged += 1
+                except ValueError as e:
+                    stats.skip(line, str(e))
+            print(f"Проверено: ok={stats.unchanged} skipped={stats.skipped}")
+        else:
+            stats = await import_rows(session, read_rows(args.path), chunk=max(1, args.chunk))
+            print(
+                f"Импорт за {time.perf_counter() - started:.1f} с: inserted={stats.inserted} "
+                f"updated={stats.updated} unchanged={stats.unchanged} skipped={stats.skipped}"
+            )
+    await dispose_engines()
+    for err in stats.errors:
+        print("  ", err)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
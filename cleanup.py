@@ -0,0 +1,83 @@
+# cleanup.py — отложенное пакетное удаление служебных сообщений по чату
+#
+# Хэндлеры не удаляют подсказки/якоря (hub_msg_id, input_prompt_msg_id, after_ex_msg_id,
+# fb_prompt_msg_id…) по одному на пути ответа, а кладут их id сюда: ответ пользователю уходит
+# первым, а через CLEANUP_DELAY_SEC всё накопленное по чату удаляется одним deleteMessages.
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot
+
+from config import settings
+
+log = logging.getLogger(__name__)
+
+# deleteMessages принимает до 100 id за вызов
+_BATCH = 100
+
+
+class CleanupQueue:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self._pending: dict[int, tuple[Bot, set[int]]] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+        self.deleted = 0
+        self.calls = 0
+
+    def defer(self, bot: Bot, chat_id: int, *message_ids: Optional[int]) -> None:
+        """Запланировать удаление; пустые id пропускаем, повторы склеиваются."""
+        ids = {int(m) for m in message_ids if m}
+        if not ids:
+            return
+        _, pending = self._pending.setdefault(chat_id, (bot, set()))
+        pending.update(ids)
+        if chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+
+    async def _flush_later(self, chat_id: int) -> None:
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._timers.pop(chat_id, None)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id: int) -> None:
+        entry = self._pending.pop(chat_id, None)
+        if entry is None:
+            return
+        bot, ids = entry
+        ordered = sorted(ids)
+        for i in range(0, len(ordered), _BATCH):
+            batch = ordered[i:i + _BATCH]
+            self.calls += 1
+            try:
+                if len(batch) > 1 and hasattr(bot, "delete_messages"):
+                    # ненайденные/неудаляемые Telegram сам пропускает
+                    await bot.delete_messages(chat_id, batch)
+                else:
+                    for message_id in batch:
+                        try:
+                            await bot.delete_message(chat_id, message_id)
+                        except Exception:
+                            pass
+            except Exception:
+                log.warning("Cleanup of %d messages in chat %s failed", len(batch), chat_id, exc_info=True)
+                continue
+            self.deleted += len(batch)
+
+    async def close(self) -> None:
+        """Остановка: не ждём таймеров — удаляем всё накопленное сразу."""
+        for task in self._timers.values():
+            task.cancel()
+        self._timers.clear()
+        for chat_id in list(self._pending):
+            await self.flush(chat_id)
+
+    def stats(self) -> dict:
+        return {"pending_chats": len(self._pending), "deleted": self.deleted, "calls": self.calls}
+
+
+cleanup_queue = CleanupQueue(settings.cleanup_delay_sec)
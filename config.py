@@ -30,10 +30,74 @@ class Settings:
         # путь вебхука (только путь, без домена)
         self.webhook_path: str = os.getenv("WEBHOOK_PATH", "webhook/ShlaSaSha").strip("/")
 
+        # уровень логирования (DEBUG / INFO / WARNING …)
+        self.log_level: str = os.getenv("LOG_LEVEL", "INFO").strip().upper() or "INFO"
+
         # строка подключения к БД
         raw_db = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./db.sqlite3").strip()
         self.database_url: str = _coerce_asyncpg(raw_db)
 
+        # пул соединений (один на процесс, см. db.get_engine)
+        self.db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+        self.db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        self.db_pool_pre_ping: bool = os.getenv("DB_POOL_PRE_PING", "1").strip().lower() in ("1", "true", "yes")
+        # секунды; Railway/pgbouncer рвут простаивающие соединения
+        self.db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+        # исходящие запросы к Telegram (см. rate_limit.py): запросов/с на бота, на чат, всплеск чата
+        self.tg_rate_global: float = float(os.getenv("TG_RATE_GLOBAL", "30"))
+        self.tg_rate_chat: float = float(os.getenv("TG_RATE_CHAT", "1"))
+        self.tg_rate_chat_burst: float = float(os.getenv("TG_RATE_CHAT_BURST", "4"))
+        self.tg_retry_max: int = int(os.getenv("TG_RETRY_MAX", "3"))
+
+        # окно склейки правок карточки после первой (она — сразу), сек; 0 — каждую сразу (см. card_debounce.py)
+        self.card_debounce_sec: float = float(os.getenv("CARD_DEBOUNCE_SEC", "0.5"))
+
+        # задержка пакетного удаления служебных сообщений, сек (см. cleanup.py)
+        self.cleanup_delay_sec: float = float(os.getenv("CLEANUP_DELAY_SEC", "1"))
+
+        # как часто сверять версию справочника упражнений, сек (см. catalog.py)
+        self.catalog_refresh_sec: float = float(os.getenv("CATALOG_REFRESH_SEC", "60"))
+
+        # очередь апдейтов вебхука (см. update_queue.py): воркеров и общий лимит очереди
+        self.update_workers: int = int(os.getenv("UPDATE_WORKERS", "8"))
+        self.update_queue_size: int = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+        # трассировка SQL по апдейтам (см. sql_trace.py): выключена по умолчанию;
+        # бюджет запросов на апдейт, сколько повторов одного запроса считать N+1, сколько медленных хранить
+        self.sql_trace: bool = os.getenv("SQL_TRACE", "0").strip().lower() in ("1", "true", "yes")
+        self.sql_trace_budget: int = int(os.getenv("SQL_TRACE_BUDGET", "10"))
+        self.sql_trace_repeat: int = int(os.getenv("SQL_TRACE_REPEAT", "3"))
+        self.sql_trace_keep: int = int(os.getenv("SQL_TRACE_KEEP", "20"))
+
+        # /readyz (см. health.py): таймаут каждой проверки, допустимая задержка цикла событий, сек,
+        # и сколько апдейтов может ждать в очереди (по умолчанию 80% UPDATE_QUEUE_SIZE)
+        self.ready_timeout_sec: float = float(os.getenv("READY_TIMEOUT_SEC", "1"))
+        self.ready_max_loop_lag: float = float(os.getenv("READY_MAX_LOOP_LAG", "0.5"))
+        self.ready_max_pending: int = int(os.getenv("READY_MAX_PENDING", str(self.update_queue_size * 4 // 5)))
+
+        # хранилище FSM: memory | sql | redis://… (см. fsm_storage.py)
+        self.fsm_storage: str = os.getenv("FSM_STORAGE", "sql").strip() or "sql"
+        # >0 — in-process кэш FSM с отложенной записью (секунды); только для одного воркера
+        self.fsm_write_back_sec: float = float(os.getenv("FSM_WRITE_BACK_SEC", "0"))
+
+        # кэш пользователя и текущей тренировки (см. user_context.py)
+        self.user_cache_size: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.user_cache_ttl: float = float(os.getenv("USER_CACHE_TTL", "300"))
+
+        # кэш готовых отчётов (см. report_cache.py); TTL — для окон 7/30 дней и для «всего периода»
+        self.report_cache_size: int = int(os.getenv("REPORT_CACHE_SIZE", "5000"))
+        self.report_cache_ttl: float = float(os.getenv("REPORT_CACHE_TTL", "60"))
+        self.report_alltime_cache_ttl: float = float(os.getenv("REPORT_ALLTIME_CACHE_TTL", "3600"))
+
+        # кэш последнего подхода по (пользователь, упражнение) для карточки (см. last_set.py)
+        self.last_set_cache_size: int = int(os.getenv("LAST_SET_CACHE_SIZE", "20000"))
+        self.last_set_cache_ttl: float = float(os.getenv("LAST_SET_CACHE_TTL", "600"))
+
+        # автозакрытие брошенных тренировок (см. autofinish.py)
+        self.autofinish_idle_min: int = int(os.getenv("AUTOFINISH_IDLE_MIN", "120"))
+        self.autofinish_sweep_sec: float = float(os.getenv("AUTOFINISH_SWEEP_SEC", "300"))
+
         # ===== Новые настройки для обратной связи =====
         # токен второго бота (куда отправляем отзывы)
         fb_token = os.getenv("FEEDBACK_BOT_TOKEN", "").strip()
@@ -1,14 +1,18 @@
 from __future__ import annotations
-from datetime import datetime
-from typing import Optional
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Awaitable, Callable, Optional
 
 from sqlmodel import Field, SQLModel, select
-from sqlalchemy import Column, BigInteger  # ← добавь это
+from sqlalchemy import Column, BigInteger, Index, JSON  # ← добавь это
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession  # важно: из SQLModel, не из SQLAlchemy
 
+from config import settings
+
 # ================================================================
 # Модели базы данных
 # ================================================================
@@ -57,13 +61,25 @@ class Equipment(SQLModel, table=True):
 
 
 class Workout(SQLModel, table=True):
+    # последние тренировки пользователя: user_context, отчёты, autofinish
+    __table_args__ = (Index("ix_workout_user_created", "user_id", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     title: str
     created_at: datetime = Field(default_factory=datetime.utcnow)  # автодата создания
+    # NULL — тренировка открыта; закрывает «🏁 Завершить» или фоновый autofinish
+    finished_at: Optional[datetime] = None
 
 
 class WorkoutItem(SQLModel, table=True):
+    __table_args__ = (
+        # подходы упражнения в тренировке: счётчик, «последний подход», агрегаты по тренировке
+        Index("ix_workoutitem_workout_exercise_id", "workout_id", "exercise_id", "id"),
+        # окна отчётов (7/30 дней)
+        Index("ix_workoutitem_created_at", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     workout_id: int = Field(foreign_key="workout.id")
     exercise_id: int = Field(foreign_key="exercise.id")
@@ -78,16 +94,164 @@ class WorkoutItem(SQLModel, table=True):
     distance_m: Optional[float] = None
 
 
+class DailyStats(SQLModel, table=True):
+    """
+    Суточный свод подходов по пользователю и упражнению (день — по UTC).
+    Ведётся в той же транзакции, что и вставка WorkoutItem (см. rollups.py);
+    отчёты читают его вместо сырых подходов.
+    """
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    exercise_id: int = Field(foreign_key="exercise.id", primary_key=True)
+
+    sets: int = 0
+    reps: int = 0
+    tonnage: float = 0.0      # Σ weight × reps
+    cardio_sec: int = 0       # Σ duration_sec
+    cardio_m: float = 0.0     # Σ distance_m
+    best_e1rm: Optional[float] = None  # max оценки 1ПМ за день (analytics.e1rm); NULL — не было
+
+
+class PersonalRecord(SQLModel, table=True):
+    """
+    Личные рекорды пользователя по силовому упражнению (подходы с весом и повторами).
+    Ведётся в той же транзакции, что и вставка WorkoutItem (см. records.py).
+    """
+    __tablename__ = "personal_record"
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    exercise_id: int = Field(foreign_key="exercise.id", primary_key=True)
+
+    max_weight: float = 0.0
+    max_weight_reps: int = 0              # лучшие повторы с max_weight
+    best_e1rm: float = 0.0                # оценка 1ПМ по Эпли (analytics.e1rm)
+    best_session_tonnage: float = 0.0     # Σ weight × reps упражнения за одну тренировку
+    # тренировка, в которой упражнение делали последним, и её тоннаж — для best_session_tonnage
+    session_workout_id: Optional[int] = None
+    session_tonnage: float = 0.0
+    last_broken: int = 0                  # рекорды, побитые последним подходом (биты records.*)
+    # последний подход (его тренировка — session_workout_id): подсказка «прошлый раз», см. last_set.py
+    last_weight: Optional[float] = None
+    last_reps: Optional[int] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # время последнего подхода
+
+
+class FsmRecord(SQLModel, table=True):
+    """Состояние и данные FSM aiogram по ключу чата/пользователя (см. fsm_storage.py)."""
+    __tablename__ = "fsm_state"
+
+    key: str = Field(primary_key=True, max_length=255)
+    state: Optional[str] = Field(default=None, max_length=255)
+    data: dict = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Meta(SQLModel, table=True):
+    """Служебные ключ-значение: версия справочника (catalog.py), отпечатки старта (startup.py)."""
+    key: str = Field(primary_key=True, max_length=64)
+    value: str
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SchemaMigration(SQLModel, table=True):
+    """Применённые миграции (см. migrations.py)."""
+    __tablename__ = "schema_migration"
+
+    version: int = Field(primary_key=True)
+    name: str
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # ================================================================
-# Сессия и инициализация
+# Движок, пул соединений и сессии
 # ================================================================
+# Один движок (и один пул) на URL на весь процесс. Раньше движок создавался
+# на каждый get_session(), и каждый хэндлер платил за новое TCP/asyncpg-подключение.
+_engines: dict[str, AsyncEngine] = {}
+_sessionmakers: dict[str, async_sessionmaker[AsyncSession]] = {}
+
+
+def _engine_kwargs(db_url: str) -> dict:
+    kwargs: dict = {"echo": False, "future": True, "pool_pre_ping": settings.db_pool_pre_ping}
+    # У SQLite свой пул (а для :memory: — StaticPool), размер/recycle там не нужны
+    if not db_url.startswith("sqlite"):
+        kwargs.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    return kwargs
+
+
+def get_engine(db_url: str) -> AsyncEngine:
+    """Ленивый движок на URL: создаётся при первом обращении и живёт до dispose_engines()."""
+    engine = _engines.get(db_url)
+    if engine is None:
+        engine = create_async_engine(db_url, **_engine_kwargs(db_url))
+        _engines[db_url] = engine
+    return engine
+
+
+def get_sessionmaker(db_url: str) -> async_sessionmaker[AsyncSession]:
+    maker = _sessionmakers.get(db_url)
+    if maker is None:
+        maker = async_sessionmaker(get_engine(db_url), class_=AsyncSession, expire_on_commit=False)
+        _sessionmakers[db_url] = maker
+    return maker
+
+
 async def init_db(db_url: str):
-    engine = create_async_engine(db_url, echo=False, future=True)
+    # migrations импортирует модели отсюда, поэтому импорт локальный
+    from migrations import run_migrations
+
+    engine = get_engine(db_url)
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
 
 async def get_session(db_url: str) -> AsyncSession:
-    engine = create_async_engine(db_url, echo=False, future=True)
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    return async_session()
+    return get_sessionmaker(db_url)()
+
+
+async def set_meta(session: AsyncSession, key: str, value: str) -> None:
+    """Upsert Meta[key] в транзакции вызывающего."""
+    insert_fn = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    values = {"value": value, "updated_at": datetime.utcnow()}
+    stmt = insert_fn(Meta).values(key=key, **values)
+    await session.exec(stmt.on_conflict_do_update(index_elements=["key"], set_=values))
+
+
+# Сессия текущего апдейта (ставит DbSessionMiddleware) — для кода, куда её не передать
+# аргументом, например хранилища FSM: его записи попадают в ту же транзакцию.
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+
+def before_commit(session: AsyncSession, hook: Callable[[AsyncSession], Awaitable[None]]) -> None:
+    """Дописать в транзакцию перед коммитом апдейта (вызывает DbSessionMiddleware), один раз."""
+    hooks = session.info.setdefault("before_commit", [])
+    if hook not in hooks:
+        hooks.append(hook)
+
+
+async def run_before_commit(session: AsyncSession) -> None:
+    for hook in session.info.pop("before_commit", []):
+        await hook(session)
+
+
+def after_commit(session: AsyncSession, hook: Callable[[], None]) -> None:
+    """Выполнить после успешного коммита апдейта (обновить кэши процесса); при откате не вызывается."""
+    session.info.setdefault("after_commit", []).append(hook)
+
+
+def run_after_commit(session: AsyncSession) -> None:
+    for hook in session.info.pop("after_commit", []):
+        hook()
+
+
+async def dispose_engines():
+    """Закрываем все пулы (вызывается из shutdown)."""
+    for engine in _engines.values():
+        await engine.dispose()
+    _engines.clear()
+    _sessionmakers.clear()
@@ -0,0 +1,255 @@
+# fsm_storage.py — хранилище FSM aiogram, общее для всех воркеров (FSM_STORAGE)
+#
+#   memory            — как раньше, в памяти процесса (состояние теряется при рестарте)
+#   sql               — таблица fsm_state в DATABASE_URL (по умолчанию)
+#   redis://host:6379 — Redis или совместимый сервер (KeyDB, Dragonfly, Valkey); нужен пакет redis
+#
+# FSM_WRITE_BACK_SEC > 0 добавляет поверх in-process кэш с отложенной записью.
+# Кэш у каждого процесса свой, поэтому при нескольких воркерах его не включаем.
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from cache import TTLCache
+from config import settings
+from db import FsmRecord, before_commit, current_session, get_sessionmaker
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+def _upsert(dialect_name: str, key: str, **values):
+    insert_fn = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    values["updated_at"] = datetime.utcnow()
+    # новая строка получает и вторую колонку (state=None / data={}), существующая — только переданные
+    stmt = insert_fn(FsmRecord).values(key=key, **{"state": None, "data": {}, **values})
+    return stmt.on_conflict_do_update(index_elements=["key"], set_=values)
+
+
+# буфер SQLStorage в session.info апдейта: key -> {"state": …, "data": …, "dirty": {"state", "data"}}
+_BUFFER = "fsm_buffer"
+
+
+async def _flush(session) -> None:
+    """Хук перед коммитом апдейта: один upsert на изменённый ключ, только изменённые части."""
+    for key, entry in session.info.pop(_BUFFER, {}).items():
+        if entry["dirty"]:
+            values = {part: entry[part] for part in entry["dirty"]}
+            await session.exec(_upsert(session.bind.dialect.name, key, **values))
+
+
+class SQLStorage(BaseStorage):
+    """
+    Одна строка на ключ: state + data (JSON).
+    Внутри апдейта работаем в его сессии (db.current_session): строка читается одним SELECT
+    при первом обращении, изменения копятся в session.info и пишутся одним upsert на ключ
+    перед коммитом апдейта (db.before_commit) — вместе с данными хэндлера.
+    Вне апдейта — своя короткая транзакция на каждый вызов.
+    """
+
+    def __init__(self, db_url: str, key_builder: Optional[KeyBuilder] = None) -> None:
+        self.db_url = db_url
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    @asynccontextmanager
+    async def _own_session(self):
+        async with get_sessionmaker(self.db_url)() as session:
+            yield session
+            await session.commit()
+
+    async def _load(self, session, key: str) -> tuple[Optional[str], dict]:
+        row = (await session.exec(
+            select(FsmRecord.state, FsmRecord.data).where(FsmRecord.key == key)
+        )).first()
+        return (row[0], dict(row[1] or {})) if row is not None else (None, {})
+
+    async def _entry(self, session, key: str, part: Optional[str] = None) -> dict:
+        """Буфер ключа в сессии апдейта; part — нужна прочитанная часть (строка читается не больше раза)."""
+        buffer = session.info.get(_BUFFER)
+        if buffer is None:
+            buffer = session.info[_BUFFER] = {}
+            before_commit(session, _flush)
+        entry = buffer.setdefault(key, {"dirty": set()})
+        if part is not None and part not in entry:
+            state, data = await self._load(session, key)
+            entry.setdefault("state", state)
+            entry.setdefault("data", data)
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        session = current_session.get()
+        if session is None:
+            async with self._own_session() as own:
+                await own.exec(_upsert(own.bind.dialect.name, storage_key, state=_state_name(state)))
+            return
+        entry = await self._entry(session, storage_key)
+        entry["state"] = _state_name(state)
+        entry["dirty"].add("state")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        storage_key = self.key_builder.build(key)
+        session = current_session.get()
+        if session is None:
+            async with self._own_session() as own:
+                return (await self._load(own, storage_key))[0]
+        return (await self._entry(session, storage_key, "state"))["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        session = current_session.get()
+        if session is None:
+            async with self._own_session() as own:
+                await own.exec(_upsert(own.bind.dialect.name, storage_key, data=data))
+            return
+        entry = await self._entry(session, storage_key)
+        entry["data"] = copy.copy(data)
+        entry["dirty"].add("data")
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        storage_key = self.key_builder.build(key)
+        session = current_session.get()
+        if session is None:
+            async with self._own_session() as own:
+                return (await self._load(own, storage_key))[1]
+        return copy.copy((await self._entry(session, storage_key, "data"))["data"])
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        storage_key = self.key_builder.build(key)
+        session = current_session.get()
+        if session is None:
+            # чтение и запись в одной транзакции; на Postgres строка блокируется (SELECT ... FOR UPDATE)
+            async with self._own_session() as own:
+                current = (await own.exec(
+                    select(FsmRecord.data).where(FsmRecord.key == storage_key).with_for_update()
+                )).first()
+                merged = {**(current or {}), **data}
+                await own.exec(_upsert(own.bind.dialect.name, storage_key, data=merged))
+            return merged.copy()
+        entry = await self._entry(session, storage_key, "data")
+        entry["data"] = {**entry["data"], **data}
+        entry["dirty"].add("data")
+        return entry["data"].copy()
+
+    async def close(self) -> None:
+        # движок общий с остальным приложением — закрывается в db.dispose_engines()
+        pass
+
+
+class WriteBackStorage(BaseStorage):
+    """
+    In-process кэш поверх любого хранилища: чтения — из памяти, записи копятся и
+    уходят во внутреннее хранилище пачкой раз в flush_interval секунд и при close().
+    Не потокобезопасен и не согласован между процессами — только для одного воркера.
+    """
+
+    def __init__(self, inner: BaseStorage, flush_interval: float, maxsize: int = 10000) -> None:
+        self.inner = inner
+        self.flush_interval = flush_interval
+        # (key, "state" | "data") -> значение; грязные записи лежат в _dirty до сброса
+        self._cache: TTLCache[tuple[StorageKey, str], Any] = TTLCache(maxsize=maxsize, ttl=None)
+        self._dirty: dict[tuple[StorageKey, str], Any] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = asyncio.Event()
+
+    def _put(self, key: StorageKey, part: str, value: Any) -> None:
+        self._cache.set((key, part), value)
+        self._dirty[(key, part)] = value
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _get(self, key: StorageKey, part: str, load) -> Any:
+        if (key, part) in self._dirty:
+            return self._dirty[(key, part)]
+        value = self._cache.get((key, part), _MISSING)
+        if value is _MISSING:
+            value = await load(key)
+            self._cache.set((key, part), value)
+        return value
+
+    async def _flush_later(self) -> None:
+        # задача унаследовала контекст апдейта — его сессия к моменту сброса уже закрыта
+        current_session.set(None)
+        try:
+            await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self._dirty = self._dirty, {}
+        try:
+            while pending:
+                (key, part), value = next(iter(pending.items()))
+                try:
+                    if part == "state":
+                        await self.inner.set_state(key, value)
+                    else:
+                        await self.inner.set_data(key, value)
+                except Exception:
+                    log.exception("FSM write-back failed for %s", key)
+                    self._dirty.setdefault((key, part), value)
+                del pending[(key, part)]
+        finally:
+            # отмена посреди сброса — недописанное вернётся в очередь
+            for entry, value in pending.items():
+                self._dirty.setdefault(entry, value)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._put(key, "state", _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(key, "state", self.inner.get_state)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._put(key, "data", copy.copy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.copy(await self._get(key, "data", self.inner.get_data))
+
+    async def close(self) -> None:
+        # не отменяем сброс посреди записи — будим его и дожидаемся
+        self._closing.set()
+        if self._flusher is not None:
+            await self._flusher
+        current_session.set(None)
+        await self.flush()
+        await self.inner.close()
+
+
+def create_storage(spec: Optional[str] = None) -> BaseStorage:
+    """FSM_STORAGE -> хранилище для Dispatcher(storage=...)."""
+    spec = (spec or settings.fsm_storage).strip()
+    if spec == "memory":
+        return MemoryStorage()
+    if spec == "sql":
+        storage: BaseStorage = SQLStorage(settings.database_url)
+    elif spec.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis://… требует пакет redis (pip install redis)") from e
+        storage = RedisStorage.from_url(spec)
+    else:
+        raise RuntimeError(f"Неизвестный FSM_STORAGE: {spec!r} (memory | sql | redis://…)")
+
+    if settings.fsm_write_back_sec > 0:
+        storage = WriteBackStorage(storage, settings.fsm_write_back_sec)
+    return storage
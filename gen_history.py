@@ -0,0 +1,265 @@
+# gen_history.py — синтетическая история тренировок для проверки отчётов на больших данных
+#
+#   python gen_history.py --users 2000 --days 365                # ~1.5 млн подходов
+#   DATABASE_URL=postgresql://… python gen_history.py --users 20000 --days 1095
+#   python gen_history.py --users 500 --time-reports 12           # плюс замер _aggregate по периодам
+#
+# Пользователи получают разную «дисциплину» (от 1 до 6 тренировок в неделю, с перерывами),
+# силовые веса растут со временем, повторы 5–15, часть тренировок — с кардио.
+# Запись — пачками executemany (insertmanyvalues на SQLite и Postgres), id тренировок проставляем
+# сами, в конце свод DailyStats и личные рекорды пересобираются INSERT … SELECT (rollups.py, records.py).
+# Все сгенерированные пользователи имеют tg_id >= TG_ID_BASE — их легко найти и удалить.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, insert, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from catalog import ExerciseInfo, load_catalog
+from db import User, Workout, WorkoutItem
+
+TG_ID_BASE = 9_000_000_000
+
+# кг для «среднего» пользователя в начале; по slug, иначе — по умолчанию
+_BASE_WEIGHT = {"bench_press": 50.0, "back_squat": 60.0, "lat_pulldown": 40.0}
+_DEFAULT_WEIGHT = 30.0
+# км/ч для тренажёров с дистанцией; None — только время
+_CARDIO_SPEED: dict[str, Optional[tuple[float, float]]] = {
+    "treadmill": (7.5, 11.0),
+    "bike": (18.0, 28.0),
+    "rower": (10.0, 14.0),
+    "elliptical": (7.0, 10.0),
+    "jump_rope": None,
+}
+_DEFAULT_SPEED = (6.0, 10.0)
+
+
+class HistoryGenerator:
+    def __init__(
+        self,
+        strength: list[ExerciseInfo],
+        cardio: list[ExerciseInfo],
+        days: int,
+        rng: random.Random,
+    ) -> None:
+        self.strength = strength
+        self.cardio = cardio
+        self.days = days
+        self.rng = rng
+        self.now = datetime.utcnow().replace(microsecond=0)
+
+    def user_row(self, user_id: int) -> dict:
+        rng = self.rng
+        gender = rng.choice(("male", "female"))
+        return {
+            "id": user_id,
+            "tg_id": TG_ID_BASE + user_id,
+            "name": f"synthetic {user_id}",
+            "gender": gender,
+            "age": rng.randint(18, 60),
+            "height_cm": int(rng.gauss(178 if gender == "male" else 166, 7)),
+            "weight_kg": round(rng.gauss(80 if gender == "male" else 63, 10), 1),
+        }
+
+    def workouts(self, user_id: int, next_workout_id: int) -> tuple[list[dict], list[dict]]:
+        """Тренировки и подходы одного пользователя за его активный период."""
+        rng = self.rng
+        per_week = min(6.0, max(0.5, rng.lognormvariate(1.0, 0.5)))     # медиана ~2.7
+        strength_factor = rng.lognormvariate(0.0, 0.3)
+        favourite = rng.sample(self.strength, k=min(len(self.strength), rng.randint(2, 6)))
+        machines = rng.sample(self.cardio, k=min(len(self.cardio), rng.randint(1, 3))) if self.cardio else []
+        cardio_share = rng.choice((0.0, 0.2, 0.4, 0.8))
+        # кто-то с нами с самого начала, кто-то пришёл недавно
+        start = rng.randint(0, max(0, self.days - 7))
+
+        workouts: list[dict] = []
+        items: list[dict] = []
+        day = start
+        while day < self.days:
+            progress = 1.0 + 0.25 * (day - start) / 365.0
+            started = self.now - timedelta(days=self.days - day) + timedelta(
+                hours=rng.randint(6, 21), minutes=rng.randint(0, 59)
+            )
+            if started >= self.now:
+                break
+            wid = next_workout_id + len(workouts)
+            ts = started
+            for ex in rng.sample(favourite, k=rng.randint(1, len(favourite))):
+                base = _BASE_WEIGHT.get(ex.slug, _DEFAULT_WEIGHT) * strength_factor * progress
+                for _ in range(rng.randint(3, 5)):
+                    ts += timedelta(seconds=rng.randint(60, 240))
+                    weight = max(2.5, round(rng.gauss(base, base * 0.08) / 2.5) * 2.5)
+                    items.append({
+                        "workout_id": wid, "exercise_id": ex.id, "created_at": ts,
+                        "weight": weight, "reps": rng.randint(5, 15),
+                        "duration_sec": None, "distance_m": None,
+                    })
+            if machines and rng.random() < cardio_share:
+                ex = rng.choice(machines)
+                minutes = rng.randint(10, 45)
+                speed = _CARDIO_SPEED.get(ex.slug, _DEFAULT_SPEED)
+                ts += timedelta(minutes=minutes)
+                items.append({
+                    "workout_id": wid, "exercise_id": ex.id, "created_at": ts,
+                    "weight": None, "reps": None,
+                    "duration_sec": minutes * 60,
+                    "distance_m": round(minutes / 60 * rng.uniform(*speed) * 1000) if speed else None,
+                })
+            workouts.append({
+                "id": wid, "user_id": user_id, "title": started.strftime("%Y-%m-%d %H:%M"),
+                "created_at": started, "finished_at": ts + timedelta(minutes=5),
+            })
+
+            # следующая тренировка: в среднем per_week в неделю, иногда перерыв на пару недель
+            day += max(1, round(rng.expovariate(per_week / 7.0)))
+            if rng.random() < 0.02:
+                day += rng.randint(7, 30)
+        return workouts, items
+
+
+async def _max_id(session: AsyncSession, model) -> int:
+    return (await session.exec(select(func.coalesce(func.max(model.id), 0)))).one()
+
+
+async def _sync_sequences(session: AsyncSession) -> None:
+    """Postgres: id проставляли сами — двигаем последовательности вперёд."""
+    if session.bind.dialect.name != "postgresql":
+        return
+    for table in ("user", "workout"):
+        await session.exec(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+        ))
+
+
+async def generate(
+    session: AsyncSession,
+    users: int,
+    days: int,
+    seed: int = 1,
+    chunk: int = 5000,
+    progress: bool = True,
+) -> dict:
+    """Записать историю users пользователей за days дней; возвращает счётчики."""
+    from records import rebuild_records
+    from rollups import rebuild_daily_stats
+
+    rng = random.Random(seed)
+    cat = await load_catalog(session)
+    gen = HistoryGenerator(cat.exercises("strength"), cat.exercises("cardio"), days, rng)
+    if not gen.strength:
+        raise RuntimeError("В справочнике нет силовых упражнений — сначала сид или catalog_import.py")
+
+    user_id = await _max_id(session, User)
+    workout_id = await _max_id(session, Workout) + 1
+    counts = {"users": 0, "workouts": 0, "items": 0}
+    user_rows: list[dict] = []
+    workout_rows: list[dict] = []
+    item_rows: list[dict] = []
+
+    async def flush() -> None:
+        # порядок важен из-за внешних ключей
+        for model, rows in ((User, user_rows), (Workout, workout_rows), (WorkoutItem, item_rows)):
+            if rows:
+                await session.exec(insert(model), params=rows)
+                rows.clear()
+        await session.commit()
+
+    started = last_report = time.perf_counter()
+    for _ in range(users):
+        user_id += 1
+        user_rows.append(gen.user_row(user_id))
+        ws, items = gen.workouts(user_id, workout_id)
+        workout_id += len(ws)
+        workout_rows.extend(ws)
+        item_rows.extend(items)
+        counts["users"] += 1
+        counts["workouts"] += len(ws)
+        counts["items"] += len(items)
+        if len(item_rows) >= chunk:
+            await flush()
+            if progress and time.perf_counter() - last_report >= 5:
+                last_report = time.perf_counter()
+                rate = counts["items"] / (last_report - started)
+                print(f"  {counts['users']}/{users} users, {counts['items']} sets ({rate:,.0f} sets/s)")
+    await flush()
+    await _sync_sequences(session)
+
+    rebuild_started = time.perf_counter()
+    await rebuild_daily_stats(session)
+    await rebuild_records(session)
+    await session.commit()
+    counts["rollup_sec"] = round(time.perf_counter() - rebuild_started, 2)
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+async def time_reports(session: AsyncSession, sample: int, repeat: int = 3) -> list[dict]:
+    """_aggregate по периодам для пользователей с разной длиной истории (лучшее из repeat)."""
+    from report_cache import PERIODS
+    from routers.reports import _aggregate, _since_for
+
+    sizes = (await session.exec(
+        select(Workout.user_id, func.count(WorkoutItem.id))
+        .join(WorkoutItem, WorkoutItem.workout_id == Workout.id)
+        .group_by(Workout.user_id)
+        .order_by(func.count(WorkoutItem.id))
+    )).all()
+    if not sizes:
+        return []
+    # равномерно по квантилям размера истории, включая самого «тяжёлого»
+    picks = sorted({min(len(sizes) - 1, round(i * (len(sizes) - 1) / max(1, sample - 1))) for i in range(sample)})
+    results = []
+    for idx in picks:
+        user_id, n_items = sizes[idx]
+        row = {"user_id": user_id, "sets": n_items}
+        for period in PERIODS:
+            best = float("inf")
+            for _ in range(repeat):
+                t = time.perf_counter()
+                await _aggregate(session, user_id, _since_for(period))
+                best = min(best, time.perf_counter() - t)
+            row[f"{period}_ms"] = round(best * 1000, 2)
+        results.append(row)
+    return results
+
+
+async def main():
+    from config import settings
+    from db import dispose_engines, get_session
+    from startup import prepare_db
+
+    parser = argparse.ArgumentParser(description="Синтетическая история тренировок")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk", type=int, default=5000, help="подходов на пачку записи")
+    parser.add_argument("--time-reports", type=int, default=0, metavar="N",
+                        help="замерить _aggregate для N пользователей с разной длиной истории")
+    args = parser.parse_args()
+
+    await prepare_db(settings.database_url)
+    async with await get_session(settings.database_url) as session:
+        if args.users > 0:
+            counts = await generate(session, args.users, args.days, seed=args.seed, chunk=args.chunk)
+            print(
+                f"Сгенерировано: {counts['users']} пользователей, {counts['workouts']} тренировок, "
+                f"{counts['items']} подходов за {counts['seconds']} с (свод DailyStats и рекорды — {counts['rollup_sec']} с)"
+            )
+        if args.time_reports:
+            rows = await time_reports(session, args.time_reports)
+            print(f"{'user':>8} {'sets':>8} {'weekly ms':>10} {'monthly ms':>11} {'alltime ms':>11}")
+            for r in rows:
+                print(f"{r['user_id']:>8} {r['sets']:>8} {r['weekly_ms']:>10} {r['monthly_ms']:>11} {r['alltime_ms']:>11}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+# health.py — пробы для /livez и /readyz
+#
+# /livez — процесс жив и цикл событий отвечает (рестартовать, только если не отвечает).
+# /readyz — инстанс может принимать трафик: БД отвечает на пинг из общего пула,
+# цикл событий не тормозит, очередь апдейтов не забита, хранилище FSM доступно.
+# Каждая проверка ограничена READY_TIMEOUT_SEC и отдаёт свою задержку.
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from sqlalchemy import text
+
+from config import settings
+from db import get_engine
+
+log = logging.getLogger(__name__)
+
+# ключ, которого не бывает у живых пользователей — только чтение
+_PROBE_KEY = StorageKey(bot_id=0, chat_id=0, user_id=0)
+
+
+class LoopLagMonitor:
+    """Раз в interval засыпаем на interval и меряем, на сколько проснулись позже."""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+async def _timed(check: Callable[[], Awaitable[dict]], timeout: float) -> dict:
+    """Результат проверки + ok + latency_ms; таймаут и исключение — ok=False."""
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(check(), timeout)
+    except asyncio.TimeoutError:
+        result = {"ok": False, "error": f"timeout {timeout}s"}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+async def check_db(db_url: str) -> dict:
+    # тот же пул, что у хэндлеров: если он исчерпан, пинг упрётся в таймаут
+    async with get_engine(db_url).connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return {"ok": True}
+
+
+async def check_storage(storage: BaseStorage) -> dict:
+    # у write-back хранилища чтение может прийти из памяти — спрашиваем нижнее
+    inner = getattr(storage, "inner", storage)
+    await inner.get_state(_PROBE_KEY)
+    return {"ok": True, "storage": type(inner).__name__}
+
+
+async def readiness(
+    storage: BaseStorage,
+    lag: LoopLagMonitor,
+    pending: int,
+    in_flight: int,
+) -> tuple[bool, dict]:
+    """Все проверки параллельно; (готов ли, отчёт по каждой)."""
+    timeout = settings.ready_timeout_sec
+
+    async def check_loop() -> dict:
+        return {"ok": lag.lag <= settings.ready_max_loop_lag, "lag_ms": round(lag.lag * 1000, 2)}
+
+    async def check_updates() -> dict:
+        return {"ok": pending <= settings.ready_max_pending, "pending": pending, "in_flight": in_flight}
+
+    names = ("db", "event_loop", "updates", "fsm_storage")
+    results = await asyncio.gather(
+        _timed(lambda: check_db(settings.database_url), timeout),
+        _timed(check_loop, timeout),
+        _timed(check_updates, timeout),
+        _timed(lambda: check_storage(storage), timeout),
+    )
+    checks = dict(zip(names, results))
+    ok = all(r["ok"] for r in results)
+    if not ok:
+        log.warning("not ready: %s", {k: v for k, v in checks.items() if not v["ok"]})
+    return ok, checks
@@ -0,0 +1,65 @@
+# last_set.py — последний подход пользователя в упражнении: подсказка «прошлый раз» и «🔁» на карточке
+#
+# Источник — PersonalRecord.last_weight / last_reps (обновляются тем же upsert, что и рекорды),
+# поверх — in-process кэш (user_id, exercise_id): запись подхода кладёт его сюда после коммита апдейта,
+# промах — одно чтение по первичному ключу.
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import TTLCache
+from config import settings
+from db import PersonalRecord, WorkoutItem, after_commit
+
+
+@dataclass(frozen=True)
+class LastSet:
+    weight: float
+    reps: int
+    workout_id: int
+    at: datetime
+
+
+# (user_id, exercise_id) -> LastSet. Упражнения без подходов не кэшируем: первый подход положит сам.
+_cache: TTLCache[tuple[int, int], LastSet] = TTLCache(
+    maxsize=settings.last_set_cache_size, ttl=settings.last_set_cache_ttl
+)
+
+
+async def get_last_set(session: AsyncSession, user_id: int, exercise_id: int) -> Optional[LastSet]:
+    last = _cache.get((user_id, exercise_id))
+    if last is not None:
+        return last
+    row = (await session.exec(
+        select(
+            PersonalRecord.last_weight,
+            PersonalRecord.last_reps,
+            PersonalRecord.session_workout_id,
+            PersonalRecord.updated_at,
+        ).where(PersonalRecord.user_id == user_id, PersonalRecord.exercise_id == exercise_id)
+    )).first()
+    if row is None or row[0] is None or row[1] is None:
+        return None
+    last = LastSet(float(row[0]), int(row[1]), int(row[2]), row[3])
+    _cache.set((user_id, exercise_id), last)
+    return last
+
+
+def remember_last_set(session: AsyncSession, user_id: int, item: WorkoutItem) -> None:
+    """
+    Вызывается из workout_log.log_item для силовых подходов. В кэш — только после коммита
+    (db.after_commit): при откате «прошлый раз» и «🔁» не покажут несохранённый подход.
+    """
+    if item.weight and item.reps:
+        key = (user_id, item.exercise_id)
+        last = LastSet(float(item.weight), int(item.reps), item.workout_id, item.created_at)
+        after_commit(session, lambda: _cache.set(key, last))
+
+
+def stats() -> dict:
+    return {"size": len(_cache), "hits": _cache.hits, "misses": _cache.misses}
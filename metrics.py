@@ -0,0 +1,264 @@
+# metrics.py — метрики в текстовом формате Prometheus (GET /metrics), без внешних зависимостей
+#
+#   bot_updates_total / bot_update_seconds          — пропускная способность и время апдейта целиком
+#   bot_handler_seconds{router,handler}             — время конкретного хэндлера (какой тап тормозит)
+#   bot_db_queries_per_update / bot_db_seconds_per_update — SQL на апдейт (события SQLAlchemy)
+#   bot_telegram_requests_total / _seconds / _errors_total{method} — вызовы Bot API
+# Счётчики живут в процессе: у каждого воркера свои, Prometheus суммирует сам.
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+# секунды: от быстрых тапов до зависших запросов
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_fmt_labels(self.labels, labels)} {_fmt_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (не накопленные)..., +Inf], сумма, количество
+        self._series: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, (total, count)) in sorted(self._series.items()):
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = "+Inf" if bound == float("inf") else _fmt_value(bound)
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, labels, le_label)} {acc}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, labels)} {_fmt_value(round(total, 6))}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, labels)} {count}"
+
+
+class Gauge:
+    """Значение снимается при каждом scrape: fn() -> число."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]) -> None:
+        self.name, self.help, self.fn = name, help, fn
+
+    def samples(self) -> Iterable[str]:
+        yield f"{self.name} {_fmt_value(self.fn())}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Any] = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Labels = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, help, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPDATES = registry.counter("bot_updates_total", "Обработанные апдейты", ("type", "outcome"))
+UPDATE_SECONDS = registry.histogram("bot_update_seconds", "Время апдейта целиком (middleware + хэндлер)", ("type",))
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Время хэндлера", ("router", "handler"))
+HANDLER_ERRORS = registry.counter("bot_handler_errors_total", "Исключения в хэндлерах", ("router", "handler"))
+DB_QUERIES = registry.counter("bot_db_queries_total", "SQL-запросы (все, не только в апдейтах)")
+DB_QUERIES_PER_UPDATE = registry.histogram(
+    "bot_db_queries_per_update", "SQL-запросов на апдейт", ("type",), buckets=COUNT_BUCKETS
+)
+DB_SECONDS_PER_UPDATE = registry.histogram("bot_db_seconds_per_update", "Время SQL на апдейт", ("type",))
+TG_REQUESTS = registry.counter("bot_telegram_requests_total", "Вызовы Bot API", ("method",))
+TG_SECONDS = registry.histogram("bot_telegram_request_seconds", "Время вызова Bot API", ("method",))
+TG_ERRORS = registry.counter("bot_telegram_errors_total", "Ошибки Bot API", ("method", "error"))
+
+
+# ===================== SQL на апдейт =====================
+@dataclass
+class _DbUsage:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+# заводит UpdateMetricsMiddleware; SQLAlchemy выполняет запросы в том же контексте
+_db_usage: ContextVar[Optional[_DbUsage]] = ContextVar("metrics_db_usage", default=None)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    DB_QUERIES.inc()
+    usage = _db_usage.get()
+    if usage is not None:
+        usage.queries += 1
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            usage.seconds += time.perf_counter() - started
+
+
+def _install_db_events() -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+
+
+# ===================== Middleware =====================
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний на dp.update, самый первый: в замер попадают сессия БД, коммит и все хэндлеры."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        etype = event.event_type if isinstance(event, Update) else type(event).__name__
+        usage = _DbUsage()
+        token = _db_usage.set(usage)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "unhandled" if result is UNHANDLED else "ok"
+            return result
+        finally:
+            _db_usage.reset(token)
+            UPDATES.inc(etype, outcome)
+            UPDATE_SECONDS.observe(etype, value=time.perf_counter() - started)
+            DB_QUERIES_PER_UPDATE.observe(etype, value=usage.queries)
+            DB_SECONDS_PER_UPDATE.observe(etype, value=usage.seconds)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний на наблюдателях роутеров: вызывается только для сработавшего хэндлера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        router = data.get("event_router")
+        handler_obj = data.get("handler")
+        labels = (
+            getattr(router, "name", "?"),
+            getattr(getattr(handler_obj, "callback", None), "__name__", "?"),
+        )
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(*labels, value=time.perf_counter() - started)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Каждый HTTP-вызов Bot API; подключается после RateLimiter — ожидание бакета не считается."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        TG_REQUESTS.inc(api_method)
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TG_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            TG_SECONDS.observe(api_method, value=time.perf_counter() - started)
+
+
+def setup_metrics(dp: Dispatcher, bot: "Bot") -> None:
+    """Внутренние middleware диспетчера наследуются вложенными роутерами — хватает повесить на dp."""
+    _install_db_events()
+    handler_mw = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(handler_mw)
+    bot.session.middleware(TelegramMetricsMiddleware())
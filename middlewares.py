@@ -0,0 +1,87 @@
+# middlewares.py — общие middleware диспетчера (подключаются и в server.py, и в bot.py)
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, User as TgUser
+
+from config import settings
+from db import current_session, get_session, run_after_commit, run_before_commit
+from metrics import UpdateMetricsMiddleware
+from sql_trace import SqlTraceMiddleware
+from user_context import invalidate_user, load_user_context
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна AsyncSession на апдейт: кладём её в data["session"], хэндлеры и хелперы
+    работают через неё (и хранилище FSM — через db.current_session).
+    Коммит — один раз в конце, перед ним — хуки db.before_commit, после — db.after_commit;
+    при исключении — откат, хуки after_commit не вызываются.
+    """
+
+    def __init__(self, db_url: str) -> None:
+        self.db_url = db_url
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with await get_session(self.db_url) as session:
+            data["session"] = session
+            token = current_session.set(session)
+            try:
+                result = await handler(event, data)
+                await run_before_commit(session)
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                current_session.reset(token)
+            await session.commit()
+            run_after_commit(session)
+            return result
+
+
+class CurrentUserMiddleware(BaseMiddleware):
+    """
+    Резолвим tg_id -> UserContext (id пользователя, профиль, текущая тренировка)
+    один раз на апдейт и кладём в data["user_ctx"] (None — пользователь ещё не прошёл /start).
+    Должен стоять после DbSessionMiddleware: берёт её сессию.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user: TgUser | None = data.get("event_from_user")
+        if tg_user is None:
+            data["user_ctx"] = None
+            return await handler(event, data)
+
+        data["user_ctx"] = await load_user_context(data["session"], tg_user.id)
+        try:
+            return await handler(event, data)
+        except Exception:
+            # транзакция откатится — кэш мог успеть получить несохранённые изменения
+            invalidate_user(tg_user.id)
+            raise
+
+
+def setup_middlewares(dp: Dispatcher) -> None:
+    # первым — замер апдейта целиком (вместе с сессией и коммитом), см. metrics.py
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if settings.sql_trace:
+        dp.update.outer_middleware(SqlTraceMiddleware())
+    dp.update.outer_middleware(DbSessionMiddleware(settings.database_url))
+    # FSMContextMiddleware диспетчер регистрирует сам, раньше наших, и он сразу читает состояние.
+    # Переставляем его внутрь DbSessionMiddleware — SQLStorage работает в сессии апдейта
+    if dp.fsm in dp.update.outer_middleware:
+        dp.update.outer_middleware.unregister(dp.fsm)
+        dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(CurrentUserMiddleware())
@@ -0,0 +1,97 @@
+# migrations.py — версионированные миграции схемы для уже развёрнутых баз (SQLite и Postgres)
+#
+# create_all создаёт только отсутствующие таблицы: новые колонки и индексы в старых
+# таблицах сами не появятся. Каждая миграция идемпотентна (на свежей базе create_all
+# уже всё создал), применяется один раз и записывается в schema_migration.
+from __future__ import annotations
+
+import logging
+from typing import Callable
+
+from sqlalchemy import Table, inspect, insert, select, text
+from sqlalchemy.engine import Connection
+
+from db import SchemaMigration, Workout, WorkoutItem
+from records import rebuild_statements as rebuild_records
+from rollups import rebuild_statements
+
+log = logging.getLogger(__name__)
+
+# Произвольная константа для pg_advisory_xact_lock: воркеры стартуют параллельно
+_PG_LOCK_ID = 0x67_74_62_01
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    cols = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in cols:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _create_indexes(conn: Connection, table: Table) -> None:
+    """Индексы, объявленные в модели (__table_args__), которых ещё нет в базе."""
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _m1_workout_finished_at(conn: Connection) -> None:
+    _add_column(conn, "workout", "finished_at", "TIMESTAMP")
+
+
+def _m2_workout_indexes(conn: Connection) -> None:
+    _create_indexes(conn, Workout.__table__)
+    _create_indexes(conn, WorkoutItem.__table__)
+
+
+def _m3_daily_stats_backfill(conn: Connection) -> None:
+    # таблицу создал create_all; заполняем свод из уже накопленной истории
+    for stmt in rebuild_statements():
+        conn.execute(stmt)
+
+
+def _m4_personal_records_backfill(conn: Connection) -> None:
+    for stmt in rebuild_records():
+        conn.execute(stmt)
+
+
+def _m5_personal_record_last_set(conn: Connection) -> None:
+    _add_column(conn, "personal_record", "last_weight", "FLOAT")
+    _add_column(conn, "personal_record", "last_reps", "INTEGER")
+    for stmt in rebuild_records():
+        conn.execute(stmt)
+
+
+def _m6_daily_stats_best_e1rm(conn: Connection) -> None:
+    _add_column(conn, "dailystats", "best_e1rm", "FLOAT")
+    for stmt in rebuild_statements():
+        conn.execute(stmt)
+
+
+# (версия, имя, функция) — только дописываем в конец, не меняем уже выпущенные
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "workout_finished_at", _m1_workout_finished_at),
+    (2, "workout_item_indexes", _m2_workout_indexes),
+    (3, "daily_stats_backfill", _m3_daily_stats_backfill),
+    (4, "personal_records_backfill", _m4_personal_records_backfill),
+    (5, "personal_record_last_set", _m5_personal_record_last_set),
+    (6, "daily_stats_best_e1rm", _m6_daily_stats_best_e1rm),
+]
+
+
+def run_migrations(conn: Connection) -> list[int]:
+    """Применяем недостающие миграции в текущей транзакции; возвращаем их версии."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _PG_LOCK_ID})
+
+    table = SchemaMigration.__table__
+    table.create(conn, checkfirst=True)
+    applied = set(conn.execute(select(table.c.version)).scalars())
+
+    done = []
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        fn(conn)
+        conn.execute(insert(table).values(version=version, name=name))
+        log.info("migration %s (%s) applied", version, name)
+        done.append(version)
+    return done
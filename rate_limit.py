@@ -0,0 +1,151 @@
+# rate_limit.py — исходящие запросы к Telegram через token bucket (middleware сессии Bot)
+#
+# Лимиты Telegram: ~30 сообщений/с на бота и ~1/с на чат (короткие всплески допустимы).
+# Вместо 429 запросы ждут своей очереди:
+#   send*/edit*/copy*/forward* — глобальный бакет + бакет чата;
+#   delete* — косметика: только глобальный бакет и только если после них остаётся запас
+#            для правок/отправок, поэтому при нагрузке удаления откладываются первыми;
+#   остальное (answerCallbackQuery, get*, set*) — без ограничений.
+# TelegramRetryAfter — ждём retry_after, «замораживаем» бакет чата и повторяем.
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from cache import TTLCache
+from config import settings
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+log = logging.getLogger(__name__)
+
+_SEND_PREFIXES = ("send", "edit", "copy", "forward")
+_LOW_PREFIXES = ("delete",)
+
+# доля глобального бакета, которую удаления не трогают
+_LOW_PRIORITY_HEADROOM = 0.2
+
+
+class TokenBucket:
+    """
+    Бакет с резервированием: reserve() сразу списывает токен (баланс может уйти в минус)
+    и возвращает, сколько подождать. acquire_low() берёт токен, только если после него
+    остаётся `floor` токенов, иначе ждёт — так срочные запросы всегда идут раньше.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire_low(self, floor: float) -> None:
+        while True:
+            self._refill()
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((floor + 1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """После 429: ближайшие `seconds` бакет пуст."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class RateLimiter(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int = 3,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.low_floor = global_rate * _LOW_PRIORITY_HEADROOM
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        # простаивающий бакет через burst/rate секунд снова полон — такие можно забыть
+        self._chats: TTLCache[Union[int, str], TokenBucket] = TTLCache(
+            maxsize=50000, ttl=max(60.0, chat_burst / chat_rate)
+        )
+        self.waited = 0.0
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        # продлеваем TTL при каждом обращении
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _throttle(self, api_method: str, chat_id: Optional[Union[int, str]]) -> None:
+        started = time.monotonic()
+        if api_method.startswith(_LOW_PREFIXES):
+            await self.global_bucket.acquire_low(self.low_floor)
+        elif api_method.startswith(_SEND_PREFIXES):
+            delay = self.global_bucket.reserve()
+            if chat_id is not None:
+                delay = max(delay, self._chat_bucket(chat_id).reserve())
+            if delay:
+                await asyncio.sleep(delay)
+        self.waited += time.monotonic() - started
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        chat_id: Any = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            await self._throttle(api_method, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                log.warning("%s: retry after %ss (attempt %d)", api_method, e.retry_after, attempt)
+                if chat_id is not None and api_method.startswith(_SEND_PREFIXES):
+                    # следующий _throttle подождёт вместе со всеми запросами в этот чат
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> dict:
+        return {"waited_sec": round(self.waited, 3), "retries": self.retries, "chats": len(self._chats)}
+
+
+def setup_rate_limit(bot: "Bot") -> RateLimiter:
+    limiter = RateLimiter(
+        global_rate=settings.tg_rate_global,
+        chat_rate=settings.tg_rate_chat,
+        chat_burst=settings.tg_rate_chat_burst,
+        max_retries=settings.tg_retry_max,
+    )
+    bot.session.middleware(limiter)
+    return limiter
@@ -0,0 +1,216 @@
+# records.py — личные рекорды (PersonalRecord) по упражнению: ведутся при записи подхода
+#
+# Каждый силовой подход — один upsert строки (user_id, exercise_id) по первичному ключу,
+# история не сканируется. Пересборка из истории (после ручной правки подходов в базе):
+#   python records.py
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+from sqlalchemy import and_, case, delete, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from analytics import e1rm, e1rm_sql
+from db import PersonalRecord, Workout, WorkoutItem
+
+# виды рекордов: биты PersonalRecord.last_broken
+WEIGHT, REPS, E1RM, SESSION = 1, 2, 4, 8
+
+RECORD_TITLES = {
+    WEIGHT: "вес",
+    REPS: "повторы с рабочим весом",
+    E1RM: "оценка 1ПМ",
+    SESSION: "тоннаж за тренировку",
+}
+
+_EPS = 1e-9
+
+
+def _upsert(dialect_name: str, values: dict):
+    """
+    INSERT ... ON CONFLICT (user_id, exercise_id) DO UPDATE ... RETURNING last_broken.
+    В SET справа — значения строки до обновления, поэтому сравнение «было/стало» и маска побитых
+    рекордов считаются тем же оператором, без отдельного чтения.
+    """
+    insert_fn = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert_fn(PersonalRecord).values(**values)
+    old, new = PersonalRecord.__table__.c, stmt.excluded
+
+    heavier = new.max_weight > old.max_weight
+    more_reps = (new.max_weight == old.max_weight) & (new.max_weight_reps > old.max_weight_reps)
+    stronger = new.best_e1rm > old.best_e1rm + _EPS
+    # тоннаж упражнения в текущей тренировке до и после подхода
+    before = case((old.session_workout_id == new.session_workout_id, old.session_tonnage), else_=0.0)
+    session_tonnage = before + new.session_tonnage
+    session_best = session_tonnage > old.best_session_tonnage + _EPS
+    # рекорд тоннажа — в момент, когда тренировка обогнала прошлую лучшую; дальше она сама и есть лучшая
+    session_record = session_best & (before < old.best_session_tonnage - _EPS)
+
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "exercise_id"],
+        set_={
+            "max_weight": case((heavier, new.max_weight), else_=old.max_weight),
+            "max_weight_reps": case((heavier | more_reps, new.max_weight_reps), else_=old.max_weight_reps),
+            "best_e1rm": case((stronger, new.best_e1rm), else_=old.best_e1rm),
+            "session_workout_id": new.session_workout_id,
+            "session_tonnage": session_tonnage,
+            "last_weight": new.last_weight,
+            "last_reps": new.last_reps,
+            "best_session_tonnage": case((session_best, session_tonnage), else_=old.best_session_tonnage),
+            "last_broken": (
+                case((heavier, WEIGHT), else_=0)
+                + case((more_reps, REPS), else_=0)
+                + case((stronger, E1RM), else_=0)
+                + case((session_record, SESSION), else_=0)
+            ),
+            "updated_at": new.updated_at,
+        },
+    ).returning(PersonalRecord.__table__.c.last_broken)
+
+
+async def apply_item(session: AsyncSession, user_id: int, item: WorkoutItem) -> list[int]:
+    """
+    Обновляем рекорды подходом — один upsert, коммит вместе со вставкой подхода (DbSessionMiddleware).
+    Возвращаем побитые рекорды. Первый подход упражнения задаёт планку, но рекордом не считается.
+    """
+    if not item.weight or not item.reps:
+        return []
+    weight, reps = float(item.weight), int(item.reps)
+    tonnage = weight * reps
+    values = {
+        "user_id": user_id,
+        "exercise_id": item.exercise_id,
+        "max_weight": weight,
+        "max_weight_reps": reps,
+        "best_e1rm": e1rm(weight, reps) or 0.0,
+        "best_session_tonnage": tonnage,
+        "session_workout_id": item.workout_id,
+        "session_tonnage": tonnage,
+        "last_broken": 0,
+        "last_weight": weight,
+        "last_reps": reps,
+        "updated_at": item.created_at,
+    }
+    broken = (await session.exec(_upsert(session.bind.dialect.name, values))).scalar_one()
+    return [kind for kind in RECORD_TITLES if broken & kind]
+
+
+def rebuild_statements(user_id: Optional[int] = None) -> list:
+    """DELETE + INSERT ... SELECT: пересобрать рекорды (целиком или одного пользователя)."""
+    key = (Workout.user_id, WorkoutItem.exercise_id)
+    conds = [WorkoutItem.weight.is_not(None), WorkoutItem.reps.is_not(None), WorkoutItem.weight > 0]
+    if user_id is not None:
+        conds.append(Workout.user_id == user_id)
+
+    # подход с максимальным весом (при равенстве — с большими повторами) получает w_rank = 1,
+    # последний по времени — l_rank = 1
+    items = (
+        select(
+            Workout.user_id,
+            WorkoutItem.exercise_id,
+            WorkoutItem.weight,
+            WorkoutItem.reps,
+            e1rm_sql().label("e1rm"),
+            func.row_number().over(
+                partition_by=key, order_by=(WorkoutItem.weight.desc(), WorkoutItem.reps.desc())
+            ).label("w_rank"),
+            func.row_number().over(partition_by=key, order_by=WorkoutItem.id.desc()).label("l_rank"),
+        )
+        .join(Workout, Workout.id == WorkoutItem.workout_id)
+        .where(*conds)
+        .subquery("items")
+    )
+    best = (
+        select(
+            items.c.user_id,
+            items.c.exercise_id,
+            func.max(case((items.c.w_rank == 1, items.c.weight))).label("max_weight"),
+            func.max(case((items.c.w_rank == 1, items.c.reps))).label("max_weight_reps"),
+            func.coalesce(func.max(items.c.e1rm), 0).label("best_e1rm"),
+            func.max(case((items.c.l_rank == 1, items.c.weight))).label("last_weight"),
+            func.max(case((items.c.l_rank == 1, items.c.reps))).label("last_reps"),
+        )
+        .group_by(items.c.user_id, items.c.exercise_id)
+        .subquery("best")
+    )
+
+    # тоннаж по тренировкам; recent = 1 — последняя тренировка с упражнением
+    sessions = (
+        select(
+            Workout.user_id,
+            WorkoutItem.exercise_id,
+            WorkoutItem.workout_id,
+            func.sum(WorkoutItem.weight * WorkoutItem.reps).label("tonnage"),
+            func.max(WorkoutItem.created_at).label("last_at"),
+            func.row_number().over(partition_by=key, order_by=func.max(WorkoutItem.id).desc()).label("recent"),
+        )
+        .join(Workout, Workout.id == WorkoutItem.workout_id)
+        .where(*conds)
+        .group_by(Workout.user_id, WorkoutItem.exercise_id, WorkoutItem.workout_id)
+        .subquery("sessions")
+    )
+    per_ex = (
+        select(
+            sessions.c.user_id,
+            sessions.c.exercise_id,
+            func.max(sessions.c.tonnage).label("best_session_tonnage"),
+            func.max(case((sessions.c.recent == 1, sessions.c.workout_id))).label("session_workout_id"),
+            func.max(case((sessions.c.recent == 1, sessions.c.tonnage))).label("session_tonnage"),
+            func.max(sessions.c.last_at).label("last_at"),
+        )
+        .group_by(sessions.c.user_id, sessions.c.exercise_id)
+        .subquery("per_ex")
+    )
+
+    rows = select(
+        best.c.user_id,
+        best.c.exercise_id,
+        best.c.max_weight,
+        best.c.max_weight_reps,
+        best.c.best_e1rm,
+        per_ex.c.best_session_tonnage,
+        per_ex.c.session_workout_id,
+        per_ex.c.session_tonnage,
+        best.c.last_weight,
+        best.c.last_reps,
+        per_ex.c.last_at,
+    ).join(per_ex, and_(per_ex.c.user_id == best.c.user_id, per_ex.c.exercise_id == best.c.exercise_id))
+
+    wipe = delete(PersonalRecord)
+    if user_id is not None:
+        wipe = wipe.where(PersonalRecord.user_id == user_id)
+    fill = insert(PersonalRecord).from_select(
+        [
+            "user_id", "exercise_id", "max_weight", "max_weight_reps", "best_e1rm",
+            "best_session_tonnage", "session_workout_id", "session_tonnage",
+            "last_weight", "last_reps", "updated_at",
+        ],
+        rows,
+    )
+    return [wipe, fill]
+
+
+async def rebuild_records(session: AsyncSession, user_id: Optional[int] = None) -> None:
+    for stmt in rebuild_statements(user_id):
+        await session.exec(stmt)
+
+
+async def main():
+    from config import settings
+    from db import dispose_engines, get_session, init_db
+
+    await init_db(settings.database_url)
+    async with await get_session(settings.database_url) as session:
+        await rebuild_records(session)
+        await session.commit()
+        total = (await session.exec(select(func.count()).select_from(PersonalRecord))).one()
+    await dispose_engines()
+    print(f"PersonalRecord rebuilt: {total} rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
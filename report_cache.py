@@ -0,0 +1,42 @@
+# report_cache.py — готовые тексты отчётов по (tg_id, период), сброс при записи подхода
+from __future__ import annotations
+
+from typing import Optional
+
+from cache import TTLCache
+from config import settings
+
+PERIODS = ("weekly", "monthly", "alltime")
+
+# Скользящие окна 7/30 дней «съезжают» со временем — живут REPORT_CACHE_TTL.
+# «Весь период» меняется только от новых подходов, поэтому держим его дольше — REPORT_ALLTIME_CACHE_TTL.
+# Сброс при подходе — только в своём процессе: подход, записанный другим воркером, пересборка свода
+# и рекордов (rollups.py, records.py) или переименование упражнений через catalog_import.py
+# видны в отчёте с опозданием до TTL соответствующего периода.
+
+_cache: TTLCache[tuple[int, str], str] = TTLCache(
+    maxsize=settings.report_cache_size, ttl=settings.report_cache_ttl
+)
+
+
+def get_report(tg_id: int, period: str) -> Optional[str]:
+    if period not in PERIODS:
+        return None
+    return _cache.get((tg_id, period))
+
+
+def put_report(tg_id: int, period: str, text: str) -> None:
+    if period not in PERIODS:
+        return
+    ttl = settings.report_alltime_cache_ttl if period == "alltime" else None
+    _cache.set((tg_id, period), text, ttl=ttl)
+
+
+def invalidate_reports(tg_id: int) -> None:
+    """Новый подход пользователя — все его отчёты устарели."""
+    for period in PERIODS:
+        _cache.pop((tg_id, period))
+
+
+def stats() -> dict:
+    return {"size": len(_cache), "hits": _cache.hits, "misses": _cache.misses}
@@ -0,0 +1,112 @@
+# rollups.py — инкрементальный суточный свод DailyStats и его пересборка из истории
+#
+# Пересборка (например, после ручной правки подходов в базе):
+#   python rollups.py
+from __future__ import annotations
+
+import asyncio
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import case, delete, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from analytics import e1rm, e1rm_sql
+from db import DailyStats, Workout, WorkoutItem
+
+_KEY = ("user_id", "day", "exercise_id")
+
+
+def _item_deltas(item: WorkoutItem) -> dict:
+    tonnage = float(item.weight) * int(item.reps) if item.weight is not None and item.reps is not None else 0.0
+    return {
+        "sets": 1,
+        "reps": int(item.reps or 0),
+        "tonnage": tonnage,
+        "cardio_sec": int(item.duration_sec or 0),
+        "cardio_m": float(item.distance_m or 0),
+        "best_e1rm": e1rm(item.weight, item.reps) if item.weight is not None and item.reps is not None else None,
+    }
+
+
+def _upsert(dialect_name: str, values: dict):
+    """
+    INSERT ... ON CONFLICT (user_id, day, exercise_id) DO UPDATE SET col = col + excluded.col,
+    best_e1rm — максимум (NULL — оценки ещё нет).
+    """
+    insert_fn = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert_fn(DailyStats).values(**values)
+    table = DailyStats.__table__
+    old_best, new_best = table.c.best_e1rm, stmt.excluded.best_e1rm
+    set_ = {
+        col: table.c[col] + stmt.excluded[col]
+        for col in ("sets", "reps", "tonnage", "cardio_sec", "cardio_m")
+    }
+    set_["best_e1rm"] = case(
+        (old_best.is_(None), new_best),
+        (new_best > old_best, new_best),
+        else_=old_best,
+    )
+    return stmt.on_conflict_do_update(index_elements=list(_KEY), set_=set_)
+
+
+async def apply_item(session: AsyncSession, user_id: int, item: WorkoutItem) -> None:
+    """Добавляем подход в свод. Коммит — вместе со вставкой подхода (DbSessionMiddleware)."""
+    day: date = item.created_at.date()
+    values = {"user_id": user_id, "day": day, "exercise_id": item.exercise_id, **_item_deltas(item)}
+    await session.exec(_upsert(session.bind.dialect.name, values))
+
+
+def rebuild_statements(user_id: Optional[int] = None) -> list:
+    """DELETE + INSERT ... SELECT GROUP BY: пересобрать свод (целиком или одного пользователя)."""
+    day = func.date(WorkoutItem.created_at)
+    grouped = (
+        select(
+            Workout.user_id,
+            day,
+            WorkoutItem.exercise_id,
+            func.count(WorkoutItem.id),
+            func.coalesce(func.sum(WorkoutItem.reps), 0),
+            # weight × reps с coalesce даёт 0 там, где одного из них нет (кардио)
+            func.coalesce(func.sum(func.coalesce(WorkoutItem.weight, 0) * func.coalesce(WorkoutItem.reps, 0)), 0),
+            func.coalesce(func.sum(WorkoutItem.duration_sec), 0),
+            func.coalesce(func.sum(WorkoutItem.distance_m), 0),
+            func.max(e1rm_sql()),
+        )
+        .join(Workout, Workout.id == WorkoutItem.workout_id)
+        .group_by(Workout.user_id, day, WorkoutItem.exercise_id)
+    )
+    wipe = delete(DailyStats)
+    if user_id is not None:
+        grouped = grouped.where(Workout.user_id == user_id)
+        wipe = wipe.where(DailyStats.user_id == user_id)
+    fill = insert(DailyStats).from_select(
+        ["user_id", "day", "exercise_id", "sets", "reps", "tonnage", "cardio_sec", "cardio_m", "best_e1rm"],
+        grouped,
+    )
+    return [wipe, fill]
+
+
+async def rebuild_daily_stats(session: AsyncSession, user_id: Optional[int] = None) -> None:
+    for stmt in rebuild_statements(user_id):
+        await session.exec(stmt)
+
+
+async def main():
+    from config import settings
+    from db import dispose_engines, get_session, init_db
+
+    await init_db(settings.database_url)
+    async with await get_session(settings.database_url) as session:
+        await rebuild_daily_stats(session)
+        await session.commit()
+        total = (await session.exec(select(func.count()).select_from(DailyStats))).one()
+    await dispose_engines()
+    print(f"DailyStats rebuilt: {total} rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,7 +3,7 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message, ReplyKeyboardRemove
 
-basic_router = Router()
+basic_router = Router(name="basic")
 
 @basic_router.message(Command("help"))
 async def help_cmd(msg: Message):
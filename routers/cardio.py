@@ -12,12 +12,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import update
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from config import settings
-from db import get_session, User, Workout, WorkoutItem, Exercise, MuscleGroup
+from catalog import ExerciseInfo, get_catalog, get_exercise
+from db import Workout, WorkoutItem
+from user_context import UserContext, invalidate_user, set_active_workout
+from workout_log import log_item
 
-cardio_router = Router()
+cardio_router = Router(name="cardio")
 
 # ===================== Состояния =====================
 class Cardio(StatesGroup):
@@ -26,98 +30,51 @@ class Cardio(StatesGroup):
 
 # ===================== Константы =====================
 SKIPPING_NAME = "Скакалка"  # кардио, где вводим только время
-DEFAULT_CARDIO = [
-    ("Беговая дорожка", "treadmill"),
-    ("Велотренажёр", "bike"),
-    ("Эллиптический тренажёр", "elliptical"),
-    ("Гребной тренажёр", "rower"),
-    (SKIPPING_NAME, "jump_rope"),
-]
+MACHINES_PER_PAGE = 10
 
 # ===================== Утилиты БД =====================
-async def _get_user(tg_id: int) -> Optional[User]:
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == tg_id))
-        return res.first()
-
-async def _get_or_create_workout(tg_id: int) -> int:
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == tg_id))
-        user = res.first()
-        if not user:
-            raise RuntimeError("NO_USER")
-        title = datetime.now().strftime("%Y-%m-%d %H:%M")
-        w = Workout(user_id=user.id, title=title)
-        session.add(w)
-        await session.commit()
-        await session.refresh(w)
-        return w.id
-
-async def _ensure_default_cardio():
-    """Создаём кардио-упражнения по умолчанию (со slug и привязкой к группе 'cardio')."""
-    async with await get_session(settings.database_url) as session:
-        # какие кардио уже есть
-        res = await session.exec(select(Exercise).where(Exercise.type == "cardio"))
-        existing = res.all()
-        have_slugs = {e.slug for e in existing if getattr(e, "slug", None)}
-
-        # найдём/создадим группу 'cardio'
-        mg = await session.exec(select(MuscleGroup).where(MuscleGroup.slug == "cardio"))
-        group = mg.first()
-        if not group:
-            # если сид ещё не отработал — создадим здесь
-            group = MuscleGroup(slug="cardio", name="Кардио")
-            session.add(group)
-            await session.commit()
-            await session.refresh(group)
-
-        group_id = group.id
-
-        # докинем недостающие упражнения
-        to_add = []
-        for name, slug in DEFAULT_CARDIO:
-            if slug not in have_slugs:
-                to_add.append(Exercise(name=name, slug=slug, type="cardio", primary_muscle_id=group_id))
-        if to_add:
-            for e in to_add:
-                session.add(e)
-            await session.commit()
-
-async def _fetch_cardio_exercises(page: int = 0, per_page: int = 10):
-    await _ensure_default_cardio()
-    async with await get_session(settings.database_url) as session:
-        base = select(Exercise).where(Exercise.type == "cardio")
-        all_items = (await session.exec(base)).all()
-        total = len(all_items)
-        res = await session.exec(base.order_by(Exercise.name.asc()).offset(page * per_page).limit(per_page))
-        items = res.all()
-        return items, total
+async def _get_or_create_workout(session: AsyncSession, user_ctx: UserContext) -> int:
+    title = datetime.now().strftime("%Y-%m-%d %H:%M")
+    w = Workout(user_id=user_ctx.user_id, title=title)
+    session.add(w)
+    await session.flush()
+    set_active_workout(session, user_ctx, w.id)
+    return w.id
+
+async def _machines_page_kb(session: AsyncSession, cursor: Optional[str]) -> InlineKeyboardMarkup:
+    cat = await get_catalog(session)
+    cursor = cat.cursor(cursor)
+    return cat.memo(
+        ("machines_kb", cursor),
+        lambda: _machines_kb(*cat.keyset("cardio", None, MACHINES_PER_PAGE, cursor)),
+    )
 
-async def _count_saved(workout_id: int, exercise_id: int) -> int:
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(
-            select(WorkoutItem).where(
-                WorkoutItem.workout_id == workout_id,
-                WorkoutItem.exercise_id == exercise_id,
-                WorkoutItem.duration_sec != None,  # noqa: E711
-            )
+async def _count_saved(session: AsyncSession, workout_id: int, exercise_id: int) -> int:
+    res = await session.exec(
+        select(WorkoutItem).where(
+            WorkoutItem.workout_id == workout_id,
+            WorkoutItem.exercise_id == exercise_id,
+            WorkoutItem.duration_sec != None,  # noqa: E711
         )
-        return len(res.all())
+    )
+    return len(res.all())
 
 # ===================== Вёрстка =====================
-def _machines_kb(exercises: List[Exercise], page: int, total: int) -> InlineKeyboardMarkup:
+def _machines_kb(
+    exercises: List[ExerciseInfo], prev_cursor: Optional[str], next_cursor: Optional[str]
+) -> InlineKeyboardMarkup:
     rows = [[InlineKeyboardButton(text=ex.name, callback_data=f"cx:{ex.id}")] for ex in exercises]
     nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="« Назад", callback_data=f"cpage:{page-1}"))
-    if (page + 1) * 10 < total:
-        nav.append(InlineKeyboardButton(text="Далее »", callback_data=f"cpage:{page+1}"))
+    if prev_cursor:
+        nav.append(InlineKeyboardButton(text="« Назад", callback_data=f"cpage:{prev_cursor}"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Далее »", callback_data=f"cpage:{next_cursor}"))
     if nav:
         rows.append(nav)
     rows.append([InlineKeyboardButton(text="🏁 Завершить кардио", callback_data="cfinish")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def _cardio_card_text(ex: Exercise, duration_min: Optional[int], distance_km: Optional[float], saved: int) -> str:
+def _cardio_card_text(ex: ExerciseInfo, duration_min: Optional[int], distance_km: Optional[float], saved: int) -> str:
     dur_txt = f"{duration_min} мин" if duration_min else "—"
     dist_txt = f"{distance_km:.2f} км" if distance_km is not None else "—"
     base = (
@@ -167,35 +124,32 @@ def _norm_km(val: Optional[str]) -> Optional[float]:
 # ===================== Команды/Хэндлеры =====================
 @cardio_router.message(Command("cardio"))
 @cardio_router.message(F.text == "🚴 Кардио")
-async def start_cardio(msg: Message, state: FSMContext):
-    user = await _get_user(msg.from_user.id)
-    if not user or not all([user.gender, user.weight_kg, user.height_cm, user.age]):
+async def start_cardio(msg: Message, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
+    if user_ctx is None or not user_ctx.profile_complete:
         await msg.answer("Сначала /start и заполни профиль. Это займёт минуту, не страдай.")
         return
-    workout_id = await _get_or_create_workout(msg.from_user.id)
+    workout_id = await _get_or_create_workout(session, user_ctx)
     await state.clear()
-    await state.update_data(c_workout_id=workout_id, c_page=0)
-    items, total = await _fetch_cardio_exercises(page=0)
-    await msg.answer("Выбери тренажёр (кардио):", reply_markup=_machines_kb(items, page=0, total=total))
+    await state.update_data(c_workout_id=workout_id, c_cursor=None)
+    await msg.answer("Выбери тренажёр (кардио):", reply_markup=await _machines_page_kb(session, None))
     await state.set_state(Cardio.choose_machine)
 
 @cardio_router.callback_query(F.data.startswith("cpage:"), Cardio.choose_machine)
-async def cardio_page(cb: CallbackQuery, state: FSMContext):
+async def cardio_page(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await cb.answer()
-    page = int(cb.data.split(":", 1)[1])
-    await state.update_data(c_page=page)
-    items, total = await _fetch_cardio_exercises(page=page)
-    await cb.message.edit_text("Выбери тренажёр (кардио):", reply_markup=_machines_kb(items, page=page, total=total))
+    # курсор ">id"/"<id" (см. Catalog.keyset); старые кнопки с номером страницы дадут первую
+    cursor = cb.data.split(":", 1)[1]
+    await state.update_data(c_cursor=cursor)
+    await cb.message.edit_text("Выбери тренажёр (кардио):", reply_markup=await _machines_page_kb(session, cursor))
 
 @cardio_router.callback_query(F.data.startswith("cx:"), Cardio.choose_machine)
-async def pick_machine(cb: CallbackQuery, state: FSMContext):
+async def pick_machine(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await cb.answer()
     ex_id = int(cb.data.split(":", 1)[1])
     data = await state.get_data()
     workout_id = int(data["c_workout_id"])
-    async with await get_session(settings.database_url) as session:
-        ex = await session.get(Exercise, ex_id)
-    saved = await _count_saved(workout_id, ex_id)
+    ex = await get_exercise(session, ex_id)
+    saved = await _count_saved(session, workout_id, ex_id)
     await state.update_data(c_ex_id=ex_id, c_min=None, c_km=None, c_last_msg=cb.message.message_id)
     await cb.message.edit_text(
         _cardio_card_text(ex, None, None, saved),
@@ -205,7 +159,7 @@ async def pick_machine(cb: CallbackQuery, state: FSMContext):
     await state.set_state(Cardio.input_metrics)
 
 @cardio_router.message(Cardio.input_metrics, F.text.regexp(INPUT_RE))
-async def cardio_input(msg: Message, state: FSMContext):
+async def cardio_input(msg: Message, state: FSMContext, session: AsyncSession):
     text = msg.text.strip()
     m = INPUT_RE.match(text)
     if not m:
@@ -217,14 +171,13 @@ async def cardio_input(msg: Message, state: FSMContext):
     ex_id = int(data["c_ex_id"])
     workout_id = int(data["c_workout_id"])
 
-    async with await get_session(settings.database_url) as session:
-        ex = await session.get(Exercise, ex_id)
+    ex = await get_exercise(session, ex_id)
 
     # Для "Скакалка" игнорируем дистанцию
     distance_km = None if ex.name == SKIPPING_NAME else km
 
     await state.update_data(c_min=minutes, c_km=distance_km)
-    saved = await _count_saved(workout_id, ex_id)
+    saved = await _count_saved(session, workout_id, ex_id)
 
     try:
         await msg.bot.edit_message_text(
@@ -238,7 +191,7 @@ async def cardio_input(msg: Message, state: FSMContext):
         await msg.answer(_cardio_card_text(ex, minutes, distance_km, saved), reply_markup=_cardio_kb())
 
 @cardio_router.callback_query(F.data == "csave", Cardio.input_metrics)
-async def cardio_save(cb: CallbackQuery, state: FSMContext):
+async def cardio_save(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     await cb.answer("Сохраняю…")
     data = await state.get_data()
     ex_id = int(data["c_ex_id"])
@@ -251,16 +204,14 @@ async def cardio_save(cb: CallbackQuery, state: FSMContext):
 
     distance_m = int(round(float(km) * 1000)) if km is not None else None
 
-    async with await get_session(settings.database_url) as session:
-        item = WorkoutItem(
-            workout_id=workout_id,
-            exercise_id=ex_id,
-            duration_sec=minutes * 60,
-            distance_m=distance_m,
-        )
-        session.add(item)
-        await session.commit()
-        ex = await session.get(Exercise, ex_id)
+    item = WorkoutItem(
+        workout_id=workout_id,
+        exercise_id=ex_id,
+        duration_sec=minutes * 60,
+        distance_m=distance_m,
+    )
+    await log_item(session, item, user_ctx)
+    ex = await get_exercise(session, ex_id)
 
     dist_txt = f"{km:.2f} км" if km is not None else "—"
     await cb.message.edit_text(
@@ -272,15 +223,22 @@ async def cardio_save(cb: CallbackQuery, state: FSMContext):
     )
 
 @cardio_router.callback_query(F.data == "cback", Cardio.input_metrics)
-async def cardio_back(cb: CallbackQuery, state: FSMContext):
+async def cardio_back(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await cb.answer()
-    page = int((await state.get_data()).get("c_page", 0))
-    items, total = await _fetch_cardio_exercises(page=page)
-    await cb.message.edit_text("Выбери тренажёр (кардио):", reply_markup=_machines_kb(items, page=page, total=total))
+    cursor = (await state.get_data()).get("c_cursor")
+    await cb.message.edit_text("Выбери тренажёр (кардио):", reply_markup=await _machines_page_kb(session, cursor))
     await state.set_state(Cardio.choose_machine)
 
 @cardio_router.callback_query(F.data == "cfinish")
-async def cardio_finish(cb: CallbackQuery, state: FSMContext):
+async def cardio_finish(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await cb.answer("Готово")
+    workout_id = int((await state.get_data()).get("c_workout_id") or 0)
+    if workout_id:
+        await session.exec(
+            update(Workout)
+            .where(Workout.id == workout_id, Workout.finished_at.is_(None))
+            .values(finished_at=datetime.utcnow())
+        )
+        invalidate_user(cb.from_user.id)
     await state.clear()
     await cb.message.edit_text("Кардио завершено. Иди пей воду.")
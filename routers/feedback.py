@@ -15,13 +15,15 @@ from aiogram.types import (
     Message,
     ForceReply,
 )
-from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from cleanup import cleanup_queue
 from config import settings
-from db import get_session, User, Feedback
+from db import Feedback
 from routers.profile import main_menu
+from user_context import UserContext
 
-feedback_router = Router()
+feedback_router = Router(name="feedback")
 
 # Антиспам в памяти: user_tg_id -> время последней удачной отправки
 _last_sent: dict[int, datetime] = {}
@@ -88,22 +90,18 @@ async def cancel_feedback(cb: CallbackQuery, state: FSMContext):
     await cb.answer("Отменено")
 
     data = await state.get_data()
-    # Удалим подсказку с ForceReply, чтобы не висела
-    prompt_id = data.get("fb_prompt_msg_id")
-    if prompt_id:
-        try:
-            await cb.message.bot.delete_message(cb.message.chat.id, prompt_id)
-        except Exception:
-            pass
 
     # Превратим текущее «Отменить»-сообщение обратно в меню обратной связи
     await cb.message.edit_text("💬 Обратная связь\nВыбери тип сообщения:", reply_markup=feedback_menu_kb())
 
+    # Подсказку с ForceReply удалим фоном, чтобы не висела
+    cleanup_queue.defer(cb.message.bot, cb.message.chat.id, data.get("fb_prompt_msg_id"))
+
     await state.clear()
 
 # Приём текста
 @feedback_router.message(FB.typing)
-async def receive_text(msg: Message, state: FSMContext):
+async def receive_text(msg: Message, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     user_tg_id = msg.from_user.id
 
     # Антиспам: не чаще 1 раза в 10 секунд
@@ -120,23 +118,18 @@ async def receive_text(msg: Message, state: FSMContext):
         await msg.answer("Сообщение пустое. Напиши текст или нажми «Отменить».")
         return
 
-    # Сохраняем в БД
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == user_tg_id))
-        user: Optional[User] = res.first()
-
-        fb = Feedback(
-            user_id=user.id if user else None,
-            user_tg_id=user_tg_id,
-            username=msg.from_user.username,
-            full_name=f"{msg.from_user.first_name or ''} {msg.from_user.last_name or ''}".strip() or None,
-            type=fb_type,
-            text=text,
-            created_at=datetime.utcnow(),
-        )
-        session.add(fb)
-        await session.commit()
-        await session.refresh(fb)
+    # Сохраняем в БД (flush — чтобы получить id для пересылки; коммит в DbSessionMiddleware)
+    fb = Feedback(
+        user_id=user_ctx.user_id if user_ctx else None,
+        user_tg_id=user_tg_id,
+        username=msg.from_user.username,
+        full_name=f"{msg.from_user.first_name or ''} {msg.from_user.last_name or ''}".strip() or None,
+        type=fb_type,
+        text=text,
+        created_at=datetime.utcnow(),
+    )
+    session.add(fb)
+    await session.flush()
 
     # Пересылаем во второго бота
     ok, err = await _relay_to_admin_bot(
@@ -160,11 +153,8 @@ async def receive_text(msg: Message, state: FSMContext):
             # Убираем inline-кнопки, текст оставим как есть или можно удалить сообщение вовсе
             await msg.bot.edit_message_reply_markup(chat_id=msg.chat.id, message_id=cancel_id, reply_markup=None)
         except Exception:
-            # Если не получилось — попробуем удалить
-            try:
-                await msg.bot.delete_message(msg.chat.id, cancel_id)
-            except Exception:
-                pass
+            # Если не получилось — удалим (фоном)
+            cleanup_queue.defer(msg.bot, msg.chat.id, cancel_id)
 
     # 2) Подсказку оставляем как есть, чтобы история была ясной.
     #    Теперь отправим «спасибо» и откроем главное меню (без лишнего текста «Главное меню»)
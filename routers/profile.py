@@ -1,4 +1,5 @@
 # routers/profile.py — финальная версия с рабочими настройками и редактированием профиля
+from typing import Optional
 
 from aiogram import Router, F
 from aiogram.filters import CommandStart
@@ -9,12 +10,12 @@ from aiogram.types import (
 )
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from config import settings
-from db import get_session, User
+from db import User
+from user_context import UserContext, update_profile
 
-profile_router = Router()
+profile_router = Router(name="profile")
 
 
 # ===== Главное меню =====
@@ -93,16 +94,12 @@ def profile_edit_kb():
 
 # ===== /start =====
 @profile_router.message(CommandStart())
-async def start(msg: Message, state: FSMContext):
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == msg.from_user.id))
-        user = res.first()
-        if user:
-            await msg.answer("Снова привет. Главное меню ниже.", reply_markup=main_menu())
-            return
-        user = User(tg_id=msg.from_user.id)
-        session.add(user)
-        await session.commit()
+async def start(msg: Message, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
+    if user_ctx:
+        await msg.answer("Снова привет. Главное меню ниже.", reply_markup=main_menu())
+        return
+    user = User(tg_id=msg.from_user.id)
+    session.add(user)
     await msg.answer("Выбери цель:", reply_markup=goals_kb())
     await state.set_state(Onb.goal)
 
@@ -120,10 +117,7 @@ async def open_settings_cb(cb: CallbackQuery):
 
 
 # ===== Профиль =====
-async def show_profile_card(message: Message, user_tg_id: int):
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == user_tg_id))
-        user = res.first()
+async def show_profile_card(message: Message, user: Optional[UserContext]):
     if not user:
         await message.answer("Похоже, ты не прошёл онбординг. Нажми /start.")
         return
@@ -144,12 +138,10 @@ async def show_profile_card(message: Message, user_tg_id: int):
 
 
 @profile_router.callback_query(F.data == "settings:profile")
-async def open_profile_from_settings(cb: CallbackQuery):
+async def open_profile_from_settings(cb: CallbackQuery, user_ctx: Optional[UserContext]):
     await cb.answer()
-    # Достаём пользователя
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
+    # Пользователь уже загружен CurrentUserMiddleware
+    user = user_ctx
 
     if not user:
         await cb.message.edit_text("Похоже, ты не прошёл онбординг. Нажми /start.")
@@ -180,15 +172,11 @@ async def edit_goal(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data.startswith("goal:"), Edit.goal)
-async def set_goal(cb: CallbackQuery, state: FSMContext):
+async def set_goal(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     goal = cb.data.split(":", 1)[1]
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
-        user.goal = goal
-        await session.commit()
+    user_ctx = await update_profile(session, user_ctx, goal=goal)
     await cb.message.edit_text("✅ Сохранено: Цель обновлена.")
-    await show_profile_card(cb.message, cb.from_user.id)
+    await show_profile_card(cb.message, user_ctx)
     await state.clear()
     await cb.answer()
 
@@ -201,25 +189,19 @@ async def edit_gender(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data.startswith("gender:"), Edit.gender)
-async def set_gender(cb: CallbackQuery, state: FSMContext):
+async def set_gender(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     gender = cb.data.split(":", 1)[1]
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
-        user.gender = gender
-        await session.commit()
+    user_ctx = await update_profile(session, user_ctx, gender=gender)
     await cb.message.edit_text("✅ Сохранено: Пол обновлён.")
-    await show_profile_card(cb.message, cb.from_user.id)
+    await show_profile_card(cb.message, user_ctx)
     await state.clear()
     await cb.answer()
 
 
 @profile_router.callback_query(F.data == "edit:weight")
-async def edit_weight(cb: CallbackQuery, state: FSMContext):
+async def edit_weight(cb: CallbackQuery, state: FSMContext, user_ctx: Optional[UserContext]):
     await cb.answer()
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
+    user = user_ctx
     w = float(user.weight_kg or 70.0)
     await state.update_data(weight=w)
     await cb.message.edit_text(
@@ -230,7 +212,7 @@ async def edit_weight(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data.startswith("w:"), Edit.weight)
-async def weight_step(cb: CallbackQuery, state: FSMContext):
+async def weight_step(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     data = await state.get_data()
     w = float(data.get("weight", 70.0))
     parts = cb.data.split(":", maxsplit=2)
@@ -240,11 +222,9 @@ async def weight_step(cb: CallbackQuery, state: FSMContext):
     elif action == "dec":
         step = float(parts[2]); w = max(30.0, round(w - step, 1))
     elif action == "ok":
-        async with await get_session(settings.database_url) as session:
-            res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-            user = res.first(); user.weight_kg = w; await session.commit()
+        user_ctx = await update_profile(session, user_ctx, weight_kg=w)
         await cb.message.edit_text("✅ Сохранено: Вес обновлён.")
-        await show_profile_card(cb.message, cb.from_user.id)
+        await show_profile_card(cb.message, user_ctx)
         await state.clear(); await cb.answer(); return
     await state.update_data(weight=w)
     await cb.message.edit_text(
@@ -254,11 +234,9 @@ async def weight_step(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data == "edit:height")
-async def edit_height(cb: CallbackQuery, state: FSMContext):
+async def edit_height(cb: CallbackQuery, state: FSMContext, user_ctx: Optional[UserContext]):
     await cb.answer()
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
+    user = user_ctx
     h = int(user.height_cm or 175)
     await state.update_data(height=h)
     await cb.message.edit_text(
@@ -269,7 +247,7 @@ async def edit_height(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data.startswith("h:"), Edit.height)
-async def height_step(cb: CallbackQuery, state: FSMContext):
+async def height_step(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     data = await state.get_data()
     h = int(data.get("height", 175))
     parts = cb.data.split(":", maxsplit=2)
@@ -279,11 +257,9 @@ async def height_step(cb: CallbackQuery, state: FSMContext):
     elif action == "dec":
         step = int(float(parts[2])); h = max(120, h - step)
     elif action == "ok":
-        async with await get_session(settings.database_url) as session:
-            res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-            user = res.first(); user.height_cm = h; await session.commit()
+        user_ctx = await update_profile(session, user_ctx, height_cm=h)
         await cb.message.edit_text("✅ Сохранено: Рост обновлён.")
-        await show_profile_card(cb.message, cb.from_user.id)
+        await show_profile_card(cb.message, user_ctx)
         await state.clear(); await cb.answer(); return
     await state.update_data(height=h)
     await cb.message.edit_text(
@@ -293,11 +269,9 @@ async def height_step(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data == "edit:age")
-async def edit_age(cb: CallbackQuery, state: FSMContext):
+async def edit_age(cb: CallbackQuery, state: FSMContext, user_ctx: Optional[UserContext]):
     await cb.answer()
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-        user = res.first()
+    user = user_ctx
     a = int(user.age or 25)
     await state.update_data(age=a)
     await cb.message.edit_text(
@@ -308,7 +282,7 @@ async def edit_age(cb: CallbackQuery, state: FSMContext):
 
 
 @profile_router.callback_query(F.data.startswith("a:"), Edit.age)
-async def age_step(cb: CallbackQuery, state: FSMContext):
+async def age_step(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     data = await state.get_data()
     a = int(data.get("age", 25))
     parts = cb.data.split(":", maxsplit=2)
@@ -318,11 +292,9 @@ async def age_step(cb: CallbackQuery, state: FSMContext):
     elif action == "dec":
         step = int(float(parts[2])); a = max(10, a - step)
     elif action == "ok":
-        async with await get_session(settings.database_url) as session:
-            res = await session.exec(select(User).where(User.tg_id == cb.from_user.id))
-            user = res.first(); user.age = a; await session.commit()
+        user_ctx = await update_profile(session, user_ctx, age=a)
         await cb.message.edit_text("✅ Сохранено: Возраст обновлён.")
-        await show_profile_card(cb.message, cb.from_user.id)
+        await show_profile_card(cb.message, user_ctx)
         await state.clear(); await cb.answer(); return
     await state.update_data(age=a)
     await cb.message.edit_text(
@@ -1,31 +1,39 @@
 from __future__ import annotations
-from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Optional
 
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from sqlalchemy import DateTime, Integer, String, case, cast, literal, null, union_all
 from sqlmodel import select, func
 
-from config import settings
-from db import get_session, Workout, WorkoutItem, Exercise, User
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-reports_router = Router()
+from db import DailyStats, PersonalRecord, Workout, WorkoutItem, Exercise
+from report_cache import get_report, put_report
+from user_context import UserContext
+
+reports_router = Router(name="reports")
 
 # ------------ helpers ------------
 def _now_utc() -> datetime:
     # Naive UTC, чтобы сравнивать с TIMESTAMP WITHOUT TIME ZONE
     return datetime.utcnow()
 
+def _window_start(since: datetime) -> datetime:
+    """Окна отчётов — целые сутки UTC (как DailyStats): начало дня since."""
+    return datetime.combine(since.date(), time.min)
+
 def _since_for(period: str) -> Optional[datetime]:
-    now = _now_utc()
-    if period == "weekly":
-        return now - timedelta(days=7)
+    """Начало окна: 7/30 календарных дней UTC, включая сегодняшний; None — весь период."""
+    today = _window_start(_now_utc())
     if period == "monthly":
-        return now - timedelta(days=30)
+        return today - timedelta(days=29)
     if period == "alltime":
         return None
-    return now - timedelta(days=7)
+    return today - timedelta(days=6)
 
 def _fmt_int(n: Optional[int]) -> str:
     return f"{int(n or 0)}"
@@ -49,219 +57,318 @@ def _title_for(period: str) -> str:
         "alltime": "Итоги за весь период",
     }.get(period, "Итоги")
 
-async def _last_workout_summary(
-    session, user_tg_id: int, since: Optional[datetime]
-) -> Tuple[Optional[Workout], bool, int, float, int, float]:
-    # Ищем последнюю тренировку пользователя в окне
-    base = (
-        select(Workout)
-        .join(WorkoutItem, WorkoutItem.workout_id == Workout.id)
-        .join(User, User.id == Workout.user_id)
-        .where(User.tg_id == user_tg_id)
+@dataclass
+class LastWorkout:
+    created_at: Optional[datetime]
+    in_period: bool
+    sets_count: int
+    tonnage: float
+    cardio_min: int
+    cardio_km: float
+
+
+@dataclass
+class ReportData:
+    workouts_count: int = 0
+    tonnage: float = 0.0
+    cardio_min: float = 0.0
+    cardio_km: float = 0.0
+    # (имя, подходов, тоннаж) и (имя, секунд, метров) — уже отсортированы, максимум по 3
+    top_strength: list[tuple[str, int, float]] = field(default_factory=list)
+    top_cardio: list[tuple[str, int, float]] = field(default_factory=list)
+    # (имя, лучшая оценка 1ПМ, рекорд ли относительно времени до периода) — максимум 3
+    top_e1rm: list[tuple[str, float, bool]] = field(default_factory=list)
+    last: Optional[LastWorkout] = None
+    since: Optional[datetime] = None        # начало окна (полночь UTC); None — весь период
+
+    @property
+    def is_empty(self) -> bool:
+        return self.last is None and self.workouts_count == 0 and self.cardio_min == 0 and self.tonnage == 0
+
+
+def _last_workout_id(user_id: int, since: Optional[datetime]):
+    """Последняя тренировка пользователя, где есть подходы (в окне, если since задан)."""
+    has_items = select(WorkoutItem.id).where(WorkoutItem.workout_id == Workout.id)
+    if since is not None:
+        has_items = has_items.where(WorkoutItem.created_at >= since)
+    return (
+        select(Workout.id)
+        .where(Workout.user_id == user_id, has_items.exists())
+        .order_by(Workout.created_at.desc())
+        .limit(1)
+        .correlate(None)
+        .scalar_subquery()
     )
+
+
+def _report_query(user_id: int, since: Optional[datetime]):
+    """
+    Один запрос на весь отчёт (SQLite и Postgres): UNION ALL трёх видов строк —
+      last      — итоги последней тренировки (flag = 1, если она в окне);
+      total     — тренировки/тоннаж/кардио за период;
+      strength/cardio — ТОП-3 упражнений (flag = место, через row_number());
+      e1rm      — ТОП-3 по оценке 1ПМ: tonnage = лучшая за период, dist = лучшая до периода.
+    Окно — целые сутки: с начала дня since для всех видов строк (и для «последней тренировки»).
+    Итоги и ТОП берём из суточного свода DailyStats, оценку 1ПМ
+    за всё время — из PersonalRecord, поэтому стоимость — O(дней × упражнений), а не O(подходов).
+    Колонки: kind, name, n, tonnage, dur, dist, ts, flag.
+    """
     if since is not None:
-        base = base.where(WorkoutItem.created_at >= since)
-    base = base.order_by(Workout.created_at.desc()).limit(1)
-    wk = (await session.exec(base)).first()
-    in_period = True
-
-    if wk is None:
-        # Берём последнюю вообще
-        base2 = (
-            select(Workout)
-            .join(WorkoutItem, WorkoutItem.workout_id == Workout.id)
-            .join(User, User.id == Workout.user_id)
-            .where(User.tg_id == user_tg_id)
-            .order_by(Workout.created_at.desc())
-            .limit(1)
-        )
-        wk = (await session.exec(base2)).first()
-        in_period = False
-
-    if wk is None:
-        return None, False, 0, 0.0, 0, 0.0
-
-    items = (await session.exec(select(WorkoutItem).where(WorkoutItem.workout_id == wk.id))).all()
-    sets_count = len(items)
-    tonnage = 0.0
-    cardio_sec = 0
-    cardio_m = 0.0
-
-    if items:
-        ex_ids = {it.exercise_id for it in items if it.exercise_id}
-        ex_map = {}
-        if ex_ids:
-            for eid, etype in (await session.exec(select(Exercise.id, Exercise.type).where(Exercise.id.in_(ex_ids)))).all():
-                ex_map[eid] = etype or "strength"
-
-        for it in items:
-            etype = ex_map.get(it.exercise_id, "strength")
-            if etype == "strength":
-                if it.weight and it.reps:
-                    tonnage += float(it.weight) * int(it.reps)
-            else:
-                if it.duration_sec:
-                    cardio_sec += int(it.duration_sec)
-                if it.distance_m:
-                    cardio_m += float(it.distance_m)
-
-    return wk, in_period, sets_count, tonnage, int(cardio_sec / 60), float(cardio_m / 1000.0)
-
-async def _aggregate(session, user_tg_id: int, since: Optional[datetime]):
-    filters = []
+        since = _window_start(since)
+    conds = [DailyStats.user_id == user_id]
+    workout_conds = [Workout.user_id == user_id]
     if since is not None:
-        filters.append(WorkoutItem.created_at >= since)
-
-    # Кол-во уникальных тренировок
-    q_workouts = (
-        select(func.count(func.distinct(WorkoutItem.workout_id)))
-        .join(Workout, Workout.id == WorkoutItem.workout_id)
-        .join(User, User.id == Workout.user_id)
-        .where(User.tg_id == user_tg_id)
+        conds.append(DailyStats.day >= since.date())
+        workout_conds.append(Workout.created_at >= since)
+    days = (
+        select(
+            DailyStats.sets,
+            DailyStats.tonnage,
+            DailyStats.cardio_sec,
+            DailyStats.cardio_m,
+            DailyStats.best_e1rm,
+            DailyStats.exercise_id,
+            Exercise.name.label("name"),
+            Exercise.type.label("type"),
+        )
+        .join(Exercise, Exercise.id == DailyStats.exercise_id)
+        .where(*conds)
+        .cte("days")
     )
-    for f in filters:
-        q_workouts = q_workouts.where(f)
-    workouts_count = (await session.exec(q_workouts)).one() or 0
-
-    # Тоннаж по силовым
-    q_tonnage = (
-        select(func.sum(WorkoutItem.reps * WorkoutItem.weight))
-        .join(Workout, Workout.id == WorkoutItem.workout_id)
-        .join(User, User.id == Workout.user_id)
-        .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
-        .where(
-            User.tg_id == user_tg_id,
-            Exercise.type == "strength",
-            WorkoutItem.reps.is_not(None),
-            WorkoutItem.weight.is_not(None),
+    is_strength = days.c.type == "strength"
+    is_cardio = days.c.type == "cardio"
+
+    # --- последняя тренировка: в окне, иначе последняя вообще
+    in_window_id = _last_workout_id(user_id, since)
+    last_id = func.coalesce(in_window_id, _last_workout_id(user_id, None)) if since is not None else in_window_id
+    etype = func.coalesce(Exercise.type, "strength")
+    q_last = (
+        select(
+            literal("last").label("kind"),
+            cast(null(), String).label("name"),
+            func.count(WorkoutItem.id).label("n"),
+            func.sum(case((etype == "strength", WorkoutItem.weight * WorkoutItem.reps))).label("tonnage"),
+            func.sum(case((etype != "strength", WorkoutItem.duration_sec))).label("dur"),
+            func.sum(case((etype != "strength", WorkoutItem.distance_m))).label("dist"),
+            func.max(Workout.created_at).label("ts"),
+            case((in_window_id.is_not(None), 1), else_=0).label("flag"),
         )
+        .select_from(Workout)
+        .outerjoin(WorkoutItem, WorkoutItem.workout_id == Workout.id)
+        .outerjoin(Exercise, Exercise.id == WorkoutItem.exercise_id)
+        .where(Workout.id == last_id)
     )
-    for f in filters:
-        q_tonnage = q_tonnage.where(f)
-    tonnage = (await session.exec(q_tonnage)).one() or 0
-
-    # Кардио
-    q_cardio = (
-        select(func.sum(WorkoutItem.duration_sec), func.sum(WorkoutItem.distance_m))
-        .join(Workout, Workout.id == WorkoutItem.workout_id)
-        .join(User, User.id == Workout.user_id)
-        .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
-        .where(User.tg_id == user_tg_id, Exercise.type == "cardio")
+
+    # --- итоги периода; тренировки — по индексу (user_id, created_at), только с подходами
+    has_items = select(WorkoutItem.id).where(WorkoutItem.workout_id == Workout.id).exists()
+    workouts_count = (
+        select(func.count(Workout.id))
+        .where(*workout_conds, has_items)
+        .correlate(None)
+        .scalar_subquery()
     )
-    for f in filters:
-        q_cardio = q_cardio.where(f)
-    cardio_sec, cardio_m = (await session.exec(q_cardio)).one()
-    cardio_min = (cardio_sec or 0) / 60.0
-    cardio_km = (cardio_m or 0) / 1000.0
-
-    # ТОП-3 силовые
-    q_top_str = (
-        select(Exercise.name, func.count(WorkoutItem.id), func.sum(WorkoutItem.reps * WorkoutItem.weight))
-        .join(Workout, Workout.id == WorkoutItem.workout_id)
-        .join(User, User.id == Workout.user_id)
-        .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
-        .where(User.tg_id == user_tg_id, Exercise.type == "strength")
-        .group_by(Exercise.name)
-        .order_by(func.count(WorkoutItem.id).desc(), func.sum(WorkoutItem.reps * WorkoutItem.weight).desc())
-        .limit(3)
+    q_total = select(
+        literal("total"),
+        cast(null(), String),
+        workouts_count,
+        func.sum(case((is_strength, days.c.tonnage))),
+        func.sum(case((is_cardio, days.c.cardio_sec))),
+        func.sum(case((is_cardio, days.c.cardio_m))),
+        cast(null(), DateTime),
+        literal(0),
     )
-    for f in filters:
-        q_top_str = q_top_str.where(f)
-    top_strength = (await session.exec(q_top_str)).all()
-
-    # ТОП-3 кардио
-    q_top_cardio = (
-        select(Exercise.name, func.sum(WorkoutItem.duration_sec), func.sum(WorkoutItem.distance_m))
-        .join(Workout, Workout.id == WorkoutItem.workout_id)
-        .join(User, User.id == Workout.user_id)
-        .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
-        .where(User.tg_id == user_tg_id, Exercise.type == "cardio")
-        .group_by(Exercise.name)
-        .order_by(func.sum(WorkoutItem.duration_sec).desc(), func.sum(WorkoutItem.distance_m).desc())
-        .limit(3)
+
+    # --- ТОП-3 силовых (по подходам, затем тоннажу) и кардио (по времени, затем дистанции)
+    per_ex = (
+        select(
+            days.c.type,
+            days.c.name,
+            func.sum(days.c.sets).label("n"),
+            func.sum(days.c.tonnage).label("tonnage"),
+            func.sum(days.c.cardio_sec).label("dur"),
+            func.sum(days.c.cardio_m).label("dist"),
+        )
+        .where(days.c.type.in_(("strength", "cardio")))
+        .group_by(days.c.type, days.c.name)
+        .subquery()
     )
-    for f in filters:
-        q_top_cardio = q_top_cardio.where(f)
-    top_cardio = (await session.exec(q_top_cardio)).all()
+    strength_row = per_ex.c.type == "strength"
+    ranked = select(
+        per_ex,
+        func.row_number().over(
+            partition_by=per_ex.c.type,
+            order_by=(
+                case((strength_row, per_ex.c.n), else_=func.coalesce(per_ex.c.dur, 0)).desc(),
+                case((strength_row, func.coalesce(per_ex.c.tonnage, 0)), else_=func.coalesce(per_ex.c.dist, 0)).desc(),
+            ),
+        ).label("rn"),
+    ).subquery()
+    q_top = select(
+        ranked.c.type,
+        ranked.c.name,
+        ranked.c.n,
+        ranked.c.tonnage,
+        ranked.c.dur,
+        ranked.c.dist,
+        cast(null(), DateTime),
+        ranked.c.rn,
+    ).where(ranked.c.rn <= 3)
+
+    # --- ТОП-3 по оценке 1ПМ: за период — max из свода, прошлая планка — max из свода до окна
+    # (только для трёх выбранных упражнений); за всё время — из PersonalRecord, без планки
+    if since is not None:
+        best = (
+            select(days.c.exercise_id, days.c.name, func.max(days.c.best_e1rm).label("e1rm"))
+            .where(days.c.best_e1rm.is_not(None))
+            .group_by(days.c.exercise_id, days.c.name)
+            .subquery()
+        )
+    else:
+        best = (
+            select(PersonalRecord.exercise_id, Exercise.name, PersonalRecord.best_e1rm.label("e1rm"))
+            .join(Exercise, Exercise.id == PersonalRecord.exercise_id)
+            .where(PersonalRecord.user_id == user_id, PersonalRecord.best_e1rm > 0)
+            .subquery()
+        )
+    best_ranked = select(
+        best,
+        func.row_number().over(order_by=(best.c.e1rm.desc(), best.c.name)).label("rn"),
+    ).subquery()
+    if since is not None:
+        prior = (
+            select(func.max(DailyStats.best_e1rm))
+            .where(
+                DailyStats.user_id == user_id,
+                DailyStats.exercise_id == best_ranked.c.exercise_id,
+                DailyStats.day < since.date(),
+            )
+            .scalar_subquery()
+        )
+    else:
+        prior = cast(null(), best_ranked.c.e1rm.type)
+    q_e1rm = select(
+        literal("e1rm"),
+        best_ranked.c.name,
+        cast(null(), Integer),
+        best_ranked.c.e1rm,
+        cast(null(), Integer),
+        prior,
+        cast(null(), DateTime),
+        best_ranked.c.rn,
+    ).where(best_ranked.c.rn <= 3)
+
+    return union_all(q_last, q_total, q_top, q_e1rm)
+
+
+async def _aggregate(session, user_id: int, since: Optional[datetime]) -> ReportData:
+    rows = (await session.exec(_report_query(user_id, since))).all()
+
+    report = ReportData(since=_window_start(since) if since is not None else None)
+    tops: dict[str, list] = {"strength": [], "cardio": [], "e1rm": []}
+    for kind, name, n, tonnage, dur, dist, ts, flag in rows:
+        if kind == "last":
+            if ts is not None:
+                report.last = LastWorkout(
+                    created_at=ts,
+                    in_period=bool(flag),
+                    sets_count=int(n or 0),
+                    tonnage=float(tonnage or 0),
+                    cardio_min=int((dur or 0) / 60),
+                    cardio_km=float((dist or 0) / 1000.0),
+                )
+        elif kind == "total":
+            report.workouts_count = int(n or 0)
+            report.tonnage = float(tonnage or 0)
+            report.cardio_min = float(dur or 0) / 60.0
+            report.cardio_km = float(dist or 0) / 1000.0
+        elif kind in tops:
+            tops[kind].append((int(flag), name, n, tonnage, dur, dist))
+
+    report.top_strength = [(name, int(n), float(ton or 0)) for _, name, n, ton, _, _ in sorted(tops["strength"])]
+    report.top_cardio = [(name, int(dur or 0), float(dist or 0)) for _, name, _, _, dur, dist in sorted(tops["cardio"])]
+    report.top_e1rm = [
+        (name, float(best), prior is not None and best > prior)
+        for _, name, _, best, _, prior in sorted(tops["e1rm"])
+    ]
+    return report
 
-    return {
-        "workouts_count": int(workouts_count),
-        "tonnage": float(tonnage or 0),
-        "cardio_min": float(cardio_min or 0),
-        "cardio_km": float(cardio_km or 0),
-        "top_strength": top_strength,
-        "top_cardio": top_cardio,
-    }
-
-def _render(period: str, agg, last_block: str) -> str:
+def _render(period: str, report: ReportData) -> str:
     title = _title_for(period)
+    if report.since is not None:
+        title += f" (с {report.since:%d.%m})"
     txt = [
         f"<b>{title}</b> 📊",
         "",
-        f"🏋️‍♂️ Тренировок: <b>{_fmt_int(agg['workouts_count'])}</b>",
-        f"📦 Тоннаж: <b>{_fmt_kg(agg['tonnage'])}</b>",
-        f"⏱ Кардио: <b>{_fmt_min(agg['cardio_min'])}</b>",
-        f"📏 Дистанция: <b>{_fmt_km(agg['cardio_km'])}</b>",
+        f"🏋️‍♂️ Тренировок: <b>{_fmt_int(report.workouts_count)}</b>",
+        f"📦 Тоннаж: <b>{_fmt_kg(report.tonnage)}</b>",
+        f"⏱ Кардио: <b>{_fmt_min(report.cardio_min)}</b>",
+        f"📏 Дистанция: <b>{_fmt_km(report.cardio_km)}</b>",
         "",
         "🥇 <u>Силовые ТОП-3</u>",
     ]
-    if agg["top_strength"]:
-        for i, (name, cnt, ton) in enumerate(agg["top_strength"], 1):
+    if report.top_strength:
+        for i, (name, cnt, ton) in enumerate(report.top_strength, 1):
             txt.append(f"{i}) {int(cnt)} — {name}")
     else:
         txt.append("— нет данных")
 
+    if report.top_e1rm:
+        txt += ["", "💪 <u>Оценка 1ПМ</u>"]
+        for i, (name, best, record) in enumerate(report.top_e1rm, 1):
+            mark = " 🆕 рекорд" if record else ""
+            txt.append(f"{i}) {best:.1f} кг — {name}{mark}")
+
     txt += ["", "🥇 <u>Кардио ТОП-3</u>"]
-    if agg["top_cardio"]:
-        for i, (name, dur, dist) in enumerate(agg["top_cardio"], 1):
+    if report.top_cardio:
+        for i, (name, dur, dist) in enumerate(report.top_cardio, 1):
             mins = int((dur or 0) / 60)
             km = float((dist or 0) / 1000.0)
             txt.append(f"{i}) {mins} мин / {km:.1f} км — {name}")
     else:
         txt.append("— нет данных")
 
-    if last_block:
-        txt += ["", last_block]
+    last = report.last
+    if last is not None:
+        tag = "" if last.in_period else " (вне периода)"
+        ts = last.created_at.strftime('%Y-%m-%d %H:%M') if last.created_at else "—"
+        txt += [
+            "",
+            f"📅 Последняя тренировка{tag}: {ts}\n"
+            f"— {last.sets_count} подходов, {last.tonnage:.0f} кг; кардио {last.cardio_min} мин / {last.cardio_km:.1f} км",
+        ]
 
     return "\n".join(txt)
 
 
-async def _handle_period(msg: Message, period: str, user_tg_id: Optional[int] = None):
-    since = _since_for(period)
-    uid = user_tg_id or msg.from_user.id
+_NO_DATA = "За выбранный период данных нет. Начни с `/train` или `/cardio`."
 
-    async with await get_session(settings.database_url) as session:
-        agg = await _aggregate(session, uid, since)
-        wk, in_period, sets_count, tonnage, cmin, ckm = await _last_workout_summary(session, uid, since)
 
-    if wk is None and agg["workouts_count"] == 0 and agg["cardio_min"] == 0 and agg["tonnage"] == 0:
-        await msg.answer("За выбранный период данных нет. Начни с `/train` или `/cardio`.")
+async def _handle_period(msg: Message, session: AsyncSession, period: str, user_ctx: Optional[UserContext]):
+    if user_ctx is None:
+        await msg.answer(_NO_DATA)
         return
 
-    last_block = ""
-    if wk is not None:
-        tag = "" if in_period else " (вне периода)"
-        ts = wk.created_at.strftime('%Y-%m-%d %H:%M') if wk.created_at else "—"
-        last_block = (
-            f"📅 Последняя тренировка{tag}: {ts}\n"
-            f"— {sets_count} подходов, {tonnage:.0f} кг; кардио {cmin} мин / {ckm:.1f} км"
-        )
+    # повторные нажатия — из кэша, без БД; сбрасывается в workout_log.log_item
+    text = get_report(user_ctx.tg_id, period)
+    if text is None:
+        report = await _aggregate(session, user_ctx.user_id, _since_for(period))
+        text = _NO_DATA if report.is_empty else _render(period, report)
+        put_report(user_ctx.tg_id, period, text)
 
-    text = _render(period, agg, last_block)
     await msg.answer(text)
 
 # ------------ handlers ------------
 @reports_router.message(Command("weekly"))
-async def weekly(msg: Message):
-    await _handle_period(msg, "weekly")
+async def weekly(msg: Message, session: AsyncSession, user_ctx: Optional[UserContext]):
+    await _handle_period(msg, session, "weekly", user_ctx)
 
 @reports_router.message(Command("monthly"))
-async def monthly(msg: Message):
-    await _handle_period(msg, "monthly")
+async def monthly(msg: Message, session: AsyncSession, user_ctx: Optional[UserContext]):
+    await _handle_period(msg, session, "monthly", user_ctx)
 
 @reports_router.message(Command("alltime"))
-async def alltime(msg: Message):
-    await _handle_period(msg, "alltime")
+async def alltime(msg: Message, session: AsyncSession, user_ctx: Optional[UserContext]):
+    await _handle_period(msg, session, "alltime", user_ctx)
 
 # ===== Меню «История» по кнопкам =====
 def _history_kb() -> InlineKeyboardMarkup:
@@ -276,8 +383,8 @@ async def history_menu(msg: Message):
     await msg.answer("Выбери период:", reply_markup=_history_kb())
 
 @reports_router.callback_query(F.data.startswith("rp:"))
-async def history_pick_period(cb: CallbackQuery):
+async def history_pick_period(cb: CallbackQuery, session: AsyncSession, user_ctx: Optional[UserContext]):
     period = cb.data.split(":", 1)[1]
     await cb.answer()
-    # критично: используем cb.from_user.id, а НЕ cb.message.from_user.id (это бот)
-    await _handle_period(cb.message, period, user_tg_id=cb.from_user.id)
+    # критично: user_ctx собран по cb.from_user, а НЕ по cb.message.from_user (это бот)
+    await _handle_period(cb.message, session, period, user_ctx)
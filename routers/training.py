@@ -1,8 +1,8 @@
 # routers/training.py
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import Optional, Iterable, List
+from datetime import datetime
+from typing import Optional, Iterable
 import re
 
 from aiogram import Router, F
@@ -17,13 +17,21 @@ from aiogram.types import (
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from sqlmodel import select
-from sqlalchemy import func, case
-
-from config import settings
-from db import get_session, User, Workout, WorkoutItem, Exercise, MuscleGroup
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import func, case, update
+
+from analytics import e1rm
+from catalog import ExerciseInfo, GroupInfo, get_catalog, get_exercise
+from db import Workout, WorkoutItem, Exercise
+from last_set import LastSet, get_last_set
+from records import RECORD_TITLES
 from routers.profile import main_menu
+from user_context import UserContext, invalidate_user, reload_user_context, set_active_workout
+from workout_log import log_item
+from card_debounce import card_debouncer
+from cleanup import cleanup_queue
 
-training_router = Router()
+training_router = Router(name="training")
 
 # ========= FSM =========
 class Training(StatesGroup):
@@ -39,6 +47,8 @@ STRENGTH_INPUT_RE = re.compile(
     re.IGNORECASE,
 )
 
+EXERCISES_PER_PAGE = 20
+
 # ========= Утилиты =========
 async def _safe_cb_answer(cb: CallbackQuery):
     try:
@@ -47,43 +57,14 @@ async def _safe_cb_answer(cb: CallbackQuery):
         # протухший/повторный callback — игнорируем
         pass
 
-async def _get_user(tg_id: int) -> Optional[User]:
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(User).where(User.tg_id == tg_id))
-        return res.first()
-
-async def _create_workout_for_user(tg_id: int) -> int:
-    """Создаём новую силовую тренировку и возвращаем ID."""
-    async with await get_session(settings.database_url) as session:
-        u = await session.exec(select(User).where(User.tg_id == tg_id))
-        user = u.first()
-        if not user:
-            raise RuntimeError("NO_USER")
-        title = datetime.now().strftime("%Y-%m-%d %H:%M")
-        w = Workout(user_id=user.id, title=title)
-        session.add(w)
-        await session.commit()
-        await session.refresh(w)
-        return w.id
-
-async def _fetch_groups() -> List[MuscleGroup]:
-    async with await get_session(settings.database_url) as session:
-        res = await session.exec(select(MuscleGroup).where(MuscleGroup.slug != "cardio"))
-        return res.all()
-
-async def _fetch_exercises(group_id: Optional[int], page: int = 0, per_page: int = 20) -> tuple[list[Exercise], int]:
-    async with await get_session(settings.database_url) as session:
-        base = select(Exercise).where(Exercise.type == "strength")
-        if group_id:
-            base = base.where(Exercise.primary_muscle_id == group_id)
-
-        count_query = select(func.count()).select_from(base.subquery())
-        total = (await session.exec(count_query)).one() or 0
-
-        res = await session.exec(
-            base.order_by(Exercise.name.asc()).offset(page * per_page).limit(per_page)
-        )
-        return res.all(), int(total)
+async def _create_workout_for_user(session: AsyncSession, user_ctx: UserContext) -> int:
+    """Создаём новую силовую тренировку и возвращаем ID (коммит — в DbSessionMiddleware)."""
+    title = datetime.now().strftime("%Y-%m-%d %H:%M")
+    w = Workout(user_id=user_ctx.user_id, title=title)
+    session.add(w)
+    await session.flush()
+    set_active_workout(session, user_ctx, w.id)
+    return w.id
 
 def _chunk(it: Iterable, n: int) -> list[list]:
     row, rows = [], []
@@ -96,183 +77,177 @@ def _chunk(it: Iterable, n: int) -> list[list]:
         rows.append(row)
     return rows
 
-def _groups_kb(groups: list[MuscleGroup]) -> InlineKeyboardMarkup:
+def _groups_kb(groups: list[GroupInfo]) -> InlineKeyboardMarkup:
     btns = [InlineKeyboardButton(text=g.name, callback_data=f"grp:{g.id}") for g in groups]
     rows = _chunk(btns, 2)  # две кнопки в ряд
     rows.append([InlineKeyboardButton(text="🏁 Завершить тренировку", callback_data="workout:finish")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def _exercises_kb(exercises: list[Exercise]) -> InlineKeyboardMarkup:
+def _exercises_kb(
+    group_id: int,
+    exercises: list[ExerciseInfo],
+    prev_cursor: Optional[str],
+    next_cursor: Optional[str],
+) -> InlineKeyboardMarkup:
     btns = [InlineKeyboardButton(text=e.name, callback_data=f"ex:{e.id}") for e in exercises]
     rows = _chunk(btns, 2)
+    nav = []
+    if prev_cursor:
+        nav.append(InlineKeyboardButton(text="« Назад", callback_data=f"expage:{group_id}:{prev_cursor}"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Далее »", callback_data=f"expage:{group_id}:{next_cursor}"))
+    if nav:
+        rows.append(nav)
     rows.append([
         InlineKeyboardButton(text="⬅️ Назад к группам", callback_data="back:groups"),
         InlineKeyboardButton(text="🏁 Завершить тренировку", callback_data="workout:finish"),
     ])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def _exercise_panel_kb(has_last: bool) -> InlineKeyboardMarkup:
+def _exercise_panel_kb(has_last: bool, has_previous: bool = False) -> InlineKeyboardMarkup:
     """
-    До первого подхода: только «Назад к группам».
+    До первого подхода: «Как в прошлый раз» (если упражнение уже делали) + «Назад к группам».
     После первого: «Ещё такой же» + «Завершить упражнение».
     """
     if not has_last:
-        return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад к группам", callback_data="back:groups")],
-        ])
+        rows = [[InlineKeyboardButton(text="⬅️ Назад к группам", callback_data="back:groups")]]
+        if has_previous:
+            rows.insert(0, [InlineKeyboardButton(text="🔁 Как в прошлый раз", callback_data="ex:repeat")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
     else:
         return InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔁 Ещё такой же", callback_data="ex:repeat")],
             [InlineKeyboardButton(text="✅ Завершить упражнение", callback_data="ex:finish")],
         ])
 
-async def _exercise_name(ex_id: int) -> str:
-    async with await get_session(settings.database_url) as session:
-        ex = await session.get(Exercise, ex_id)
+async def _exercise_name(session: AsyncSession, ex_id: int) -> str:
+    ex = await get_exercise(session, ex_id)
     return ex.name if ex else "Упражнение"
 
-async def _count_sets_for_ex(workout_id: int, exercise_id: int) -> int:
-    async with await get_session(settings.database_url) as session:
-        q = select(func.count()).where(
-            WorkoutItem.workout_id == workout_id,
-            WorkoutItem.exercise_id == exercise_id,
-            WorkoutItem.reps.is_not(None),
-            WorkoutItem.weight.is_not(None),
-        )
-        return int((await session.exec(q)).one() or 0)
-
-async def _last_set_for_ex(workout_id: int, exercise_id: int) -> tuple[Optional[float], Optional[int]]:
-    async with await get_session(settings.database_url) as session:
-        q = (select(WorkoutItem)
-             .where(WorkoutItem.workout_id == workout_id, WorkoutItem.exercise_id == exercise_id)
-             .order_by(WorkoutItem.id.desc())
-             .limit(1))
-        item = (await session.exec(q)).first()
-        if not item:
-            return None, None
-        return float(item.weight) if item.weight is not None else None, int(item.reps) if item.reps is not None else None
-
-def _exercise_card_text(name: str, saved_sets: int, last_w: Optional[float], last_r: Optional[int]) -> str:
+async def _count_sets_for_ex(session: AsyncSession, workout_id: int, exercise_id: int) -> int:
+    q = select(func.count()).where(
+        WorkoutItem.workout_id == workout_id,
+        WorkoutItem.exercise_id == exercise_id,
+        WorkoutItem.reps.is_not(None),
+        WorkoutItem.weight.is_not(None),
+    )
+    return int((await session.exec(q)).one() or 0)
+
+async def _last_set_for_ex(
+    session: AsyncSession, workout_id: int, exercise_id: int
+) -> tuple[Optional[float], Optional[int]]:
+    q = (select(WorkoutItem)
+         .where(WorkoutItem.workout_id == workout_id, WorkoutItem.exercise_id == exercise_id)
+         .order_by(WorkoutItem.id.desc())
+         .limit(1))
+    item = (await session.exec(q)).first()
+    if not item:
+        return None, None
+    return float(item.weight) if item.weight is not None else None, int(item.reps) if item.reps is not None else None
+
+def _e1rm_note(weight: Optional[float], reps: Optional[int]) -> str:
+    """« • 1ПМ ≈ N кг» для подхода (Эпли, до E1RM_MAX_REPS повторов), иначе пусто."""
+    value = e1rm(weight, reps) if weight is not None and reps is not None else None
+    return f" • 1ПМ ≈ {value:.1f} кг" if value is not None else ""
+
+def _exercise_card_text(
+    name: str,
+    saved_sets: int,
+    last_w: Optional[float],
+    last_r: Optional[int],
+    records: Iterable[int] = (),
+    previous: Optional[LastSet] = None,
+) -> str:
     last_str = f"{last_w:.1f} кг × {last_r}" if (last_w is not None and last_r is not None) else "—"
-    return (
+    text = (
         f"🏋️ <b>{name}</b>\n"
-        f"Подходы: <b>{saved_sets}</b> • Последний: <b>{last_str}</b>\n\n"
+        f"Подходы: <b>{saved_sets}</b> • Последний: <b>{last_str}</b>{_e1rm_note(last_w, last_r)}\n"
     )
+    if previous is not None:
+        text += (
+            f"Прошлый раз: <b>{previous.weight:.1f} кг × {previous.reps}</b> ({previous.at:%d.%m})"
+            f"{_e1rm_note(previous.weight, previous.reps)}\n"
+        )
+    text += "\n"
+    titles = [RECORD_TITLES[r] for r in records]
+    if titles:
+        text += f"🏆 Новый рекорд: {', '.join(titles)}!\n"
+    return text
 
-async def _workout_totals(workout_id: int) -> tuple[int, float]:
+async def _workout_totals(session: AsyncSession, workout_id: int) -> tuple[int, float]:
     """Итоги тренировки: число подходов и поднятый вес (гантельные ×2 по названию)."""
-    async with await get_session(settings.database_url) as session:
-        q_sets = select(func.count()).where(
+    q_sets = select(func.count()).where(
+        WorkoutItem.workout_id == workout_id,
+        WorkoutItem.reps.is_not(None),
+        WorkoutItem.weight.is_not(None),
+    )
+    sets_cnt = int((await session.exec(q_sets)).one() or 0)
+
+    q_lifted = (
+        select(
+            func.coalesce(
+                func.sum(
+                    case(
+                        (func.lower(Exercise.name).like("%гантел%"), 2),
+                        else_=1,
+                    ) * WorkoutItem.weight * WorkoutItem.reps
+                ),
+                0
+            )
+        )
+        .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
+        .where(
             WorkoutItem.workout_id == workout_id,
             WorkoutItem.reps.is_not(None),
             WorkoutItem.weight.is_not(None),
         )
-        sets_cnt = int((await session.exec(q_sets)).one() or 0)
-
-        q_lifted = (
-            select(
-                func.coalesce(
-                    func.sum(
-                        case(
-                            (func.lower(Exercise.name).like("%гантел%"), 2),
-                            else_=1,
-                        ) * WorkoutItem.weight * WorkoutItem.reps
-                    ),
-                    0
-                )
-            )
-            .join(Exercise, Exercise.id == WorkoutItem.exercise_id)
-            .where(
-                WorkoutItem.workout_id == workout_id,
-                WorkoutItem.reps.is_not(None),
-                WorkoutItem.weight.is_not(None),
-            )
-        )
-        lifted = float((await session.exec(q_lifted)).one() or 0.0)
+    )
+    lifted = float((await session.exec(q_lifted)).one() or 0.0)
 
     return sets_cnt, lifted
 
-# ========= Авто-финиш тренировки (ленивый, без привязки к имени поля) =========
-async def _check_autofinish(tg_id: int) -> Optional[int]:
-    """
-    Если последняя тренировка без активности ≥ 2ч — закрываем её.
-    Не зависит от наличия поля finished_at: поддерживает и finished_at, и finished (bool).
-    """
-    async with await get_session(settings.database_url) as session:
-        wq = (
-            select(Workout)
-            .join(User, User.id == Workout.user_id)
-            .where(User.tg_id == tg_id)
-            .order_by(Workout.created_at.desc())
-            .limit(1)
-        )
-        workout = (await session.exec(wq)).first()
-        if not workout:
-            return None
-
-        finished_at_val = getattr(workout, "finished_at", None)
-        finished_bool_val = getattr(workout, "finished", None)
-
-        already_finished = False
-        if finished_at_val is not None:
-            already_finished = True
-        elif isinstance(finished_bool_val, bool):
-            already_finished = finished_bool_val
-
-        if already_finished:
-            return None
-
-        iq = select(func.max(WorkoutItem.created_at)).where(WorkoutItem.workout_id == workout.id)
-        last_item_ts = (await session.exec(iq)).one()
-        last_item_ts = last_item_ts if isinstance(last_item_ts, datetime) else None
-
-        last_activity = max(filter(None, [workout.created_at, last_item_ts])) or workout.created_at
-
-        if datetime.utcnow() - last_activity < timedelta(hours=2):
-            return None
-
-        if hasattr(workout, "finished_at"):
-            setattr(workout, "finished_at", datetime.utcnow())
-        elif hasattr(workout, "finished"):
-            setattr(workout, "finished", True)
-
-        session.add(workout)
-        await session.commit()
-
-        return workout.id
-
 # ========= Хелперы показа списков (якорь внизу) =========
-async def _show_groups(msg_or_cb, state: FSMContext):
-    groups = await _fetch_groups()
+async def _show_groups(msg_or_cb, state: FSMContext, session: AsyncSession):
+    cat = await get_catalog(session)
+    kb = cat.memo("groups_kb", lambda: _groups_kb(cat.groups))
     text = "Выбери группу мышц:"
     if isinstance(msg_or_cb, Message):
-        await msg_or_cb.answer(text, reply_markup=_groups_kb(groups))
+        await msg_or_cb.answer(text, reply_markup=kb)
     else:
-        await _edit_current_or_send(msg_or_cb, text, reply_markup=_groups_kb(groups))
+        await _edit_current_or_send(msg_or_cb, text, reply_markup=kb)
     await state.set_state(Training.choose_group)
 
-async def _show_exercises_anchored(msg_or_cb, state: FSMContext, group_id: int):
+async def _exercises_page(session: AsyncSession, group_id: int, cursor: Optional[str]) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы упражнений группы; cursor — см. Catalog.keyset."""
+    cat = await get_catalog(session)
+    cursor = cat.cursor(cursor)
+
+    def build() -> InlineKeyboardMarkup:
+        return _exercises_kb(group_id, *cat.keyset("strength", group_id, EXERCISES_PER_PAGE, cursor))
+
+    # group_id тоже из callback_data — в memo только группы из снимка
+    kb = cat.memo(("exercises_kb", group_id, cursor), build) if group_id in cat.groups_by_id else build()
+    total = len(cat.exercises("strength", group_id))
+    return f"Выбери упражнение ({total} найдено):", kb
+
+async def _show_exercises_anchored(
+    msg_or_cb, state: FSMContext, session: AsyncSession, group_id: int, cursor: Optional[str] = None
+):
     """
     Всегда держим один актуальный список упражнений внизу.
-    Создаём новое сообщение, старый список удаляем (если есть).
+    Создаём новое сообщение, старый список удаляем (если есть) — фоном, после ответа.
     """
-    exs, total = await _fetch_exercises(group_id)
-    text = f"Выбери упражнение ({total} найдено):"
+    text, kb = await _exercises_page(session, group_id, cursor)
 
     data = await state.get_data()
     old_id = data.get("hub_msg_id")
 
     if isinstance(msg_or_cb, Message):
-        sent = await msg_or_cb.answer(text, reply_markup=_exercises_kb(exs))
+        sent = await msg_or_cb.answer(text, reply_markup=kb)
     else:
-        sent = await msg_or_cb.message.answer(text, reply_markup=_exercises_kb(exs))
+        sent = await msg_or_cb.message.answer(text, reply_markup=kb)
 
-    if old_id:
-        try:
-            chat_id = msg_or_cb.chat.id if isinstance(msg_or_cb, Message) else msg_or_cb.message.chat.id
-            await (msg_or_cb.bot if isinstance(msg_or_cb, Message) else msg_or_cb.message.bot).delete_message(chat_id, old_id)
-        except Exception:
-            pass
+    cleanup_queue.defer(sent.bot, sent.chat.id, old_id)
 
     await state.update_data(hub_msg_id=sent.message_id)
     await state.set_state(Training.choose_exercise)
@@ -287,26 +262,16 @@ async def _edit_or_send(
     state: FSMContext,
 ) -> int:
     """
-    Пытаемся отредактировать msg_id. Если не получилось (удалено / не найдено) — шлём новое.
-    Возвращаем актуальный message_id и записываем его в FSM как s_last_msg.
+    Карточка уже есть — правим её через card_debouncer: частые правки склеиваются,
+    неизменные пропускаются, а если карточку удалили, он сам пришлёт новую и обновит s_last_msg.
+    Карточки нет — шлём новую сразу. Возвращаем актуальный message_id.
     """
     if msg_id:
-        try:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=msg_id,
-                text=text,
-                reply_markup=reply_markup,
-                parse_mode="HTML",
-            )
-            await state.update_data(s_last_msg=msg_id)
-            return msg_id
-        except TelegramBadRequest:
-            pass
-        except Exception:
-            pass
+        await card_debouncer.update(bot, chat_id, msg_id, text, reply_markup, state)
+        return msg_id
 
     sent = await bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode="HTML")
+    card_debouncer.remember(chat_id, sent.message_id, text, reply_markup)
     await state.update_data(s_last_msg=sent.message_id)
     return sent.message_id
 
@@ -339,37 +304,39 @@ async def _edit_current_or_send(
 
 # ========= Старт силовой =========
 @training_router.message(F.text == "🏋️ Тренировка")
-async def start_training(msg: Message, state: FSMContext):
-    await _check_autofinish(msg.from_user.id)
-
-    user = await _get_user(msg.from_user.id)
-    if not user:
+async def start_training(msg: Message, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
+    if user_ctx is None:
         await msg.answer("Сначала /start и заполни профиль. Это быстро.")
         return
 
-    workout_id = await _create_workout_for_user(msg.from_user.id)
+    workout_id = await _create_workout_for_user(session, user_ctx)
     await state.clear()
     await state.update_data(workout_id=workout_id)
 
-    await _show_groups(msg, state)
+    await _show_groups(msg, state, session)
 
 # ========= Выбор группы =========
 @training_router.callback_query(F.data.startswith("grp:"), Training.choose_group)
-async def pick_group(cb: CallbackQuery, state: FSMContext):
+async def pick_group(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
     group_id = int(cb.data.split(":", 1)[1])
-    await state.update_data(group_id=group_id)
+    await state.update_data(group_id=group_id, ex_cursor=None)
+
+    await _show_exercises_anchored(cb, state, session, group_id)
 
-    await _show_exercises_anchored(cb, state, group_id)
+# ========= Листание упражнений группы =========
+@training_router.callback_query(F.data.startswith("expage:"), Training.choose_exercise)
+async def exercises_page(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
+    await _safe_cb_answer(cb)
+    _, group_id, cursor = cb.data.split(":", 2)
+    await state.update_data(ex_cursor=cursor)
+    text, kb = await _exercises_page(session, int(group_id), cursor)
+    await _edit_current_or_send(cb, text, kb, state=state, fsm_store_key="hub_msg_id")
 
 # ========= Назад к группам =========
 @training_router.callback_query(F.data == "back:groups")
-async def back_groups(cb: CallbackQuery, state: FSMContext):
+async def back_groups(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
     # очищаем текущую карточку упражнения, если была
     await state.update_data(s_last_msg=None)
 
@@ -377,38 +344,44 @@ async def back_groups(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     old_id = data.get("hub_msg_id")
     if old_id:
-        try:
-            await cb.message.bot.delete_message(cb.message.chat.id, old_id)
-        except Exception:
-            pass
         await state.update_data(hub_msg_id=None)
 
-    await _show_groups(cb, state)
+    await _show_groups(cb, state, session)
+    cleanup_queue.defer(cb.message.bot, cb.message.chat.id, old_id)
 
 # ========= Выбор упражнения =========
 @training_router.callback_query(F.data.startswith("ex:"), Training.choose_exercise)
-async def pick_exercise(cb: CallbackQuery, state: FSMContext):
+async def pick_exercise(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
     exercise_id = int(cb.data.split(":", 1)[1])
     await state.update_data(exercise_id=exercise_id)
 
     data = await state.get_data()
     workout_id = int(data.get("workout_id") or 0)
 
-    name = await _exercise_name(exercise_id)
-    saved = await _count_sets_for_ex(workout_id, exercise_id)
-    last_w, last_r = await _last_set_for_ex(workout_id, exercise_id)
+    name = await _exercise_name(session, exercise_id)
+    saved = await _count_sets_for_ex(session, workout_id, exercise_id)
+    last = await get_last_set(session, user_ctx.user_id, exercise_id) if user_ctx else None
+
+    # последний подход пользователя в упражнении — либо из этой тренировки, либо «прошлый раз»
+    previous = None
+    if not saved:
+        last_w, last_r = None, None
+        previous = last
+    elif last is not None and last.workout_id == workout_id:
+        last_w, last_r = last.weight, last.reps
+    else:
+        # кэш другого воркера мог отстать — берём из тренировки
+        last_w, last_r = await _last_set_for_ex(session, workout_id, exercise_id)
 
-    mid = await _edit_current_or_send(
-        cb,
-        _exercise_card_text(name, saved, last_w, last_r),
-        reply_markup=_exercise_panel_kb(has_last=(saved > 0)),
-        state=state,
-        fsm_store_key="s_last_msg",
-    )
+    card_text = _exercise_card_text(name, saved, last_w, last_r, previous=previous)
+    card_kb = _exercise_panel_kb(has_last=(saved > 0), has_previous=previous is not None)
+    mid = await _edit_current_or_send(cb, card_text, reply_markup=card_kb, state=state, fsm_store_key="s_last_msg")
+    card_debouncer.remember(cb.message.chat.id, mid, card_text, card_kb)
 
+    # «🔁» повторяет последний подход — этой тренировки или прошлой
+    if previous is not None:
+        last_w, last_r = previous.weight, previous.reps
     await state.update_data(s_ex_name=name, last_weight=last_w, last_reps=last_r)
 
     # Автопоказ системной клавиатуры: ForceReply с короткой подсказкой
@@ -422,31 +395,24 @@ async def pick_exercise(cb: CallbackQuery, state: FSMContext):
 
 # ========= Завершить упражнение (только возврат к списку) =========
 @training_router.callback_query(F.data == "ex:finish", Training.log_set)
-async def finish_exercise(cb: CallbackQuery, state: FSMContext):
+async def finish_exercise(cb: CallbackQuery, state: FSMContext, session: AsyncSession):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
+    # отложенная правка карточки уходит сейчас, до списка упражнений
+    await card_debouncer.flush(cb.message.chat.id)
     data = await state.get_data()
     group_id = int(data.get("group_id") or 0)
 
-    # Чистим ForceReply-подсказку, если висит
-    prompt_id = data.get("input_prompt_msg_id")
-    if prompt_id:
-        try:
-            await cb.message.bot.delete_message(cb.message.chat.id, prompt_id)
-        except Exception:
-            pass
-        await state.update_data(input_prompt_msg_id=None)
-
-    # мы покидаем экран упражнения — редактировать карточку больше не будем
-    await state.update_data(s_last_msg=None)
+    # Чистим ForceReply-подсказку, если висит (фоном, после нового списка)
+    # и покидаем экран упражнения — редактировать карточку больше не будем
+    cleanup_queue.defer(cb.message.bot, cb.message.chat.id, data.get("input_prompt_msg_id"))
+    await state.update_data(input_prompt_msg_id=None, s_last_msg=None)
 
     if not group_id:
-        await _show_groups(cb, state)
+        await _show_groups(cb, state, session)
         return
 
-    # Всегда показываем новый список внизу и удаляем старый
-    await _show_exercises_anchored(cb, state, group_id)
+    # Всегда показываем новый список внизу (на той же странице) и удаляем старый
+    await _show_exercises_anchored(cb, state, session, group_id, data.get("ex_cursor"))
 
     # Неболтливая подсказка и возврат нашего меню
     after_ex = await cb.message.answer("Ещё одно упражнение?", reply_markup=main_menu())
@@ -455,10 +421,8 @@ async def finish_exercise(cb: CallbackQuery, state: FSMContext):
 
 # ========= Повторить прошлый подход кнопкой =========
 @training_router.callback_query(F.data == "ex:repeat", Training.log_set)
-async def repeat_last_set(cb: CallbackQuery, state: FSMContext):
+async def repeat_last_set(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
     data = await state.get_data()
     workout_id = int(data.get("workout_id") or 0)
     exercise_id = int(data.get("exercise_id") or 0)
@@ -469,21 +433,19 @@ async def repeat_last_set(cb: CallbackQuery, state: FSMContext):
         await cb.message.answer("Сначала введи первый подход вручную.")
         return
 
-    async with await get_session(settings.database_url) as session:
-        item = WorkoutItem(
-            workout_id=workout_id,
-            exercise_id=exercise_id,
-            weight=float(last_w),
-            reps=int(last_r),
-            created_at=datetime.utcnow(),
-        )
-        session.add(item)
-        await session.commit()
+    item = WorkoutItem(
+        workout_id=workout_id,
+        exercise_id=exercise_id,
+        weight=float(last_w),
+        reps=int(last_r),
+        created_at=datetime.utcnow(),
+    )
+    records = await log_item(session, item, user_ctx)
 
-    # Обновляем карточку
-    saved = await _count_sets_for_ex(workout_id, exercise_id)
-    name = data.get("s_ex_name") or await _exercise_name(exercise_id)
-    card_text = _exercise_card_text(name, saved, float(last_w), int(last_r))
+    # Обновляем карточку (autoflush отправит вставку перед подсчётом)
+    saved = await _count_sets_for_ex(session, workout_id, exercise_id)
+    name = data.get("s_ex_name") or await _exercise_name(session, exercise_id)
+    card_text = _exercise_card_text(name, saved, float(last_w), int(last_r), records)
 
     last_msg_id = int(data.get("s_last_msg") or 0)
     await _edit_or_send(
@@ -497,9 +459,7 @@ async def repeat_last_set(cb: CallbackQuery, state: FSMContext):
 
 # ========= Ввод подхода =========
 @training_router.message(Training.log_set, F.text)
-async def log_set(msg: Message, state: FSMContext):
-    await _check_autofinish(msg.from_user.id)
-
+async def log_set(msg: Message, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     raw = (msg.text or "").strip()
     m = STRENGTH_INPUT_RE.match(raw)
     if not m:
@@ -516,22 +476,21 @@ async def log_set(msg: Message, state: FSMContext):
     workout_id = int(data.get("workout_id") or 0)
     exercise_id = int(data.get("exercise_id") or 0)
     last_msg_id = int(data.get("s_last_msg") or 0)
-    ex_name = data.get("s_ex_name") or (await _exercise_name(exercise_id))
-
-    # Автовосстановление workout_id, если пропал
-    if not workout_id:
-        async with await get_session(settings.database_url) as session:
-            res = await session.exec(
-                select(Workout)
-                .join(User, User.id == Workout.user_id)
-                .where(User.tg_id == msg.from_user.id)
-                .order_by(Workout.created_at.desc())
-                .limit(1)
-            )
-            last = res.first()
-            if last:
-                workout_id = last.id
-                await state.update_data(workout_id=workout_id)
+    ex_name = data.get("s_ex_name") or (await _exercise_name(session, exercise_id))
+
+    # Автовосстановление workout_id, если пропал (открытая тренировка уже в user_ctx)
+    if not workout_id and user_ctx and user_ctx.workout_id:
+        workout_id = user_ctx.workout_id
+        await state.update_data(workout_id=workout_id)
+
+    # Тренировку закрыл autofinish, пока пользователь отдыхал дольше лимита
+    # (или кэш этого воркера не видел тренировку, начатую в другом — перечитываем)
+    if workout_id and user_ctx and user_ctx.workout_id != workout_id:
+        user_ctx = await reload_user_context(session, user_ctx.tg_id)
+    if workout_id and user_ctx and user_ctx.workout_id != workout_id:
+        await msg.answer("Тренировка закрыта по неактивности. Нажми «🏋️ Тренировка», чтобы начать новую.")
+        await state.clear()
+        return
 
     if not exercise_id:
         await msg.answer("Не выбрано упражнение. Сначала нажми на упражнение в списке.")
@@ -544,20 +503,18 @@ async def log_set(msg: Message, state: FSMContext):
         return
 
     # Сохраняем подход
-    async with await get_session(settings.database_url) as session:
-        item = WorkoutItem(
-            workout_id=workout_id,
-            exercise_id=exercise_id,
-            weight=weight,
-            reps=reps,
-            created_at=datetime.utcnow(),
-        )
-        session.add(item)
-        await session.commit()
+    item = WorkoutItem(
+        workout_id=workout_id,
+        exercise_id=exercise_id,
+        weight=weight,
+        reps=reps,
+        created_at=datetime.utcnow(),
+    )
+    records = await log_item(session, item, user_ctx)
 
-    # Обновляем карточку: счётчик и «Последний»
-    saved = await _count_sets_for_ex(workout_id, exercise_id)
-    card_text = _exercise_card_text(ex_name, saved, weight, reps)
+    # Обновляем карточку: счётчик, «Последний» и побитые рекорды
+    saved = await _count_sets_for_ex(session, workout_id, exercise_id)
+    card_text = _exercise_card_text(ex_name, saved, weight, reps, records)
     await state.update_data(last_weight=weight, last_reps=reps)
 
     await _edit_or_send(
@@ -571,10 +528,8 @@ async def log_set(msg: Message, state: FSMContext):
 
 # ========= Завершить ВСЮ тренировку (только вне упражнения) =========
 @training_router.callback_query(F.data == "workout:finish")
-async def workout_finish(cb: CallbackQuery, state: FSMContext):
+async def workout_finish(cb: CallbackQuery, state: FSMContext, session: AsyncSession, user_ctx: Optional[UserContext]):
     await _safe_cb_answer(cb)
-    await _check_autofinish(cb.from_user.id)
-
     data = await state.get_data()
     cur = await state.get_state()
     if cur and cur.endswith("log_set"):
@@ -583,46 +538,25 @@ async def workout_finish(cb: CallbackQuery, state: FSMContext):
 
     workout_id = int(data.get("workout_id") or 0)
 
-    # если потеряли id тренировки — найдём последнюю по пользователю
-    if not workout_id:
-        async with await get_session(settings.database_url) as session:
-            res = await session.exec(
-                select(Workout)
-                .join(User, User.id == Workout.user_id)
-                .where(User.tg_id == cb.from_user.id)
-                .order_by(Workout.created_at.desc())
-                .limit(1)
-            )
-            last = res.first()
-            workout_id = last.id if last else 0
+    # если потеряли id тренировки — берём открытую из user_ctx
+    if not workout_id and user_ctx:
+        workout_id = user_ctx.workout_id or 0
 
     if not workout_id:
         await _edit_current_or_send(cb, "Активной тренировки не найдено. Нажми «🏋️ Тренировка».")
         await state.clear()
         return
 
-        # подчистим «Ещё одно упражнение?» если висит
-    data = await state.get_data()
-    try:
-        after_ex_id = data.get("after_ex_msg_id")
-        if after_ex_id:
-            await cb.message.bot.delete_message(cb.message.chat.id, after_ex_id)
-    except Exception:
-        pass
-    finally:
-        await state.update_data(after_ex_msg_id=None)
-
-    # заодно уберём якорь списка упражнений, чтобы не болтался под финалкой
-    try:
-        hub_id = data.get("hub_msg_id")
-        if hub_id:
-            await cb.message.bot.delete_message(cb.message.chat.id, hub_id)
-    except Exception:
-        pass
-    finally:
-        await state.update_data(hub_msg_id=None)
+    # подчистим «Ещё одно упражнение?» и якорь списка упражнений, чтобы не болтались под финалкой
+    # (фоном: итоги уходят первыми)
+    cleanup_queue.defer(cb.message.bot, cb.message.chat.id, data.get("after_ex_msg_id"), data.get("hub_msg_id"))
 
-    sets_cnt, lifted = await _workout_totals(workout_id)
+    await session.exec(
+        update(Workout)
+        .where(Workout.id == workout_id, Workout.finished_at.is_(None))
+        .values(finished_at=datetime.utcnow())
+    )
+    sets_cnt, lifted = await _workout_totals(session, workout_id)
     await _edit_current_or_send(
         cb,
         "🏁 Тренировка завершена!\n"
@@ -631,3 +565,4 @@ async def workout_finish(cb: CallbackQuery, state: FSMContext):
         reply_markup=main_menu(),  # ← добавили главное меню
     )
     await state.clear()
+    invalidate_user(cb.from_user.id)
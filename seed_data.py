@@ -1,6 +1,8 @@
 # seed_data.py — идемпотентное наполнение БД базовыми группами и упражнениями
 from sqlmodel import select
-from db import get_session, MuscleGroup, Exercise
+from catalog import bump_catalog_version
+from catalog_import import ImportStats, upsert_exercises
+from db import get_session, MuscleGroup
 from config import settings
 
 # Базовые группы (slug -> имя)
@@ -35,9 +37,12 @@ async def ensure_seed_data():
         # 1) Группы
         res = await session.exec(select(MuscleGroup))
         existing_groups = {g.slug: g for g in res.all()}
+        new_groups = [slug for slug, _ in DEFAULT_GROUPS if slug not in existing_groups]
         for slug, name in DEFAULT_GROUPS:
             if slug not in existing_groups:
                 session.add(MuscleGroup(slug=slug, name=name))
+        if new_groups:
+            await bump_catalog_version(session)
         await session.commit()
 
         # перечитать с id
@@ -45,23 +50,18 @@ async def ensure_seed_data():
         groups = {g.slug: g for g in res.all()}
 
         # 2) Упражнения (по slug, без апдейтов существующих — идемпотентно)
-        res = await session.exec(select(Exercise))
-        existing = {e.slug: e for e in res.all() if getattr(e, "slug", None)}
-        to_add = []
-        for name, slug, etype, gslug, tip in EXERCISES:
-            if slug in existing:
-                continue
-            mg = groups.get(gslug)
-            to_add.append(
-                Exercise(
-                    name=name,
-                    slug=slug,
-                    type=etype,
-                    primary_muscle_id=mg.id if mg else None,
-                    tip=tip,
-                )
-            )
-        if to_add:
-            for e in to_add:
-                session.add(e)
-            await session.commit()
+        rows = [
+            {
+                "slug": slug,
+                "name": name,
+                "type": etype,
+                "primary_muscle_id": groups[gslug].id if gslug in groups else None,
+                "tip": tip,
+            }
+            for name, slug, etype, gslug, tip in EXERCISES
+        ]
+        stats = ImportStats()
+        await upsert_exercises(session, rows, stats, overwrite=False)
+        if stats.inserted:
+            await bump_catalog_version(session)
+        await session.commit()
@@ -1,29 +1,79 @@
+import asyncio
+import logging
+
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
 from aiogram import Bot, Dispatcher
-from aiogram.types import Update, BotCommand, MenuButtonDefault
+from aiogram.types import Update
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import settings
-from db import init_db
-from seed_data import ensure_seed_data
+from middlewares import setup_middlewares
+from rate_limit import setup_rate_limit
+from fsm_storage import create_storage
+from update_queue import UpdateQueue
+from health import LoopLagMonitor, readiness
+from metrics import registry, setup_metrics
+import sql_trace
+import last_set
+import report_cache
+from card_debounce import card_debouncer
+from cleanup import cleanup_queue
+from catalog import load_catalog, run_catalog_refresher
+from db import dispose_engines, get_session
+from autofinish import run_autofinish_sweeper
+from startup import prepare_db, setup_telegram
 from routers import basic_router, profile_router, training_router, cardio_router, reports_router, feedback_router
 
+logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # ================================================================
 # Инициализация FastAPI и бота
 # ================================================================
 app = FastAPI()
 
 @app.get("/health")
-async def health():
-    return {"status": "ok"}
+@app.get("/livez")
+async def livez():
+    # ответили — значит цикл событий жив; задержку показываем для диагностики
+    return {"status": "ok", "loop_lag_ms": round(loop_lag.lag * 1000, 2)}
+
+@app.get("/readyz")
+async def readyz():
+    ok, checks = await readiness(dp.storage, loop_lag, update_queue.depth, update_queue.in_flight)
+    return JSONResponse({"status": "ok" if ok else "fail", "checks": checks}, status_code=200 if ok else 503)
+
+@app.get("/stats")
+async def stats():
+    return {
+        "updates": update_queue.stats(),
+        "telegram": rate_limiter.stats(),
+        "cards": card_debouncer.stats(),
+        "cleanup": cleanup_queue.stats(),
+        "report_cache": report_cache.stats(),
+        "last_set_cache": last_set.stats(),
+    }
+
+@app.get("/debug/sql")
+async def debug_sql(limit: int = 20):
+    if not settings.sql_trace:
+        raise HTTPException(status_code=404, detail="SQL_TRACE выключен")
+    return {"slowest": sql_trace.slowest(limit)}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # Сначала создаём бота и диспетчер
 bot = Bot(
     settings.bot_token,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML),
 )
-dp = Dispatcher()
+rate_limiter = setup_rate_limit(bot)
+dp = Dispatcher(storage=create_storage())
+setup_middlewares(dp)
 
 # И только потом подключаем роутеры
 # (порядок важен, чтобы кардио не перехватывалось силовыми)
@@ -34,6 +84,16 @@ dp.include_router(basic_router)
 dp.include_router(reports_router)
 dp.include_router(feedback_router)
 
+# Метрики хэндлеров и Bot API (после RateLimiter — ожидание бакета в замер не входит)
+setup_metrics(dp, bot)
+
+# Очередь апдейтов: вебхук отвечает сразу, обработка — в пуле воркеров
+update_queue = UpdateQueue(dp, bot, workers=settings.update_workers, maxsize=settings.update_queue_size)
+loop_lag = LoopLagMonitor()
+registry.gauge("bot_update_queue_depth", "Апдейты в очереди", lambda: update_queue.depth)
+registry.gauge("bot_update_in_flight", "Апдейты в обработке", lambda: update_queue.in_flight)
+registry.gauge("bot_event_loop_lag_seconds", "Задержка цикла событий", lambda: loop_lag.lag)
+
 # ================================================================
 # События запуска и остановки
 # ================================================================
@@ -42,20 +102,36 @@ async def on_startup():
     if not settings.bot_token:
         raise RuntimeError("BOT_TOKEN не задан")
 
-    # Инициализация базы и сид
-    await init_db(settings.database_url)
-    await ensure_seed_data()
+    # Схема и сид — только если изменились с прошлого запуска (отпечатки в Meta)
+    meta = await prepare_db(settings.database_url)
+
+    # Снимок справочника: экраны выбора групп/упражнений/тренажёров работают без запросов
+    async with await get_session(settings.database_url) as session:
+        await load_catalog(session)
+    app.state.catalog_task = asyncio.create_task(run_catalog_refresher(settings.database_url))
 
-    # Команды бота
-    await bot.delete_my_commands()
-    await bot.set_chat_menu_button(menu_button=MenuButtonDefault())
+    # Команды, меню и вебхук — сверяем с тем, что уже стоит; апдейты, пришедшие
+    # во время рестарта, не сбрасываем
+    await setup_telegram(bot, settings.database_url, meta)
 
-    # Устанавливаем вебхук
-    await bot.set_webhook(settings.webhook_url, drop_pending_updates=True)
+    update_queue.start()
+    loop_lag.start()
+
+    # Фоновое автозакрытие брошенных тренировок
+    app.state.autofinish_task = asyncio.create_task(run_autofinish_sweeper(settings.database_url))
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    for name in ("autofinish_task", "catalog_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await loop_lag.stop()
+    await update_queue.stop()
+    await cleanup_queue.close()
     await bot.session.close()
+    await dp.storage.close()
+    await dispose_engines()
 
 # ================================================================
 # Вебхук
@@ -66,6 +142,11 @@ async def telegram_webhook(request: Request):
         data = await request.json()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    update = Update.model_validate(data)
-    await dp.feed_update(bot, update)
+    try:
+        update = Update.model_validate(data, context={"bot": bot})
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not update_queue.put(update):
+        # очередь полна — пусть Telegram повторит доставку позже
+        raise HTTPException(status_code=503, detail="update queue is full")
     return {"ok": True}
@@ -0,0 +1,169 @@
+# sql_trace.py — трассировка SQL по апдейтам и поиск N+1 (включается SQL_TRACE=1)
+#
+# Каждый запрос (текст, длительность, число строк) записывается под update_id текущего апдейта.
+# В конце апдейта предупреждение в лог, если запросов больше SQL_TRACE_BUDGET или один и тот же
+# запрос (с точностью до параметров) повторился SQL_TRACE_REPEAT раз и больше — похоже на N+1.
+# SQL_TRACE_KEEP самых медленных апдейтов доступны в GET /debug/sql (server.py).
+# capture() — то же самое вокруг произвольного кода (бенчмарки, проверки числа запросов).
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+log = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+# IN (?, ?, ?) / IN ($1, $2) / IN (__[POSTCOMPILE_x]) — одна форма независимо от длины списка
+_IN_RE = re.compile(r"IN \((?:[^()]*?)\)", re.IGNORECASE)
+
+
+def statement_shape(statement: str) -> str:
+    return _IN_RE.sub("IN (…)", _WS_RE.sub(" ", statement).strip())
+
+
+@dataclass
+class TracedStatement:
+    sql: str
+    seconds: float
+    rows: Optional[int]
+
+
+@dataclass
+class Trace:
+    label: str
+    statements: list[TracedStatement] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    seconds: float = 0.0
+    closed: bool = False
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(s.seconds for s in self.statements)
+
+    def repeats(self, threshold: int) -> list[tuple[str, int]]:
+        shapes = Counter(statement_shape(s.sql) for s in self.statements)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+    def as_dict(self) -> dict:
+        return {
+            "update": self.label,
+            "seconds": round(self.seconds, 6),
+            "db_seconds": round(self.db_seconds, 6),
+            "queries": len(self.statements),
+            "statements": [
+                {"sql": s.sql, "ms": round(s.seconds * 1000, 3), "rows": s.rows} for s in self.statements
+            ],
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("sql_trace", default=None)
+
+# самые медленные апдейты: min-heap по времени, счётчик — чтобы не сравнивать Trace между собой
+_slowest: list[tuple[float, int, Trace]] = []
+_seq = itertools.count()
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None and _current.get() is not None:
+        context._trace_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    trace = _current.get()
+    if trace is None or trace.closed:
+        # фоновые задачи наследуют контекст апдейта и после его окончания
+        return
+    started = getattr(context, "_trace_started", None)
+    seconds = time.perf_counter() - started if started is not None else 0.0
+    trace.statements.append(TracedStatement(statement, seconds, _row_count(cursor)))
+
+
+def _row_count(cursor) -> Optional[int]:
+    """
+    Строк вернул или затронул запрос. У SELECT (и RETURNING) rowcount драйвера -1 (aiosqlite, asyncpg),
+    но async-адаптеры SQLAlchemy к after_cursor_execute уже выбрали результат в буфер — считаем его.
+    None — неизвестно (server-side курсор, executemany без rowcount).
+    """
+    if getattr(cursor, "description", None) is not None:
+        buffered = getattr(cursor, "_rows", None)
+        if buffered is not None and not getattr(cursor, "server_side", False):
+            return len(buffered)
+    rowcount = getattr(cursor, "rowcount", -1)
+    return rowcount if rowcount is not None and rowcount >= 0 else None
+
+
+def install() -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+
+
+def _finish(trace: Trace) -> None:
+    trace.closed = True
+    trace.seconds = time.perf_counter() - trace.started
+
+    budget = settings.sql_trace_budget
+    if budget and len(trace.statements) > budget:
+        log.warning(
+            "%s: %d SQL queries (budget %d), %.1f ms in DB",
+            trace.label, len(trace.statements), budget, trace.db_seconds * 1000,
+        )
+    for shape, n in trace.repeats(settings.sql_trace_repeat):
+        log.warning("%s: possible N+1 — %d× %s", trace.label, n, shape[:300])
+
+    entry = (trace.seconds, next(_seq), trace)
+    if len(_slowest) < settings.sql_trace_keep:
+        heapq.heappush(_slowest, entry)
+    elif entry[0] > _slowest[0][0]:
+        heapq.heapreplace(_slowest, entry)
+
+
+@contextmanager
+def capture(label: str = "capture") -> Iterator[Trace]:
+    """Трассировка блока кода; Trace доступен и после выхода (statements, db_seconds)."""
+    install()
+    trace = Trace(label)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _finish(trace)
+
+
+def slowest(limit: Optional[int] = None) -> list[dict]:
+    """Самые медленные апдейты (по убыванию) с их запросами."""
+    ordered = sorted(_slowest, key=lambda e: e[0], reverse=True)
+    return [trace.as_dict() for _, _, trace in ordered[:limit]]
+
+
+class SqlTraceMiddleware(BaseMiddleware):
+    """Внешний на dp.update, до DbSessionMiddleware — чтобы в трассу попал и коммит."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            label = f"update {event.update_id} ({event.event_type})"
+        else:
+            label = type(event).__name__
+        with capture(label):
+            return await handler(event, data)
@@ -0,0 +1,102 @@
+# startup.py — быстрый старт: не повторяем то, что уже применено
+#
+# Каждый запуск (и каждый воркер) раньше гонял create_all + миграции, полный сид
+# и delete_my_commands / set_chat_menu_button / set_webhook(drop_pending_updates=True),
+# теряя апдейты, пришедшие во время рестарта. Теперь в Meta лежат отпечатки схемы, сида
+# и настройки Telegram; если они совпадают с кодом, шаг пропускается. Вебхук сверяется
+# с get_webhook_info и ставится только при расхождении — без сброса очереди.
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import MenuButtonDefault
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import SQLModel, select
+
+from config import settings
+from db import Meta, get_session, init_db, set_meta
+from migrations import MIGRATIONS
+from seed_data import DEFAULT_GROUPS, EXERCISES, ensure_seed_data
+
+log = logging.getLogger(__name__)
+
+SCHEMA_KEY = "schema_fingerprint"
+SEED_KEY = "seed_fingerprint"
+TELEGRAM_KEY = "telegram_setup"
+
+
+def _digest(*parts: object) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode())
+    return h.hexdigest()
+
+
+def schema_fingerprint() -> str:
+    """Таблицы, колонки и индексы моделей + список миграций."""
+    tables = []
+    for table in sorted(SQLModel.metadata.tables.values(), key=lambda t: t.name):
+        columns = [(c.name, repr(c.type), c.nullable, c.primary_key) for c in table.columns]
+        indexes = sorted(str(i.name) for i in table.indexes)
+        tables.append((table.name, columns, indexes))
+    return _digest(tables, [(version, name) for version, name, _ in MIGRATIONS])
+
+
+def seed_fingerprint() -> str:
+    return _digest(DEFAULT_GROUPS, EXERCISES)
+
+
+def telegram_fingerprint(bot: Bot) -> str:
+    # команды сбрасываем, меню — по умолчанию; другой бот — другой отпечаток
+    return _digest(bot.id, "no-commands", "menu-default")
+
+
+async def _read_meta(db_url: str) -> dict[str, str]:
+    """Meta целиком (там несколько строк); на пустой базе таблицы ещё нет — пустой dict."""
+    try:
+        async with await get_session(db_url) as session:
+            return dict((await session.exec(select(Meta.key, Meta.value))).all())
+    except DBAPIError:
+        return {}
+
+
+async def prepare_db(db_url: str) -> dict[str, str]:
+    """Схема и сид — только если их отпечатки в Meta не совпадают с кодом. Возвращает Meta."""
+    meta = await _read_meta(db_url)
+    schema_fp = schema_fingerprint()
+    if meta.get(SCHEMA_KEY) != schema_fp:
+        await init_db(db_url)
+        async with await get_session(db_url) as session:
+            await set_meta(session, SCHEMA_KEY, schema_fp)
+            await session.commit()
+        log.info("schema checked and migrated")
+
+    seed_fp = seed_fingerprint()
+    if meta.get(SEED_KEY) != seed_fp:
+        await ensure_seed_data()
+        async with await get_session(db_url) as session:
+            await set_meta(session, SEED_KEY, seed_fp)
+            await session.commit()
+        log.info("seed data applied")
+    return meta
+
+
+async def setup_telegram(bot: Bot, db_url: str, meta: Optional[dict[str, str]] = None) -> None:
+    """Вебхук — по get_webhook_info и без drop_pending_updates; команды и меню — по отпечатку."""
+    info = await bot.get_webhook_info()
+    if info.url != settings.webhook_url:
+        await bot.set_webhook(settings.webhook_url)
+        log.info("webhook set to %s (pending updates kept: %s)", settings.webhook_url, info.pending_update_count)
+
+    if meta is None:
+        meta = await _read_meta(db_url)
+    tg_fp = telegram_fingerprint(bot)
+    if meta.get(TELEGRAM_KEY) != tg_fp:
+        await bot.delete_my_commands()
+        await bot.set_chat_menu_button(menu_button=MenuButtonDefault())
+        async with await get_session(db_url) as session:
+            await set_meta(session, TELEGRAM_KEY, tg_fp)
+            await session.commit()
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from analytics import (
+    StrengthHistory,
+    brzycki,
+    e1rm,
+    epley,
+    exercise_progress,
+    load_strength_history,
+    pr_events,
+    rolling_volume,
+    tonnage_by_period,
+)
+from db import Exercise, User, Workout, WorkoutItem
+
+
+def _history(rows, prior_best=None):
+    """rows: (exercise_id, workout_id, datetime, weight, reps) по времени."""
+    h = StrengthHistory(prior_best=dict(prior_best or {}))
+    for ex_id, w_id, ts, weight, reps in rows:
+        h.exercise_id.append(ex_id)
+        h.workout_id.append(w_id)
+        h.day.append(ts.toordinal())
+        h.weight.append(weight)
+        h.reps.append(reps)
+        h.created_at.append(ts)
+    return h
+
+
+ROWS = [
+    (1, 10, datetime(2026, 1, 5, 10), 100.0, 5),    # понедельник
+    (1, 10, datetime(2026, 1, 5, 10, 5), 100.0, 5),
+    (2, 10, datetime(2026, 1, 5, 10, 10), 40.0, 15),  # 15 повторов — не в оценку 1ПМ
+    (1, 11, datetime(2026, 1, 12, 10), 110.0, 3),
+    (1, 12, datetime(2026, 2, 20, 10), 90.0, 10),
+]
+
+
+def test_formulas():
+    assert epley(100, 1) == brzycki(100, 1) == 100
+    assert epley(100, 5) == pytest.approx(116.667, abs=1e-3)
+    assert brzycki(100, 5) == pytest.approx(112.5)
+    assert e1rm(100, 13) is None and e1rm(0, 5) is None
+    assert e1rm(100, 5, "brzycki") == pytest.approx(112.5)
+
+
+def test_exercise_progress_best_set_and_session():
+    p = exercise_progress(_history(ROWS))
+    bench = p[1]
+    assert (bench.sets, bench.reps, bench.max_weight) == (4, 23, 110.0)
+    assert bench.tonnage == pytest.approx(100 * 5 * 2 + 330 + 900)
+    assert (bench.best.weight, bench.best.reps) == (110.0, 3)      # 121.0 > 120.0 > 116.7
+    assert bench.best_session_tonnage == 1000
+    assert p[2].best is None and p[2].tonnage == 600
+
+
+def test_tonnage_by_period_and_rolling_volume():
+    h = _history(ROWS)
+    assert tonnage_by_period(h, "week") == [(date(2026, 1, 5), 1600.0), (date(2026, 1, 12), 330.0), (date(2026, 2, 16), 900.0)]
+    assert tonnage_by_period(h, "month", exercise_id=1) == [(date(2026, 1, 1), 1330.0), (date(2026, 2, 1), 900.0)]
+    assert tonnage_by_period(h, "year") == [(date(2026, 1, 1), 2830.0)]
+    # окно 28 дней: 12.01 ещё видит 05.01, 20.02 — уже нет
+    assert rolling_volume(h, 28) == [(date(2026, 1, 5), 1600.0), (date(2026, 1, 12), 1930.0), (date(2026, 2, 20), 900.0)]
+
+
+def test_pr_events_against_prior_best():
+    events = pr_events(_history(ROWS))
+    assert [(e.index, e.kind, e.value) for e in events] == [(3, "weight", 110.0), (3, "e1rm", pytest.approx(121.0))]
+    # лучший e1RM до окна выше всего в окне — рекордов 1ПМ нет
+    assert not [e for e in pr_events(_history(ROWS, prior_best={1: 130.0})) if e.kind == "e1rm"]
+
+
+async def _load(since):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add_all([User(id=1, tg_id=1), User(id=2, tg_id=2)])
+        session.add_all([Exercise(id=i, slug=f"e{i}", name=f"E{i}") for i in (1, 2)])
+        session.add_all([Workout(id=w, user_id=1, title="t") for w in (10, 11, 12)] + [Workout(id=99, user_id=2, title="t")])
+        for ex_id, w_id, ts, weight, reps in ROWS:
+            session.add(WorkoutItem(exercise_id=ex_id, workout_id=w_id, created_at=ts, weight=weight, reps=reps))
+        # кардио и чужие подходы в историю не попадают
+        session.add(WorkoutItem(exercise_id=2, workout_id=10, created_at=ROWS[0][2], duration_sec=600))
+        session.add(WorkoutItem(exercise_id=1, workout_id=99, created_at=ROWS[0][2], weight=300.0, reps=1))
+        await session.commit()
+        h = await load_strength_history(session, 1, since)
+    await engine.dispose()
+    return h
+
+
+def test_load_strength_history_columns_and_prior_best():
+    h = asyncio.run(_load(None))
+    assert list(h.weight) == [r[3] for r in ROWS] and list(h.reps) == [r[4] for r in ROWS]
+    assert h.prior_best == {}
+
+    h = asyncio.run(_load(datetime(2026, 1, 10)))
+    assert list(h.weight) == [110.0, 90.0]
+    # до окна: упр. 1 — 100×5 (Эпли), упр. 2 — 15 повторов, оценки нет
+    assert h.prior_best == {1: pytest.approx(116.667, abs=1e-3)}
@@ -0,0 +1,50 @@
+import asyncio
+
+from card_debounce import CardDebouncer
+
+WINDOW = 0.1
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits: list[str] = []
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        await asyncio.sleep(0)
+        self.edits.append(text)
+
+
+async def _scenario():
+    bot, cards = FakeBot(), CardDebouncer(WINDOW)
+
+    # один подход — правка сразу, без ожидания окна
+    await cards.update(bot, 1, 10, "set 1", None, state=None)
+    first = list(bot.edits)
+
+    # пачка подходов в окне — склеиваются, уходит последний в конце окна
+    for n in (2, 3, 4):
+        await cards.update(bot, 1, 10, f"set {n}", None, state=None)
+    during = list(bot.edits)
+    await asyncio.sleep(WINDOW * 2)
+    after_window = list(bot.edits)
+
+    # тишина дольше окна — снова сразу
+    await asyncio.sleep(WINDOW * 3)
+    await cards.update(bot, 1, 10, "set 5", None, state=None)
+    quiet = list(bot.edits)
+
+    # то же, что уже показано, не отправляется; flush отдаёт отложенное сразу
+    await cards.update(bot, 1, 10, "set 5", None, state=None)
+    await cards.update(bot, 1, 10, "set 6", None, state=None)
+    await cards.flush(1)
+    return first, during, after_window, quiet, list(bot.edits), cards.stats()
+
+
+def test_first_edit_is_immediate_and_burst_is_merged():
+    first, during, after_window, quiet, final, stats = asyncio.run(_scenario())
+    assert first == ["set 1"]
+    assert during == ["set 1"]
+    assert after_window == ["set 1", "set 4"]
+    assert quiet == ["set 1", "set 4", "set 5"]
+    assert final == ["set 1", "set 4", "set 5", "set 6"]
+    assert stats["coalesced"] == 2 and stats["skipped"] == 1
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from catalog_import import import_rows, read_rows
+from db import Exercise, MuscleGroup
+
+GOOD = [
+    {"slug": "bench_press", "name": "Жим лежа", "group": "chest"},
+    {"slug": "treadmill", "name": "Беговая дорожка", "type": "cardio"},
+]
+INVALID = [
+    {"slug": "Bad Slug!", "name": "x"},             # некорректный slug
+    {"slug": "no_name"},                             # пустое name
+    {"slug": "bad_group", "name": "y", "group": "nope"},
+]
+
+
+async def _import(path):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(MuscleGroup(slug="chest", name="Грудь"))
+        await session.commit()
+        stats = await import_rows(session, read_rows(path), chunk=1)
+        slugs = set((await session.exec(select(Exercise.slug))).all())
+    await engine.dispose()
+    return stats, slugs
+
+
+def _check(stats, slugs, malformed):
+    assert stats.inserted == len(GOOD)
+    assert stats.skipped == len(INVALID) + malformed
+    assert len(stats.errors) == stats.skipped
+    assert sum("некорректный JSON" in e for e in stats.errors) == malformed
+    assert slugs == {r["slug"] for r in GOOD}
+
+
+def test_jsonl_skips_malformed_and_invalid_lines(tmp_path):
+    lines = [json.dumps(GOOD[0], ensure_ascii=False), '{"slug": "broken", "name": ']
+    lines += [json.dumps(r, ensure_ascii=False) for r in INVALID]
+    lines += ["not json at all", json.dumps(GOOD[1], ensure_ascii=False)]
+    path = tmp_path / "exercises.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    stats, slugs = asyncio.run(_import(path))
+    _check(stats, slugs, malformed=2)
+    assert stats.errors[0].startswith("строка 2:")
+
+
+@pytest.mark.parametrize("bufsize", [1, 1 << 16])
+def test_json_array_skips_malformed_and_invalid_elements(tmp_path, monkeypatch, bufsize):
+    import catalog_import
+
+    parts = [json.dumps(GOOD[0], ensure_ascii=False), '{"slug": "broken", "name": "a" "b"}']
+    parts += [json.dumps(r, ensure_ascii=False) for r in INVALID]
+    parts += ['{"slug": "x", "tip": "скобка ] и запятая, в строке" oops}', json.dumps(GOOD[1], ensure_ascii=False)]
+    path = tmp_path / "exercises.json"
+    path.write_text("[\n" + ",\n".join(parts) + "\n]\n", encoding="utf-8")
+
+    # мелкий буфер — элементы рвутся на границах чтения
+    original = catalog_import._iter_json_array
+    monkeypatch.setattr(catalog_import, "_iter_json_array", lambda f: original(f, bufsize=bufsize))
+
+    stats, slugs = asyncio.run(_import(path))
+    _check(stats, slugs, malformed=2)
@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import last_set
+from db import User, Workout, WorkoutItem, dispose_engines, get_session, init_db
+from middlewares import DbSessionMiddleware
+from workout_log import log_item
+
+
+async def _run(db_url, fail):
+    """Подход через DbSessionMiddleware; fail — хэндлер падает после записи (например, send_message)."""
+    async def handler(event, data):
+        session = data["session"]
+        item = WorkoutItem(workout_id=1, exercise_id=1, weight=80.0, reps=5, created_at=datetime.utcnow())
+        await log_item(session, item)
+        assert last_set._cache.get((1, 1)) is None      # до коммита кэш не трогаем
+        if fail:
+            raise RuntimeError("send_message failed")
+
+    await DbSessionMiddleware(db_url)(handler, None, {})
+
+
+def test_last_set_cached_only_after_commit(tmp_path):
+    db_url = f"sqlite+aiosqlite:///{tmp_path / 'bot.sqlite3'}"
+
+    async def scenario():
+        await init_db(db_url)
+        async with await get_session(db_url) as session:
+            session.add(User(id=1, tg_id=100))
+            session.add(Workout(id=1, user_id=1, title="t"))
+            await session.commit()
+        last_set._cache.pop((1, 1))
+
+        with pytest.raises(RuntimeError):
+            await _run(db_url, fail=True)
+        assert last_set._cache.get((1, 1)) is None
+        async with await get_session(db_url) as session:
+            assert await last_set.get_last_set(session, 1, 1) is None
+
+        await _run(db_url, fail=False)
+        cached = last_set._cache.get((1, 1))
+        await dispose_engines()
+        return cached
+
+    cached = asyncio.run(scenario())
+    assert (cached.weight, cached.reps, cached.workout_id) == (80.0, 5, 1)
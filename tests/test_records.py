@@ -0,0 +1,111 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import Exercise, PersonalRecord, User, Workout, WorkoutItem
+from records import E1RM, REPS, SESSION, WEIGHT, apply_item, rebuild_records
+
+START = datetime(2026, 10, 1, 10, 0)
+
+
+async def _engine():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    return engine
+
+
+def _snapshot(rows):
+    # last_broken после пересборки всегда 0 — это свойство последнего подхода, а не истории
+    return sorted(
+        tuple(round(v, 6) if isinstance(v, float) else v for k, v in r.model_dump().items() if k != "last_broken")
+        for r in rows
+    )
+
+
+async def _broken_sequence(sets):
+    """sets: (workout_id, weight, reps) по упражнению 1; маска побитых рекордов на каждый подход."""
+    engine = await _engine()
+    masks = []
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(User(id=1, tg_id=1))
+        session.add(Exercise(id=1, slug="bench_press", name="Жим лежа"))
+        for w_id in sorted({s[0] for s in sets}):
+            session.add(Workout(id=w_id, user_id=1, title="t", created_at=START))
+        await session.flush()
+        for n, (w_id, weight, reps) in enumerate(sets):
+            item = WorkoutItem(
+                workout_id=w_id, exercise_id=1, created_at=START + timedelta(minutes=n), weight=weight, reps=reps,
+            )
+            session.add(item)
+            broken = await apply_item(session, 1, item)
+            masks.append(sum(broken))
+        await session.commit()
+        record = (await session.exec(select(PersonalRecord))).one()
+    await engine.dispose()
+    return masks, record
+
+
+def test_upsert_returns_broken_records():
+    masks, record = asyncio.run(_broken_sequence([
+        (1, 100.0, 5),    # первый подход — планка, не рекорд
+        (1, 100.0, 6),    # тот же вес, больше повторов; 1ПМ 120 > 116.7
+        (1, 110.0, 1),    # тяжелее; 1ПМ 110 — не рекорд
+        (1, 90.0, 5),     # ничего
+        (2, 80.0, 10),    # тоннаж 800 < 1660
+        (2, 80.0, 10),    # 1600 < 1660
+        (2, 80.0, 10),    # 2400 — тренировка обогнала лучшую
+        (2, 80.0, 10),    # 3200 — она сама и есть лучшая, повторно не рекорд
+        (2, None, None),  # не силовой подход — рекорды не трогает
+    ]))
+    assert masks == [0, REPS | E1RM, WEIGHT, 0, 0, 0, SESSION, 0, 0]
+    assert (record.max_weight, record.max_weight_reps) == (110.0, 1)
+    assert record.best_e1rm == 120.0
+    assert (record.best_session_tonnage, record.session_tonnage, record.session_workout_id) == (3200.0, 3200.0, 2)
+    assert (record.last_weight, record.last_reps) == (80.0, 10)
+
+
+async def _incremental_vs_rebuild(seed):
+    rnd = random.Random(seed)
+    engine = await _engine()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        for ex_id in (1, 2, 3):
+            session.add(Exercise(id=ex_id, slug=f"ex{ex_id}", name=f"ex{ex_id}"))
+        ts, w_id = START, 0
+        for user_id in (1, 2):
+            session.add(User(id=user_id, tg_id=user_id))
+            for _ in range(8):
+                w_id += 1
+                ts += timedelta(days=rnd.randint(0, 2), hours=1)
+                session.add(Workout(id=w_id, user_id=user_id, title="t", created_at=ts))
+                await session.flush()
+                for _ in range(rnd.randint(1, 10)):
+                    ts += timedelta(minutes=3)
+                    weight = rnd.choice([None, 0.0, 40.0, 60.0, 60.0, 80.0, 82.5])
+                    reps = rnd.choice([None, 1, 3, 5, 5, 8, 12, 20])
+                    item = WorkoutItem(
+                        workout_id=w_id, exercise_id=rnd.randint(1, 3), created_at=ts, weight=weight, reps=reps,
+                    )
+                    session.add(item)
+                    await session.flush()
+                    await apply_item(session, user_id, item)
+        await session.commit()
+        incremental = _snapshot((await session.exec(select(PersonalRecord))).all())
+
+        await rebuild_records(session)
+        await session.commit()
+        session.expire_all()
+        rebuilt = _snapshot((await session.exec(select(PersonalRecord))).all())
+    await engine.dispose()
+    return incremental, rebuilt
+
+
+def test_incremental_records_match_rebuild():
+    for seed in (1, 2, 3):
+        incremental, rebuilt = asyncio.run(_incremental_vs_rebuild(seed))
+        assert incremental
+        assert incremental == rebuilt
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import Exercise, User, Workout, WorkoutItem
+from routers import reports
+from routers.reports import _aggregate, _render, _since_for
+from workout_log import log_item
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+EXERCISES = [
+    (1, "bench_press", "Жим лежа", "strength"),
+    (2, "squat", "Присед", "strength"),
+    (3, "deadlift", "Становая тяга", "strength"),
+    (4, "biceps_curl", "Сгибания на бицепс", "strength"),
+    (5, "treadmill", "Беговая дорожка", "cardio"),
+    (6, "bike", "Велотренажёр", "cardio"),
+]
+
+
+async def _report(sets, since):
+    """
+    sets: (workout_id, created_at, weight, reps) жима лежа или
+    (workout_id, created_at, exercise_id, {поля WorkoutItem}) — пользователя 1; отчёт с окном since.
+    """
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(User(id=1, tg_id=1))
+        for ex_id, slug, name, ex_type in EXERCISES:
+            session.add(Exercise(id=ex_id, slug=slug, name=name, type=ex_type))
+        for w_id in sorted({s[0] for s in sets}):
+            started = min(s[1] for s in sets if s[0] == w_id)
+            session.add(Workout(id=w_id, user_id=1, title="t", created_at=started))
+        await session.flush()
+        for w_id, ts, *rest in sets:
+            if isinstance(rest[-1], dict):
+                ex_id, fields = rest
+            else:
+                ex_id, fields = 1, {"weight": rest[0], "reps": rest[1]}
+            await log_item(session, WorkoutItem(workout_id=w_id, exercise_id=ex_id, created_at=ts, **fields))
+        await session.commit()
+        report = await _aggregate(session, 1, since)
+    await engine.dispose()
+    return report
+
+
+def test_since_for_is_whole_days(monkeypatch):
+    monkeypatch.setattr(reports, "_now_utc", lambda: NOW)
+    assert _since_for("weekly") == datetime(2026, 10, 12)
+    assert _since_for("monthly") == datetime(2026, 9, 19)
+    assert _since_for("alltime") is None
+
+
+def test_window_boundary_is_the_same_for_totals_and_last_workout():
+    since = NOW - timedelta(days=7)                      # 11.10 12:00, не полночь
+    # за 30 минут до since, но в тот же день — в окне: и в итогах, и «последняя тренировка»
+    report = asyncio.run(_report([(1, since - timedelta(minutes=30), 100.0, 5)], since))
+    assert (report.workouts_count, report.tonnage) == (1, 500.0)
+    assert report.last.in_period and report.last.tonnage == 500.0
+    assert "(вне периода)" not in _render("weekly", report)
+    assert "Итоги за 7 дней (с 11.10)" in _render("weekly", report)
+
+    # накануне начала окна — вне окна везде
+    report = asyncio.run(_report([(1, datetime(2026, 10, 10, 23, 59), 100.0, 5)], since))
+    assert (report.workouts_count, report.tonnage) == (0, 0.0)
+    assert not report.last.in_period
+    assert "Последняя тренировка (вне периода)" in _render("weekly", report)
+
+
+def _lift(ex_id, weight, reps):
+    return ex_id, {"weight": weight, "reps": reps}
+
+
+def _run(ex_id, sec, meters):
+    return ex_id, {"duration_sec": sec, "distance_m": meters}
+
+
+KNOWN = [
+    # до окна: планки 1ПМ жима (116.7) и приседа (154)
+    (1, datetime(2026, 10, 1, 10, 0), *_lift(1, 100.0, 5)),
+    (1, datetime(2026, 10, 1, 10, 5), *_lift(2, 140.0, 3)),
+    # в окне
+    (2, datetime(2026, 10, 12, 10, 0), *_lift(1, 100.0, 5)),
+    (2, datetime(2026, 10, 12, 10, 5), *_lift(1, 100.0, 6)),    # 1ПМ 120 — рекорд
+    (2, datetime(2026, 10, 12, 10, 10), *_lift(2, 120.0, 5)),   # 140 < 154
+    (2, datetime(2026, 10, 12, 10, 15), *_lift(3, 150.0, 2)),   # 160, раньше не делал — не рекорд
+    *[(3, datetime(2026, 10, 15, 9, n), *_lift(4, 20.0, 10)) for n in range(4)],
+    (3, datetime(2026, 10, 15, 9, 10), *_run(5, 1200, 3000.0)),
+    (3, datetime(2026, 10, 15, 9, 30), *_run(6, 1800, 10000.0)),
+    (3, datetime(2026, 10, 15, 10, 0), *_run(5, 600, 1500.0)),
+]
+
+
+def test_report_for_known_data():
+    report = asyncio.run(_report(KNOWN, NOW - timedelta(days=7)))
+    assert report.workouts_count == 2
+    assert report.tonnage == 2800.0
+    assert (report.cardio_min, report.cardio_km) == (60.0, 14.5)
+    # по подходам, при равенстве — по тоннажу
+    assert report.top_strength == [
+        ("Сгибания на бицепс", 4, 800.0),
+        ("Жим лежа", 2, 1100.0),
+        ("Присед", 1, 600.0),
+    ]
+    # по времени, при равенстве — по дистанции
+    assert report.top_cardio == [("Велотренажёр", 1800, 10000.0), ("Беговая дорожка", 1800, 4500.0)]
+    assert [(name, round(best, 1), record) for name, best, record in report.top_e1rm] == [
+        ("Становая тяга", 160.0, False),
+        ("Присед", 140.0, False),
+        ("Жим лежа", 120.0, True),
+    ]
+    last = report.last
+    assert (last.created_at, last.in_period) == (datetime(2026, 10, 15, 9, 0), True)   # начало тренировки
+    assert (last.sets_count, last.tonnage, last.cardio_min, last.cardio_km) == (7, 800.0, 60, 4.5 + 10.0)
+    text = _render("weekly", report)
+    assert "1) 160.0 кг — Становая тяга\n" in text
+    assert "3) 120.0 кг — Жим лежа 🆕 рекорд" in text
+
+
+def test_alltime_report_reads_personal_records():
+    report = asyncio.run(_report(KNOWN, None))
+    assert report.since is None
+    assert report.workouts_count == 3
+    assert report.tonnage == 2800.0 + 500.0 + 420.0
+    # за всё время — лучшие из PersonalRecord, планки «до периода» нет
+    assert [(name, round(best, 1), record) for name, best, record in report.top_e1rm] == [
+        ("Становая тяга", 160.0, False),
+        ("Присед", 154.0, False),
+        ("Жим лежа", 120.0, False),
+    ]
+    assert report.last.in_period
@@ -0,0 +1,66 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import DailyStats, Exercise, User, Workout, WorkoutItem
+from rollups import apply_item, rebuild_daily_stats
+
+START = datetime(2026, 10, 1, 20, 0)
+
+
+def _snapshot(rows):
+    return sorted(
+        tuple(round(v, 6) if isinstance(v, float) else v for v in r.model_dump().values())
+        for r in rows
+    )
+
+
+async def _incremental_vs_rebuild(seed):
+    rnd = random.Random(seed)
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(Exercise(id=1, slug="bench_press", name="Жим лежа"))
+        session.add(Exercise(id=2, slug="squat", name="Присед"))
+        session.add(Exercise(id=3, slug="treadmill", name="Беговая дорожка", type="cardio"))
+        ts, w_id = START, 0
+        for user_id in (1, 2):
+            session.add(User(id=user_id, tg_id=user_id))
+            for _ in range(8):
+                w_id += 1
+                ts += timedelta(days=rnd.randint(0, 2), hours=1)
+                session.add(Workout(id=w_id, user_id=user_id, title="t", created_at=ts))
+                await session.flush()
+                # вечерние тренировки переходят через полночь — подходы одной тренировки в разных днях
+                for _ in range(rnd.randint(1, 10)):
+                    ts += timedelta(minutes=17)
+                    ex_id = rnd.randint(1, 3)
+                    if ex_id == 3:
+                        fields = {"duration_sec": rnd.choice([None, 600, 1500]), "distance_m": rnd.choice([None, 2500.0])}
+                    else:
+                        fields = {"weight": rnd.choice([None, 0.0, 60.0, 82.5]), "reps": rnd.choice([None, 1, 5, 12, 20])}
+                    item = WorkoutItem(workout_id=w_id, exercise_id=ex_id, created_at=ts, **fields)
+                    session.add(item)
+                    await session.flush()
+                    await apply_item(session, user_id, item)
+        await session.commit()
+        incremental = _snapshot((await session.exec(select(DailyStats))).all())
+
+        await rebuild_daily_stats(session)
+        await session.commit()
+        session.expire_all()
+        rebuilt = _snapshot((await session.exec(select(DailyStats))).all())
+    await engine.dispose()
+    return incremental, rebuilt
+
+
+def test_incremental_daily_stats_match_rebuild():
+    for seed in (1, 2, 3):
+        incremental, rebuilt = asyncio.run(_incremental_vs_rebuild(seed))
+        assert incremental
+        assert incremental == rebuilt
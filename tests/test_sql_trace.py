@@ -0,0 +1,31 @@
+import asyncio
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import sql_trace
+from db import MuscleGroup
+
+
+async def _scenario():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add_all([MuscleGroup(slug=f"g{i}", name=f"G{i}") for i in range(3)])
+        await session.commit()
+        with sql_trace.capture("test") as trace:
+            await session.exec(select(MuscleGroup))
+            await session.exec(select(MuscleGroup).where(MuscleGroup.slug == "nope"))
+            await session.exec(update(MuscleGroup).where(MuscleGroup.slug != "g0").values(name="x"))
+        await session.rollback()
+    await engine.dispose()
+    return trace
+
+
+def test_rows_counted_for_selects_and_updates():
+    trace = asyncio.run(_scenario())
+    rows = [s["rows"] for s in trace.as_dict()["statements"] if not s["sql"].startswith(("BEGIN", "ROLLBACK"))]
+    assert rows == [3, 0, 2]
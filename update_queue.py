@@ -0,0 +1,130 @@
+# update_queue.py — приём апдейтов вебхука без ожидания хэндлеров
+#
+# Вебхук только валидирует апдейт и кладёт его в очередь, ответ Telegram — сразу.
+# Обрабатывают пул воркеров; апдейты одного чата всегда попадают к одному воркеру
+# (шард = chat_id % workers), поэтому переходы FSM внутри чата идут строго по очереди.
+#
+# Ограничения:
+#   - порядок — только внутри процесса: при нескольких процессах uvicorn апдейты одного чата
+#     должны приходить в один процесс (см. README, «Несколько воркеров»);
+#   - шард обрабатывает апдейты по одному, медленный апдейт задерживает все чаты своего шарда
+#     (head-of-line blocking) — смотрим max_shard_depth / wait_sec.max в stats().
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class LatencyStat:
+    """Счётчик + сумма + максимум (секунды) — среднее считается на стороне метрик."""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "sum": round(self.total, 6), "avg": round(avg, 6), "max": round(self.max, 6)}
+
+
+def _chat_key(update: Update) -> int:
+    """Чат апдейта (для колбэков — чат сообщения с кнопкой), иначе пользователь, иначе update_id."""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else update.update_id
+
+
+class UpdateQueue:
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int, maxsize: int) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.workers = max(1, int(workers))
+        # общий лимит делим между шардами
+        per_shard = max(1, int(maxsize) // self.workers)
+        self._queues: list[asyncio.Queue[tuple[float, Update]]] = [
+            asyncio.Queue(maxsize=per_shard) for _ in range(self.workers)
+        ]
+        self._tasks: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.in_flight = 0             # апдейты, которые воркеры обрабатывают прямо сейчас
+        self.wait = LatencyStat()      # от приёма до начала обработки
+        self.handle = LatencyStat()    # сама обработка (feed_update)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    def put(self, update: Update) -> bool:
+        """False — шард переполнен: вебхук ответит 503, Telegram повторит доставку позже."""
+        queue = self._queues[_chat_key(update) % self.workers]
+        try:
+            queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            enqueued_at, update = await queue.get()
+            started = time.perf_counter()
+            self.wait.observe(started - enqueued_at)
+            self.in_flight += 1
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                self.failed += 1
+                log.exception("Update %s failed", update.update_id)
+            finally:
+                self.in_flight -= 1
+                self.handle.observe(time.perf_counter() - started)
+                queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "depth": self.depth,
+            "in_flight": self.in_flight,
+            "max_shard_depth": max(q.qsize() for q in self._queues),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "wait_sec": self.wait.as_dict(),
+            "handle_sec": self.handle.as_dict(),
+        }
+
+    async def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Дожидаемся уже принятых апдейтов (не дольше timeout), потом гасим воркеры."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Update queue stopped with %d pending updates", self.depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,104 @@
+# user_context.py — пользователь и его текущая тренировка, один раз на апдейт (с кэшем)
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import Iterable, Optional
+
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import TTLCache
+from config import settings
+from db import User, Workout, after_commit
+
+
+@dataclass(frozen=True)
+class UserContext:
+    """Снимок пользователя (без ORM-объекта) + id его открытой тренировки (None — открытой нет)."""
+    user_id: int
+    tg_id: int
+    goal: Optional[str] = None
+    gender: Optional[str] = None
+    age: Optional[int] = None
+    height_cm: Optional[int] = None
+    weight_kg: Optional[float] = None
+    workout_id: Optional[int] = None
+
+    @property
+    def profile_complete(self) -> bool:
+        return all([self.gender, self.weight_kg, self.height_cm, self.age])
+
+
+# tg_id -> UserContext. Отсутствующих пользователей не кэшируем: /start создаёт их сразу.
+_cache: TTLCache[int, UserContext] = TTLCache(
+    maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl
+)
+
+
+async def load_user_context(session: AsyncSession, tg_id: int) -> Optional[UserContext]:
+    """Из кэша, иначе одним запросом: User + id последней открытой тренировки."""
+    ctx = _cache.get(tg_id)
+    if ctx is not None:
+        return ctx
+
+    last_workout = (
+        select(Workout.id)
+        .where(Workout.user_id == User.id, Workout.finished_at.is_(None))
+        .order_by(Workout.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = (await session.exec(select(User, last_workout).where(User.tg_id == tg_id))).first()
+    if row is None:
+        return None
+    user, workout_id = row
+    ctx = UserContext(
+        user_id=user.id,
+        tg_id=user.tg_id,
+        goal=user.goal,
+        gender=user.gender,
+        age=user.age,
+        height_cm=user.height_cm,
+        weight_kg=user.weight_kg,
+        workout_id=workout_id,
+    )
+    _cache.set(tg_id, ctx)
+    return ctx
+
+
+async def reload_user_context(session: AsyncSession, tg_id: int) -> Optional[UserContext]:
+    """Мимо кэша: снимок мог устареть, если апдейт пользователя обработал другой воркер."""
+    invalidate_user(tg_id)
+    return await load_user_context(session, tg_id)
+
+
+def set_active_workout(session: AsyncSession, ctx: UserContext, workout_id: Optional[int]) -> UserContext:
+    """
+    Новая/закрытая тренировка: снимок в кэше обновляем без похода в БД, но только после коммита
+    апдейта (db.after_commit) — при откате в кэше не останется id несохранённой тренировки.
+    """
+    ctx = replace(ctx, workout_id=workout_id)
+    after_commit(session, lambda: _cache.set(ctx.tg_id, ctx))
+    return ctx
+
+
+async def update_profile(session: AsyncSession, ctx: UserContext, **fields) -> UserContext:
+    """UPDATE полей профиля по user_id (без SELECT) и сброс кэша; возвращает обновлённый снимок."""
+    await session.exec(update(User).where(User.id == ctx.user_id).values(**fields))
+    invalidate_user(ctx.tg_id)
+    return replace(ctx, **fields)
+
+
+def invalidate_user(tg_id: int) -> None:
+    _cache.pop(tg_id)
+
+
+def forget_workouts(workout_ids: Iterable[int]) -> None:
+    """Тренировки закрыты фоном — сбрасываем снимки, где они числятся открытыми."""
+    closed = set(workout_ids)
+    if not closed:
+        return
+    for tg_id, ctx in _cache.items():
+        if ctx.workout_id in closed:
+            _cache.pop(tg_id)
@@ -0,0 +1,37 @@
+# workout_log.py — единая точка записи подхода: вставка WorkoutItem + всё, что от неё зависит
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import User, Workout, WorkoutItem
+from last_set import remember_last_set
+from records import apply_item as apply_records
+from report_cache import invalidate_reports
+from rollups import apply_item
+from user_context import UserContext
+
+
+async def log_item(session: AsyncSession, item: WorkoutItem, user_ctx: Optional[UserContext] = None) -> list[int]:
+    """
+    Добавляем подход и в той же транзакции обновляем производные данные (суточный свод,
+    личные рекорды), сбрасываем кэш отчётов и запоминаем последний подход (после коммита). Возвращаем побитые
+    рекорды (records.WEIGHT, …).
+    Пользователь обычно уже есть в UserContext; если нет — берём по тренировке.
+    """
+    if user_ctx is not None:
+        user_id, tg_id = user_ctx.user_id, user_ctx.tg_id
+    else:
+        user_id, tg_id = (await session.exec(
+            select(User.id, User.tg_id)
+            .join(Workout, Workout.user_id == User.id)
+            .where(Workout.id == item.workout_id)
+        )).one()
+    session.add(item)
+    await apply_item(session, user_id, item)
+    records = await apply_records(session, user_id, item)
+    remember_last_set(session, user_id, item)
+    invalidate_reports(tg_id)
+    return records